@@ -1,5 +1,8 @@
+import sys
+
 from lstm.run_lstm_with_bmi_v2 import execute
 
 # TODO: maybe add something for running tests also
 if __name__ == '__main__':
-    execute()
+    # "--block" runs each chunk of forcings with one update_block() call, instead of update() per time step
+    execute(block='--block' in sys.argv[1:])
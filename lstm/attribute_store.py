@@ -0,0 +1,168 @@
+"""Static attributes of many basins in one memory-mapped file.
+
+The store is a float64 array of shape (n_basins, n_attributes), saved as a ".npy"
+file, with the basin ids (CAMELS gauge ids, as 8-character zero-padded strings)
+in a ".ids.npy" file and the attribute names in a ".names.npy" file next to it.
+It is made once from the CAMELS attribute files (only the numeric attributes):
+
+    python -m lstm.attribute_store camels_attributes.npy --camels-dir ./data/camels_attributes_v2.0
+
+With 'attribute_store_file' in the BMI configuration, initialize() takes each
+static attribute of the trained model that is not in the configuration from the
+row of its 'basin_id' in the store, 'area_sqkm' from its AREA_ATTRIBUTE, and
+'lat' and 'lon' from its LOCATION_ATTRIBUTES (if the store has them).
+The store is memory-mapped and opened once per process.
+"""
+
+import argparse
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+CAMELS_DIR = './data/camels_attributes_v2.0'
+CAMELS_FILES = ['clim', 'geol', 'hydro', 'name', 'soil', 'topo', 'vege']
+
+# CAMELS attribute used for the catchment area (km2) that converts runoff to streamflow
+AREA_ATTRIBUTE = 'area_geospa_fabric'
+
+# CAMELS attributes used for the 'lat' and 'lon' of each catchment (the nodes of a 'points' grid)
+LOCATION_ATTRIBUTES = {'lat': 'gauge_lat', 'lon': 'gauge_lon'}
+
+
+#------------------------------------------------------------
+def basin_key(basin_id):
+    """The id of a basin as in the store (gauge ids are zero-padded to 8 characters)."""
+    return str(basin_id).strip().zfill(8)
+
+
+#------------------------------------------------------------
+def ids_file(store_file):
+    """The file with the basin ids of a store."""
+    return Path(store_file).with_suffix('.ids.npy')
+
+
+#------------------------------------------------------------
+def names_file(store_file):
+    """The file with the attribute names of a store."""
+    return Path(store_file).with_suffix('.names.npy')
+
+
+#------------------------------------------------------------
+def read_camels_attributes(camels_dir=CAMELS_DIR, numeric_only=False):
+    """All the CAMELS attributes, in one table indexed by the zero-padded gauge id."""
+    tables = []
+    for attribute_type in CAMELS_FILES:
+        table = pd.read_csv(Path(camels_dir) / 'camels_{}.txt'.format(attribute_type), sep=';',
+                            dtype={'gauge_id': str})
+        tables.append(table.set_index(table['gauge_id'].map(basin_key)).drop(columns='gauge_id'))
+    table = pd.concat(tables, axis=1)
+    if numeric_only:
+        table = table.select_dtypes(include='number')
+    return table
+
+
+#------------------------------------------------------------
+def write_attribute_store(store_file, table):
+    """
+    Write a store of static attributes.
+
+    Parameters
+    ----------
+    store_file : str or Path
+        The ".npy" file to write.
+    table : pd.DataFrame
+        Numeric attributes, one row per basin, indexed by basin id.
+    """
+    np.save(store_file, table.to_numpy(dtype='float64'))
+    np.save(ids_file(store_file), np.array([basin_key(x) for x in table.index], dtype=str))
+    np.save(names_file(store_file), np.array(table.columns, dtype=str))
+
+
+#--------------------------------------------------------------------------------------------------
+class AttributeStore():
+    def __init__(self, store_file):
+        """
+        Open a store of static attributes (memory-mapped, read-only).
+
+        Parameters
+        ----------
+        store_file : str or Path
+            The ".npy" file written by write_attribute_store().
+        """
+        self.store_file = Path(store_file)
+        self.values = np.load(self.store_file, mmap_mode='r')
+        ids = np.load(ids_file(self.store_file), allow_pickle=False)
+        names = np.load(names_file(self.store_file), allow_pickle=False)
+        if self.values.shape != (len(ids), len(names)):
+            raise ValueError("{} is not a store of static attributes (shape {})".format(store_file, self.values.shape))
+        self.index = {str(x): k for k, x in enumerate(ids)}
+        self.names = [str(x) for x in names]
+        self.column = {name: k for k, name in enumerate(self.names)}
+        self.mtime_ns = os.stat(self.store_file).st_mtime_ns
+
+    #------------------------------------------------------------
+    def get(self, basin_id, names=None):
+        """
+        Static attributes of one basin.
+
+        Parameters
+        ----------
+        basin_id : str or int
+            Basin (gauge) id, with or without the leading zeros.
+        names : list, optional
+            Attributes to get (by default, all of them).
+
+        Returns
+        -------
+        dict
+            Value of each attribute, by name.
+        """
+        k = self.index.get(basin_key(basin_id))
+        if k is None:
+            raise KeyError("No static attributes for basin '{}' in {}".format(basin_id, self.store_file))
+        names = self.names if names is None else names
+        missing = [name for name in names if name not in self.column]
+        if missing:
+            raise KeyError("No attributes {} in {}".format(missing, self.store_file))
+        row = self.values[k]
+        return {name: float(row[self.column[name]]) for name in names}
+
+    #------------------------------------------------------------
+    def __contains__(self, basin_id):
+        return basin_key(basin_id) in self.index
+
+    #------------------------------------------------------------
+    def __len__(self):
+        return self.values.shape[0]
+
+
+# Stores opened in this process, by file
+_open_stores = {}
+
+
+#------------------------------------------------------------
+def open_attribute_store(store_file):
+    """Open a store, or reuse the one already open in this process (unless the file changed)."""
+    key = str(Path(store_file).resolve())
+    store = _open_stores.get(key)
+    if store is None or store.mtime_ns != os.stat(key).st_mtime_ns:
+        store = _open_stores[key] = AttributeStore(key)
+    return store
+
+
+#------------------------------------------------------------
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Make a store of static attributes from the CAMELS attribute files.")
+    parser.add_argument('store_file', help="store (.npy) file to write")
+    parser.add_argument('--camels-dir', default=CAMELS_DIR, help="directory of the CAMELS attribute files")
+    args = parser.parse_args(args)
+
+    table = read_camels_attributes(args.camels_dir, numeric_only=True)
+    write_attribute_store(args.store_file, table)
+    print('Wrote', args.store_file, 'with', table.shape[1], 'attributes for', table.shape[0], 'basins')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,318 @@
+# Basic utilities
+import numpy as np
+# LSTM here is based on PyTorch
+import torch
+
+#--------------------------------------------------------------------------------------------------
+# Batched inference engine for many catchments that share one trained LSTM.
+#
+# Instead of one bmi_LSTM (and one nn.LSTM call) per catchment per time step, the hidden and cell
+# states of all N catchments are held as single (1, N, hidden) tensors and advanced together with
+# one forward call.  Catchments are added and removed by their row index.
+#--------------------------------------------------------------------------------------------------
+class Nextgen_BatchedLSTM():
+
+    def __init__(self, lstm_model, all_lstm_inputs, dynamic_inputs, input_mean, input_std,
+                 out_mean, out_std, target_variable):
+        """
+        Create an empty batch (no catchments) around a trained LSTM.
+
+        Parameters
+        ----------
+        lstm_model : Nextgen_CudaLSTM
+            LSTM with the trained weights already loaded.  Only used read-only.
+        all_lstm_inputs : list
+            Short names of all the LSTM inputs, in the order the LSTM expects them.
+        dynamic_inputs : list
+            Short names of the inputs that change every time step (the forcings).
+        input_mean, input_std : np.ndarray
+            Training set scalers for the inputs, in ``all_lstm_inputs`` order.
+        out_mean, out_std : float
+            Training set scalers for the LSTM output.
+        target_variable : str
+            Name of the variable the LSTM was trained to predict.
+        """
+        self.lstm = lstm_model
+        self.all_lstm_inputs = list(all_lstm_inputs)
+        self.dynamic_inputs = list(dynamic_inputs)
+        self.static_inputs = [x for x in self.all_lstm_inputs if x not in self.dynamic_inputs]
+        self.input_mean = np.asarray(input_mean, dtype='float64')
+        self.input_std = np.asarray(input_std, dtype='float64')
+        self.out_mean = out_mean
+        self.out_std = out_std
+        self.target_variable = target_variable
+
+        self.input_size = len(self.all_lstm_inputs)
+        self.hidden_layer_size = self.lstm.hidden_layer_size
+        self._input_index = {name: k for k, name in enumerate(self.all_lstm_inputs)}
+
+        # One row per catchment
+        self.inputs = np.zeros((0, self.input_size), dtype='float64')
+        self.output_factor_cms = np.zeros(0, dtype='float64')
+        self.h_t = torch.zeros(1, 0, self.hidden_layer_size).float()
+        self.c_t = torch.zeros(1, 0, self.hidden_layer_size).float()
+
+        # Outputs of the most recent update, one element per catchment
+        self.surface_runoff_mm = np.zeros(0, dtype='float64')
+        self.streamflow_cms = np.zeros(0, dtype='float64')
+
+        self.t = 0
+
+    #------------------------------------------------------------
+    @classmethod
+    def from_bmi(cls, model):
+        """
+        Create an empty batch that uses the trained LSTM of an initialized bmi_LSTM.
+
+        Parameters
+        ----------
+        model : bmi_LSTM
+            An initialized model.  Its weights and scalers are shared, not copied.
+
+        Returns
+        -------
+        Nextgen_BatchedLSTM
+        """
+        return cls(lstm_model=model.lstm,
+                   all_lstm_inputs=model.all_lstm_inputs,
+                   dynamic_inputs=model.cfg_train['dynamic_inputs'],
+                   input_mean=model.input_mean,
+                   input_std=model.input_std,
+                   out_mean=model.out_mean,
+                   out_std=model.out_std,
+                   target_variable=model.cfg_train['target_variables'][0])
+
+    #------------------------------------------------------------
+    @property
+    def n_catchments(self):
+        return self.inputs.shape[0]
+
+    #------------------------------------------------------------
+    def add_catchment(self, static_attributes, area_sqkm, h_t=None, c_t=None):
+        """
+        Append a catchment to the batch.
+
+        Parameters
+        ----------
+        static_attributes : dict
+            Value for each of the static inputs of the LSTM, by short name.
+        area_sqkm : float
+            Catchment area, used to convert the runoff depth to a volume flux.
+        h_t, c_t : torch.Tensor, optional
+            Initial hidden and cell states (any shape with ``hidden_layer_size`` elements).
+            Zero if not given.
+
+        Returns
+        -------
+        int
+            Index of the new catchment in the batch.
+        """
+        row = np.zeros((1, self.input_size), dtype='float64')
+        for name in self.static_inputs:
+            row[0, self._input_index[name]] = static_attributes[name]
+
+        h_new = torch.zeros(1, 1, self.hidden_layer_size).float()
+        c_new = torch.zeros(1, 1, self.hidden_layer_size).float()
+        if h_t is not None:
+            h_new[:] = h_t.reshape(1, 1, -1)
+        if c_t is not None:
+            c_new[:] = c_t.reshape(1, 1, -1)
+
+        #                       mm->m      km2 -> m2           hour->s
+        factor = (1/1000) * (area_sqkm * 1000*1000) * (1/3600)
+
+        self.inputs = np.concatenate([self.inputs, row])
+        self.output_factor_cms = np.append(self.output_factor_cms, factor)
+        self.h_t = torch.cat([self.h_t, h_new], dim=1)
+        self.c_t = torch.cat([self.c_t, c_new], dim=1)
+        self.surface_runoff_mm = np.append(self.surface_runoff_mm, 0.0)
+        self.streamflow_cms = np.append(self.streamflow_cms, 0.0)
+        return self.n_catchments - 1
+
+    #------------------------------------------------------------
+    def add_bmi_catchment(self, model):
+        """
+        Append the catchment of an initialized bmi_LSTM, including its current states.
+
+        Parameters
+        ----------
+        model : bmi_LSTM
+            An initialized model that uses the same trained LSTM as this batch.
+
+        Returns
+        -------
+        int
+            Index of the new catchment in the batch.
+        """
+        static_attributes = {name: model.cfg_bmi[name] for name in self.static_inputs}
+        return self.add_catchment(static_attributes, model.cfg_bmi['area_sqkm'],
+                                  h_t=model.h_t, c_t=model.c_t)
+
+    #------------------------------------------------------------
+    def add_bmi_catchments(self, models):
+        """
+        Append the catchments of many initialized bmi_LSTM models, including their current states.
+
+        As add_bmi_catchment(), but the arrays of the batch are concatenated once
+        for all the models rather than once per catchment.
+
+        Parameters
+        ----------
+        models : list
+            Initialized models that use the same trained LSTM as this batch.
+
+        Returns
+        -------
+        range
+            Indices of the new catchments in the batch.
+        """
+        start = self.n_catchments
+        if not models:
+            return range(start, start)
+
+        rows = np.zeros((len(models), self.input_size), dtype='float64')
+        for k, model in enumerate(models):
+            for name in self.static_inputs:
+                rows[k, self._input_index[name]] = model.cfg_bmi[name]
+        area_sqkm = np.array([model.cfg_bmi['area_sqkm'] for model in models], dtype='float64')
+
+        #                       mm->m      km2 -> m2           hour->s
+        factor = (1/1000) * (area_sqkm * 1000*1000) * (1/3600)
+
+        self.inputs = np.concatenate([self.inputs, rows])
+        self.output_factor_cms = np.concatenate([self.output_factor_cms, factor])
+        self.h_t = torch.cat([self.h_t] + [model.h_t.reshape(1, 1, -1).float() for model in models], dim=1)
+        self.c_t = torch.cat([self.c_t] + [model.c_t.reshape(1, 1, -1).float() for model in models], dim=1)
+        self.surface_runoff_mm = np.concatenate([self.surface_runoff_mm, np.zeros(len(models))])
+        self.streamflow_cms = np.concatenate([self.streamflow_cms, np.zeros(len(models))])
+        return range(start, self.n_catchments)
+
+    #------------------------------------------------------------
+    def remove_catchment(self, index):
+        """
+        Remove a catchment from the batch.
+
+        Catchments after ``index`` move down by one, so their indices decrease by one.
+
+        Parameters
+        ----------
+        index : int
+            Index of the catchment to remove.
+        """
+        if not (0 <= index < self.n_catchments):
+            raise IndexError("catchment index {} out of range for batch of {}".format(index, self.n_catchments))
+        keep = [k for k in range(self.n_catchments) if k != index]
+        self.inputs = np.delete(self.inputs, index, axis=0)
+        self.output_factor_cms = np.delete(self.output_factor_cms, index)
+        self.surface_runoff_mm = np.delete(self.surface_runoff_mm, index)
+        self.streamflow_cms = np.delete(self.streamflow_cms, index)
+        self.h_t = self.h_t[:, keep, :]
+        self.c_t = self.c_t[:, keep, :]
+
+    #------------------------------------------------------------
+    def set_forcing(self, name, values):
+        """
+        Set the value of one dynamic input for every catchment.
+
+        Parameters
+        ----------
+        name : str
+            Short name of the input (e.g. ``total_precipitation``).
+        values : array_like
+            One value per catchment, or a single value for all of them.
+        """
+        self.inputs[:, self._input_index[name]] = values
+
+    #------------------------------------------------------------
+    def set_forcings(self, forcings):
+        """
+        Set all the dynamic inputs for every catchment at once.
+
+        Parameters
+        ----------
+        forcings : np.ndarray
+            Array of shape (n_catchments, n_dynamic) with columns in ``dynamic_inputs`` order.
+        """
+        for k, name in enumerate(self.dynamic_inputs):
+            self.inputs[:, self._input_index[name]] = forcings[:, k]
+
+    #------------------------------------------------------------
+    def update(self):
+        """
+        Advance every catchment in the batch by one time step.
+
+        Returns
+        -------
+        np.ndarray
+            Streamflow (m3 s-1) for each catchment (empty if the batch has none).
+        """
+        # The LSTM cannot be called on a batch of zero catchments
+        if self.n_catchments == 0:
+            self.t += 1
+            return self.streamflow_cms
+
+        with torch.no_grad():
+            input_array_scaled = (self.inputs - self.input_mean) / self.input_std
+            input_tensor = torch.from_numpy(input_array_scaled)
+
+            lstm_output, self.h_t, self.c_t = self.lstm.forward(input_tensor, self.h_t, self.c_t)
+
+            self.scale_output(lstm_output[0, :, 0].numpy())
+            self.t += 1
+
+        return self.streamflow_cms
+
+    #------------------------------------------------------------
+    def update_sequence(self, forcings):
+        """
+        Advance every catchment in the batch by many time steps, with one forward call.
+
+        Afterwards the forcings, outputs and states are as after the last of the time steps.
+
+        Parameters
+        ----------
+        forcings : np.ndarray
+            Array of shape (n_steps, n_catchments, n_dynamic) with the last axis in
+            ``dynamic_inputs`` order.
+
+        Returns
+        -------
+        np.ndarray
+            Streamflow (m3 s-1) of shape (n_steps, n_catchments) (empty if the batch has none).
+        """
+        n_steps = forcings.shape[0]
+        # The LSTM cannot be called on a batch of zero catchments
+        if self.n_catchments == 0:
+            self.t += n_steps
+            return np.empty((n_steps, 0), dtype='float64')
+
+        inputs = np.repeat(self.inputs[np.newaxis], n_steps, axis=0)
+        inputs[:, :, [self._input_index[name] for name in self.dynamic_inputs]] = forcings
+
+        with torch.no_grad():
+            input_array_scaled = (inputs - self.input_mean) / self.input_std
+            input_tensor = torch.from_numpy(input_array_scaled)
+
+            lstm_output, self.h_t, self.c_t = self.lstm.forward(input_tensor, self.h_t, self.c_t)
+
+            self.scale_output(lstm_output[:, :, 0].numpy())
+            self.t += n_steps
+
+        streamflow_cms = self.streamflow_cms
+        self.inputs[:] = inputs[-1]
+        self.surface_runoff_mm = self.surface_runoff_mm[-1]
+        self.streamflow_cms = streamflow_cms[-1]
+        return streamflow_cms
+
+    #------------------------------------------------------------
+    def scale_output(self, lstm_output):
+
+        if self.target_variable == 'qobs_mm_per_hour':
+            surface_runoff_mm = lstm_output * self.out_std + self.out_mean
+
+        elif self.target_variable == 'QObs(mm/d)':
+            surface_runoff_mm = (lstm_output * self.out_std + self.out_mean) * (1/24)
+
+        # Bound the runoff to zero, as negative values are illogical
+        self.surface_runoff_mm = np.maximum(surface_runoff_mm, 0.0)
+        self.streamflow_cms = self.surface_runoff_mm * self.output_factor_cms
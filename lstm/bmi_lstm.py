@@ -1,5 +1,6 @@
 # Need these for BMI
 from bmipy import Bmi
+import os
 import time
 # Import data_tools
 # Basic utilities
@@ -15,6 +16,26 @@ import torch
 # Here is the LSTM model we want to run
 # import nextgen_cuda_lstm
 import lstm.nextgen_cuda_lstm as nextgen_cuda_lstm   # (SDP)
+# Same LSTM in plain NumPy, selected with the 'backend' option
+import lstm.numpy_lstm as numpy_lstm
+# Trained models shared by all instances in this process
+import lstm.model_cache as model_cache
+# Reads the compact (xarray-free) version of the training data scaler
+import lstm.convert_scaler as convert_scaler
+# Single-file, memory-mapped trained models
+import lstm.model_bundle as model_bundle
+# Inputs given in other units than the LSTM was trained with
+import lstm.unit_conversion as unit_conversion
+# Optional timing of the phases of initialize() and update()
+import lstm.timing as timing
+# Compact snapshots of the model state, for restarts
+import lstm.model_state as model_state
+# Initial states for many catchments in one memory-mapped file
+import lstm.state_store as state_store
+# Warm-up of the LSTM states, cached on disk
+import lstm.spinup as spinup
+# Static attributes of many basins, by basin id
+import lstm.attribute_store as attribute_store
 
 # These are not used (SDP)
 ### from torch import nn
@@ -28,10 +49,10 @@ import lstm.nextgen_cuda_lstm as nextgen_cuda_lstm   # (SDP)
 #       AttributeError: 'Dataset' object has no attribute '_file obj'
 #       See: https://stackoverflow.com/questions/66432884/
 #            error-using-rioxarray-in-jupyter-notebook
+#       This is not needed if the pickle has been converted to a ".npz"
+#       file with:  python -m lstm.convert_scaler <run_dir>
 #------------------------------------------------------------------------
 USE_PATH = True  # (SDP)
-if not(USE_PATH):
-    import os
 
 class bmi_LSTM(Bmi):
 
@@ -39,7 +60,7 @@ class bmi_LSTM(Bmi):
         """Create a Bmi LSTM model that is ready for initialization."""
         super(bmi_LSTM, self).__init__()
         self._name = "LSTM for Next Generation NWM"
-        self._values = {}
+        self._values = {var_name: np.zeros(1, dtype='float64') for var_name in self._var_name_units_map}
         self._var_loc = "node"
         self._var_grid_id = 0
         self._var_grid_type = "scalar"
@@ -53,6 +74,20 @@ class bmi_LSTM(Bmi):
         self.streamflow_fms = 0.0
         self.surface_runoff_mm = 0.0
 
+        # Set in initialize() from the 'fold_static_attributes' and 'backend' options
+        self.fold_static = False
+        self.backend = 'torch'
+
+        # Block of forcings given to set_forcing_block(), used by update_until()
+        self.forcing_block = None
+        self.forcing_block_index = 0
+
+        # Set in initialize() if the 'timing' option is on
+        self.timer = None
+
+        # Set in initialize(): the number of catchments, more than one with 'basin_ids'
+        self.n_catchments = 1
+
     #----------------------------------------------
     # Required, static attributes of the model
     #----------------------------------------------
@@ -78,6 +113,13 @@ class bmi_LSTM(Bmi):
     # (Next line didn't fix ngen pointer error)
     # _input_var_names = []
 
+    #---------------------------------------------
+    # Variables that ngen sets (and gets) to save
+    # and restore the model state, see get_state()
+    #---------------------------------------------
+    _serialization_var_names = {'serialization_create', 'serialization_size', 'serialization_state',
+                                'serialization_free', 'reset_time'}
+
     #---------------------------------------------
     # Output variable names (CSDMS standard names)
     #---------------------------------------------
@@ -156,75 +198,55 @@ class bmi_LSTM(Bmi):
                                'soil_depth_pelletier','soil_depth_statsgo','soil_porosity',
                                'sand_frac','silt_frac', 'gauge_lat', 'gauge_lon']
     
-    def __getattribute__(self, item):
-        """
-        Customize instance attribute access.
-
-        For those items that correspond to BMI input or output variables (which should be in numpy arrays) and have
-        values that are just a single-element array, deviate from the standard behavior and return the single array
-        element.  Fall back to the default behavior in any other case.
-
-        This supports having a BMI variable be backed by a numpy array, while also allowing the attribute to be used as
-        just a scalar, as it is in many places for this type.
-
-        Parameters
-        ----------
-        item
-            The name of the attribute item to get.
-
-        Returns
-        -------
-        The value of the named item.
-        """
-        # Have these work explicitly (or else loops)
-        if item == '_input_var_names' or item == '_output_var_names':
-            return super(bmi_LSTM, self).__getattribute__(item)
-
-        # By default, for things other than BMI variables, use normal behavior
-        if item not in super(bmi_LSTM, self).__getattribute__('_input_var_names') and item not in super(bmi_LSTM, self).__getattribute__('_output_var_names'):
-            return super(bmi_LSTM, self).__getattribute__(item)
-
-        # Return the single scalar value from any ndarray of size 1
-        value = super(bmi_LSTM, self).__getattribute__(item)
-        if isinstance(value, np.ndarray) and value.size == 1:
-            return value[0]
-        else:
-            return value
-
-    def __setattr__(self, key, value):
-        """
-        Customized instance attribute mutator functionality.
-
-        For those attribute with keys indicating they are a BMI input or output variable (which should be in numpy
-        arrays), wrap any scalar ``value`` as a one-element numpy array and use that in a nested call to the superclass
-        implementation of this function.  In any other cases, just pass the given ``key`` and ``value`` to a nested
-        call.
-
-        This supports automatically having a BMI variable be backed by a numpy array, even if it is initialized using a
-        scalar, while otherwise maintaining standard behavior.
-
-        Parameters
-        ----------
-        key
-        value
-
-        Returns
-        -------
-
-        """
-        # Have these work explicitly (or else loops)
-        if key == '_input_var_names' or key == '_output_var_names':
-            super(bmi_LSTM, self).__setattr__(key, value)
-
-        # Pass thru if value is already an array
-        if isinstance(value, np.ndarray):
-            super(bmi_LSTM, self).__setattr__(key, value)
-        # Override to put scalars into ndarray for BMI input/output variables
-        elif key in self._input_var_names or key in self._output_var_names:
-            super(bmi_LSTM, self).__setattr__(key, np.array([value]))
-        # By default, use normal behavior
+    #------------------------------------------------------------
+    # Note: Each BMI variable is backed by a float64 array in
+    #       self._values, with one element per catchment, which is
+    #       what get_value_ptr() returns.  For the LSTM inputs these
+    #       arrays are views into one contiguous buffer
+    #       (self.input_array) in the order of all_lstm_inputs, so
+    #       that set_value() writes straight into the array that
+    #       update() scales.  With more than one catchment the
+    #       buffer has one row per input, so each input is still
+    #       a contiguous view.  The short names (e.g.
+    #       self.temperature) are properties that read and write
+    #       the same arrays, see the end of this module.
+    #------------------------------------------------------------
+    def _allocate_input_buffer(self):
+        """Create the input buffer and make the input variables views into it."""
+        if self.n_catchments == 1:
+            self.input_array = np.zeros(len(self.all_lstm_inputs), dtype='float64')
         else:
-            super(bmi_LSTM, self).__setattr__(key, value)
+            self.input_array = np.zeros((len(self.all_lstm_inputs), self.n_catchments), dtype='float64')
+        self._bind_input_buffer()
+
+    def _bind_input_buffer(self):
+        # An input without a BMI variable could never be set, and would stay zero
+        unmapped = [x for x in self.all_lstm_inputs if x not in self._var_name_map_short_first]
+        if unmapped:
+            raise ValueError("The trained model takes inputs that bmi_LSTM has no variable for: {}".format(unmapped))
+        for k, short_name in enumerate(self.all_lstm_inputs):
+            long_name = self._var_name_map_short_first[short_name]
+            self.input_array[k:k+1] = self._values[long_name]
+            self._values[long_name] = self.input_array[k:k+1].reshape(-1)
+
+    def __getstate__(self):
+        # The timed versions of methods are closures, which can't be pickled
+        state = self.__dict__.copy()
+        for name in state.get('_timed_methods', {}):
+            state.pop(name, None)
+        state.pop('_timed_methods', None)
+        return state
+
+    def __setstate__(self, state):
+        """Restore a pickled model.  Pickle copies the views into the input
+        buffer as separate arrays, so they are made views again."""
+        self.__dict__.update(state)
+        if 'input_array' in state:
+            self._bind_input_buffer()
+        if 'input_array_scaled' in state:
+            self.input_tensor = torch.from_numpy(self.input_array_scaled)
+        if state.get('timer') is not None:
+            self._use_timed_methods()
 
     #------------------------------------------------------------
     #------------------------------------------------------------
@@ -237,6 +259,7 @@ class bmi_LSTM(Bmi):
         #NJF ensure this is a Path type so the follow open works as expected
         #When used with NGen, the bmi_cfg_file is just a string...
 
+        init_start = time.perf_counter()
         bmi_cfg_file = Path(bmi_cfg_file)
         # ----- Create some lookup tables from the long variable names --------#
         self._var_name_map_long_first = {long_name:self._var_name_units_map[long_name][0] for \
@@ -245,15 +268,7 @@ class bmi_LSTM(Bmi):
                                           long_name in self._var_name_units_map.keys()}
         self._var_units_map = {long_name:self._var_name_units_map[long_name][1] for \
                                           long_name in self._var_name_units_map.keys()}
-        
-        # -------------- Initalize all the variables --------------------------# 
-        # -------------- so that they'll be picked up with the get functions --#
-        for var_name in list(self._var_name_units_map.keys()):
-            # ---------- All the variables are single values ------------------#
-            # ---------- so just set to zero for now.        ------------------#
-            self._values[var_name] = 0
-            setattr( self, var_name, 0 )
-        
+
         # -------------- Read in the BMI configuration -------------------------#
         # This will direct all the next moves.
         if bmi_cfg_file is not None:
@@ -268,49 +283,66 @@ class bmi_LSTM(Bmi):
             self.cfg_bmi = self._parse_config(cfg)
         else:
             print("Error: No configuration provided, nothing to do...")
-        
-        # ------------- Load in the configuration file for the specific LSTM --#
-        # This will include all the details about how the model was trained
-        # Inputs, outputs, hyper-parameters, scalers, weights, etc. etc.
-        self.get_training_configurations()
-        self.get_scaler_values()
-        
-        # ------------- Initialize an LSTM model ------------------------------#
-        self.lstm = nextgen_cuda_lstm.Nextgen_CudaLSTM(input_size=self.input_size, 
-                                                       hidden_layer_size=self.hidden_layer_size, 
-                                                       output_size=self.output_size, 
-                                                       batch_size=1, 
-                                                       seq_length=1)
 
-        # ------------ Load in the trained weights ----------------------------#
-        # Save the default model weights. We need to make sure we have the same keys.
-        default_state_dict = self.lstm.state_dict()
+        # Gather verbosity lvl from bmi-config for stdout printing, etc.    
+        self.verbose = self.cfg_bmi['verbose']
 
-        # Trained model weights from Neuralhydrology.
-        if (USE_PATH):  # (SDP)
-            trained_model_file = self.cfg_train['run_dir'] / 'model_epoch{}.pt'.format(str(self.cfg_train['epochs']).zfill(3))
+        # ------------- One catchment, or a vector of them ('basin_ids') -----#
+        # With 'basin_ids', the grid is a set of points, one per catchment,
+        # and every variable is an array with one value per catchment.
+        if self.cfg_bmi.get('basin_ids') is not None:
+            self.n_catchments = len(self.cfg_bmi['basin_ids'])
+            self._var_grid_type = 'points'
         else:
-            str1 = self.cfg_train['run_dir'] + '/' + 'model_epoch{}.pt'
-            trained_model_file = str1.format(str(self.cfg_train['epochs']).zfill(3))
+            self.n_catchments = 1
+            self._var_grid_type = 'scalar'
 
-        ## trained_model_file = self.cfg_train['run_dir'] / 'model_epoch{}.pt'.format(str(self.cfg_train['epochs']).zfill(3))
-        trained_state_dict = torch.load(trained_model_file, map_location=torch.device('cpu'))
+        # -------------- Initalize all the variables --------------------------# 
+        # -------------- so that they'll be picked up with the get functions --#
+        for var_name in list(self._var_name_units_map.keys()):
+            # ---------- One value per catchment, -----------------------------#
+            # ---------- so just set to zero for now.        ------------------#
+            self._values[var_name] = np.zeros(self.n_catchments, dtype='float64')
 
-        # Changing the name of the head weights, since different in NH
-        trained_state_dict['head.weight'] = trained_state_dict.pop('head.net.0.weight')
-        trained_state_dict['head.bias'] = trained_state_dict.pop('head.net.0.bias')
-        trained_state_dict = {x:trained_state_dict[x] for x in default_state_dict.keys()}
+        # ------------- Optionally time the phases of initialize and update --#
+        if self.cfg_bmi.get('timing', False):
+            self.timer = timing.PhaseTimer()
+            self.timer.record('initialize.read_bmi_config', time.perf_counter() - init_start)
+            self._use_timed_methods()
+        
+        # ------------- Load in the configuration file for the specific LSTM --#
+        # This will include all the details about how the model was trained
+        # Inputs, outputs, hyper-parameters, scalers, weights, etc. etc.
+        # These are shared by all instances that use the same trained model.
+        self.load_trained_model()
+        self.batch_size = self.n_catchments
 
-        # Load in the trained weights.
-        self.lstm.load_state_dict(trained_state_dict)
+        # ------------- Accept inputs in the units given in 'input_units' ----#
+        self.set_input_units()
 
         # ------------- Initialize the values for the input to the LSTM  -----#
+        self._allocate_input_buffer()
         self.set_static_attributes()
         self.initialize_forcings()
+
+        # ------------- Optionally fold the static attributes into the bias --#
+        # The static attributes never change during a run, so their part of
+        # the LSTM input product can be computed once instead of every step.
+        # This is only done for a single catchment, as the folded bias is per catchment.
+        self.fold_static = self.cfg_bmi.get('fold_static_attributes', False) and (self.n_catchments == 1)
+
+        # ------------- Choose how the LSTM is run: 'torch' or 'numpy' -------#
+        self.backend = self.cfg_bmi.get('backend', 'torch')
+        if self.backend not in ('torch', 'numpy'):
+            raise ValueError("Unknown LSTM backend '{}' (expected 'torch' or 'numpy')".format(self.backend))
+        self.validate_backend = self.cfg_bmi.get('validate_backend', True)
+        self.fold_static_attributes()
         
         if self.cfg_bmi['initial_state'] == 'zero':
             self.h_t = torch.zeros(1, self.batch_size, self.hidden_layer_size).float()
             self.c_t = torch.zeros(1, self.batch_size, self.hidden_layer_size).float()
+        elif self.cfg_bmi['initial_state'] == 'file':
+            self.read_initial_states_from_store()
 
         # ------------- Start a simulation time  -----------------------------#
         # jmframe: Since the simulation time here doesn't really matter. 
@@ -320,24 +352,99 @@ class bmi_LSTM(Bmi):
 
         # ----------- The output is area normalized, this is needed to un-normalize it
         #                         mm->m                             km2 -> m2          hour->s    
-        self.output_factor_cms =  (1/1000) * (self.cfg_bmi['area_sqkm'] * 1000*1000) * (1/3600)
+        if self.n_catchments == 1:
+            self.output_factor_cms =  (1/1000) * (self.cfg_bmi['area_sqkm'] * 1000*1000) * (1/3600)
+        else:
+            area_sqkm = np.broadcast_to(np.asarray(self.cfg_bmi['area_sqkm'], dtype='float64'), (self.n_catchments,))
+            self.output_factor_cms =  (1/1000) * (area_sqkm * 1000*1000) * (1/3600)
 
-        # Gather verbosity lvl from bmi-config for stdout printing, etc.    
-        self.verbose = self.cfg_bmi['verbose']
+        # ------------- Optionally warm up the LSTM states --------------------#
+        if self.cfg_bmi.get('spinup_forcing_file') is not None:
+            self.spin_up()
+
+        if self.timer is not None:
+            self.timer.record('initialize', time.perf_counter() - init_start)
 
     #------------------------------------------------------------ 
     def update(self):
+        if self.backend == 'numpy':
+            self.update_numpy()
+            return
+
         with torch.no_grad():
 
             self.create_scaled_input_tensor()
 
-            self.lstm_output, self.h_t, self.c_t = self.lstm.forward(self.input_tensor, self.h_t, self.c_t)
+            self.lstm_forward()
             
             self.scale_output()
             
             #self.t += self._time_step_size
             self.t += self.get_time_step()
 
+    #------------------------------------------------------------ 
+    def update_numpy(self):
+        """Same as update(), but with the NumPy LSTM so no torch calls are made."""
+        self.create_scaled_input_array()
+
+        prediction = self.numpy_lstm_forward()
+
+        self.scale_output(prediction[0, 0].item() if self.n_catchments == 1 else prediction[:, 0])
+
+        self.t += self.get_time_step()
+
+    #------------------------------------------------------------ 
+    def lstm_forward(self):
+        """One time step of the PyTorch LSTM, from self.input_tensor."""
+        self.lstm_output, self.h_t, self.c_t = self.inference_lstm.forward(self.input_tensor, self.h_t, self.c_t)
+
+    #------------------------------------------------------------ 
+    def numpy_lstm_forward(self):
+        """One time step of the NumPy LSTM, from self.input_array_scaled.  Returns its prediction."""
+        self.numpy_input[:] = self.input_array_scaled
+
+        # The NumPy LSTM updates the states in place, through the memory they share with h_t and c_t
+        if self.h_t.dtype != torch.float32:
+            self.h_t = self.h_t.float()
+            self.c_t = self.c_t.float()
+        h_t = self.h_t.numpy().reshape(self.n_catchments, -1)
+        c_t = self.c_t.numpy().reshape(self.n_catchments, -1)
+
+        return self.numpy_lstm.forward(self.numpy_input, h_t, c_t)
+
+    #------------------------------------------------------------ 
+    def _use_timed_methods(self):
+        """Replace methods of this instance by versions that record their time."""
+        for name in getattr(self, '_timed_methods', {}):
+            self.__dict__.pop(name, None)
+        # update() is timed as a whole and by phase, through the methods it calls
+        self._timed_methods = {
+            'update':                      self.timer.wrap('update', self.update),
+            'create_scaled_input_array':   self.timer.wrap('update.scale_input', self.create_scaled_input_array),
+            'lstm_forward':                self.timer.wrap('update.lstm_forward', self.lstm_forward),
+            'numpy_lstm_forward':          self.timer.wrap('update.lstm_forward', self.numpy_lstm_forward),
+            'scale_output':                self.timer.wrap('update.scale_output', self.scale_output),
+            'update_block':                self.timer.wrap('update_block', self.update_block),
+            'get_training_configurations': self.timer.wrap('initialize.read_training_config', self.get_training_configurations),
+            'read_train_data_scaler':      self.timer.wrap('initialize.read_scaler', self.read_train_data_scaler),
+            'get_scaler_values':           self.timer.wrap('initialize.get_scaler_values', self.get_scaler_values),
+            'load_trained_weights':        self.timer.wrap('initialize.load_weights', self.load_trained_weights),
+            'load_model_bundle':           self.timer.wrap('initialize.load_model_bundle', self.load_model_bundle),
+            'set_static_attributes':       self.timer.wrap('initialize.set_static_attributes', self.set_static_attributes),
+            'fold_static_attributes':      self.timer.wrap('setup_lstm', self.fold_static_attributes),
+            'spin_up':                     self.timer.wrap('initialize.spin_up', self.spin_up)}
+        self.__dict__.update(self._timed_methods)
+
+    #------------------------------------------------------------ 
+    def get_timing_stats(self):
+        """Timings of the phases of initialize() and update(), see lstm.timing.PhaseTimer.stats().
+
+        Empty unless the BMI configuration has 'timing: True'.
+        """
+        if self.timer is None:
+            return {}
+        return self.timer.stats()
+
     #------------------------------------------------------------ 
     def update_frac(self, time_frac):
         """Update model by a fraction of a time step.
@@ -367,13 +474,135 @@ class bmi_LSTM(Bmi):
             print("self.get_time_step()", self.get_time_step())
         n_steps = (then - self.get_current_time()) / self.get_time_step()
 
-        for _ in range(int(n_steps)):
+        # Without a forcing block, the forcings stay as they were set for every step
+        if self.forcing_block is None:
+            for _ in range(int(n_steps)):
+                self.update()
+            if n_steps > int(n_steps):
+                self.update_frac(n_steps - int(n_steps))
+            return None
+
+        # Run as much of the forcing block as possible in one call
+        n_block = min(int(n_steps), self.forcing_block.shape[0] - self.forcing_block_index)
+        block = self.forcing_block[self.forcing_block_index:self.forcing_block_index + n_block]
+        self.forcing_block_index += n_block
+        if self.forcing_block_index >= self.forcing_block.shape[0]:
+            self.forcing_block = None
+        outputs = [self.update_block(block)]
+
+        # Past the end of the block, the last forcings are held
+        for _ in range(int(n_steps) - n_block):
             self.update()
-        self.update_frac(n_steps - int(n_steps))
+            outputs.append(np.array([self.streamflow_cms]))  # (with N catchments, shape (1, N))
+        if n_steps > int(n_steps):
+            self.update_frac(n_steps - int(n_steps))
+        return np.concatenate(outputs)
+
+    #------------------------------------------------------------ 
+    def set_forcing_block(self, block):
+        """Give the model the forcings for many time steps at once.
+
+        The next calls to update_until() run through the block one sequence
+        at a time, instead of one update() per time step.
+
+        Parameters
+        ----------
+        block : np.ndarray
+            Array of shape (T, n_dynamic), with one row per time step and the
+            columns in the order of the 'dynamic_inputs' of the trained model.
+            With more than one catchment, of shape (T, n_catchments, n_dynamic).
+        """
+        self.forcing_block = self._check_block(block)
+        self.forcing_block_index = 0
+
+    #------------------------------------------------------------ 
+    def update_block(self, block):
+        """Run the model for many time steps in one call.
+
+        This gives the same states and outputs as setting each row of the
+        block and calling update(), but runs the whole block as one sequence
+        through the LSTM.  Afterwards the forcing variables hold the last row.
+
+        Parameters
+        ----------
+        block : np.ndarray
+            Array of shape (T, n_dynamic), with one row per time step and the
+            columns in the order of the 'dynamic_inputs' of the trained model.
+            With more than one catchment, of shape (T, n_catchments, n_dynamic).
+
+        Returns
+        -------
+        np.ndarray
+            Streamflow (m3 s-1) at each of the T time steps, of shape (T,), or
+            (T, n_catchments) with more than one catchment.
+        """
+        block = self._check_block(block)
+        n_steps = block.shape[0]
+        if n_steps == 0:
+            return np.zeros(block.shape[:-1])
+        n_dynamic = len(self.cfg_train['dynamic_inputs'])
+        n_inputs = self.n_step_inputs
+
+        # Static attributes are the same for every row (unless folded into the bias)
+        input_array = np.empty((n_steps, self.n_catchments, n_inputs), dtype='float64')
+        input_array[:, :, :n_dynamic] = block.reshape(n_steps, self.n_catchments, n_dynamic)
+        if n_inputs > n_dynamic:
+            input_array[:, :, n_dynamic:] = self.input_array[n_dynamic:n_inputs].T
+        input_array_scaled = (input_array - self.input_mean[:n_inputs]) / self.input_std[:n_inputs]
+
+        if self.backend == 'numpy':
+            if self.h_t.dtype != torch.float32:
+                self.h_t = self.h_t.float()
+                self.c_t = self.c_t.float()
+            h_t = self.h_t.numpy().reshape(self.n_catchments, -1)
+            c_t = self.c_t.numpy().reshape(self.n_catchments, -1)
+            input_array_scaled = input_array_scaled.astype('float32')
+            lstm_values = np.empty((n_steps, self.n_catchments), dtype='float64')
+            for k in range(n_steps):
+                lstm_values[k] = self.numpy_lstm.forward(input_array_scaled[k], h_t, c_t)[:, 0]
+        else:
+            with torch.no_grad():
+                lstm_output, self.h_t, self.c_t = self.inference_lstm.forward(torch.tensor(input_array_scaled),
+                                                                              self.h_t, self.c_t)
+            self.lstm_output = lstm_output[-1:]
+            lstm_values = lstm_output[:, :, 0].numpy().astype('float64')
+
+        # Forcing variables and outputs as after the last of T single updates
+        self.input_array[:n_dynamic] = block[-1].T
+        # (the class method, so the 'timing' option does not count it as a phase of update())
+        bmi_LSTM.scale_output(self, lstm_values[-1, 0] if self.n_catchments == 1 else lstm_values[-1])
+        self.t += n_steps * self.get_time_step()
+
+        # Same scaling as in scale_output(), for all the time steps
+        surface_runoff_mm = lstm_values * self.out_std + self.out_mean
+        if self.cfg_train['target_variables'][0] == 'QObs(mm/d)':
+            surface_runoff_mm = surface_runoff_mm * (1/24)
+        surface_runoff_mm = np.maximum(surface_runoff_mm, 0.0)
+        streamflow_cms = surface_runoff_mm * self.output_factor_cms
+        return streamflow_cms[:, 0] if self.n_catchments == 1 else streamflow_cms
+
+    #------------------------------------------------------------ 
+    def _check_block(self, block):
+        """A block of forcings as a float64 array, checked against the shape update_block() takes."""
+        block = np.asarray(block, dtype='float64')
+        n_dynamic = len(self.cfg_train['dynamic_inputs'])
+        if self.n_catchments == 1:
+            expected = (n_dynamic,)
+        else:
+            expected = (self.n_catchments, n_dynamic)
+        if block.shape[1:] != expected:
+            raise ValueError("forcing block must have shape (T, {}), not {}".format(
+                ', '.join(str(x) for x in expected), block.shape))
+        return block
 
     #------------------------------------------------------------    
     def finalize( self ):
         """Finalize model."""
+        if (self.timer is not None) and (self.cfg_bmi.get('timing_file') is not None):
+            self.timer.dump(self.cfg_bmi['timing_file'],
+                            basin_id=self.cfg_bmi.get('basin_id'),
+                            train_cfg_file=self.cfg_bmi.get('train_cfg_file'),
+                            backend=self.backend)
         self._model = None
     
     #------------------------------------------------------------
@@ -382,6 +611,149 @@ class bmi_LSTM(Bmi):
     #------------------------------------------------------------
     #------------------------------------------------------------
 
+    #-------------------------------------------------------------------
+    def load_trained_model(self):
+        """ Get the training configuration, scalers and weights of the trained LSTM.
+
+        They come from the 'model_bundle' file if the BMI configuration has one,
+        and from the 'train_cfg_file' (and the files it points to) otherwise.
+        These are read once per process for each training configuration file
+        and shared, read-only, with every later instance that uses the same one
+        (unless the BMI configuration sets 'use_model_cache' to False).
+        """
+        use_cache = self.cfg_bmi.get('use_model_cache', True)
+        bundle_file = self.cfg_bmi.get('model_bundle')
+        if bundle_file is not None:
+            source_file = Path(bundle_file)
+        else:
+            source_file = self.cfg_bmi['train_cfg_file']
+
+        if use_cache:
+            self.trained_model = model_cache.trained_model_cache.get(source_file)
+            if self.trained_model is not None:
+                self.use_trained_model(self.trained_model)
+                return
+
+        if bundle_file is not None:
+            self.load_model_bundle(source_file)
+            source_files = [source_file]
+        else:
+            self.get_training_configurations()
+            self.get_scaler_values()
+            self.load_trained_weights()
+            source_files = [source_file, self.train_data_scaler_file, self.trained_model_file]
+
+        self.trained_model = model_cache.TrainedModel(cfg_train=self.cfg_train,
+                                                      lstm=self.lstm,
+                                                      all_lstm_inputs=self.all_lstm_inputs,
+                                                      input_mean=self.input_mean,
+                                                      input_std=self.input_std,
+                                                      out_mean=self.out_mean,
+                                                      out_std=self.out_std,
+                                                      source_files=source_files)
+        # The scaler object is no longer needed once the scaler values are extracted
+        self.train_data_scaler = None
+        if use_cache:
+            model_cache.trained_model_cache.put(source_file, self.trained_model)
+
+    #-------------------------------------------------------------------
+    def load_model_bundle(self, bundle_file):
+        """ Read the trained LSTM from a single-file model bundle.
+
+        The weights are memory-mapped rather than read, see lstm.model_bundle.
+        """
+        header, arrays = model_bundle.read_bundle(bundle_file)
+        self.cfg_train = self._parse_config(header['cfg_train'])
+        self.all_lstm_inputs = header['all_lstm_inputs']
+        self.lstm = model_bundle.lstm_from_bundle(header, arrays)
+
+        self.input_mean = arrays['input_mean']
+        self.input_std = arrays['input_std']
+        self.out_mean = arrays['out_mean'][()]
+        self.out_std = arrays['out_std'][()]
+
+        self.input_size        = self.lstm.input_size
+        self.hidden_layer_size = self.lstm.hidden_layer_size
+        self.output_size       = self.lstm.output_size
+        self.batch_size        = 1
+
+    #-------------------------------------------------------------------
+    def use_trained_model(self, trained_model):
+        """ Use the configuration, scalers and weights of an already loaded LSTM. """
+        self.cfg_train         = trained_model.cfg_train
+        self.lstm              = trained_model.lstm
+        self.all_lstm_inputs   = trained_model.all_lstm_inputs
+        self.input_mean        = trained_model.input_mean
+        self.input_std         = trained_model.input_std
+        self.out_mean          = trained_model.out_mean
+        self.out_std           = trained_model.out_std
+        self.input_size        = self.lstm.input_size
+        self.hidden_layer_size = self.lstm.hidden_layer_size
+        self.output_size       = self.lstm.output_size
+        self.batch_size        = 1
+
+    #-------------------------------------------------------------------
+    def set_input_units(self):
+        """ Take some inputs in other units than the LSTM was trained with.
+
+        The 'input_units' option of the BMI configuration maps input variable
+        names (long or short) to the units they will be given in, e.g.
+            input_units:
+              land_surface_air__temperature: K
+        Each conversion (see lstm.unit_conversion) is folded into the input
+        mean and standard deviation here, so no conversion is done per time
+        step.  get_var_units() then reports the units given here.
+        """
+        input_units = self.cfg_bmi.get('input_units')
+        if not input_units:
+            return
+
+        scale = np.ones(len(self.all_lstm_inputs))
+        offset = np.zeros(len(self.all_lstm_inputs))
+        for var_name, units in input_units.items():
+            long_name = var_name if var_name in self._var_name_map_long_first else self._var_name_map_short_first.get(var_name)
+            if long_name is None or self._var_name_map_long_first[long_name] not in self.all_lstm_inputs:
+                raise ValueError("'{}' in input_units is not an input of the trained LSTM".format(var_name))
+            k = self.all_lstm_inputs.index(self._var_name_map_long_first[long_name])
+            scale[k], offset[k] = unit_conversion.get_conversion(units, self._var_units_map[long_name])
+            self._var_units_map[long_name] = units
+
+        # New arrays, since the scalers of the trained model are shared by other instances
+        self.input_mean, self.input_std = unit_conversion.fold_into_scaler(self.input_mean, self.input_std,
+                                                                           scale, offset)
+
+    #-------------------------------------------------------------------
+    def load_trained_weights(self):
+        """ Create the LSTM and load the weights trained with NeuralHydrology. """
+        # ------------- Initialize an LSTM model ------------------------------#
+        self.lstm = nextgen_cuda_lstm.Nextgen_CudaLSTM(input_size=self.input_size, 
+                                                       hidden_layer_size=self.hidden_layer_size, 
+                                                       output_size=self.output_size, 
+                                                       batch_size=1, 
+                                                       seq_length=1)
+
+        # ------------ Load in the trained weights ----------------------------#
+        # Save the default model weights. We need to make sure we have the same keys.
+        default_state_dict = self.lstm.state_dict()
+
+        # Trained model weights from Neuralhydrology.
+        if (USE_PATH):  # (SDP)
+            self.trained_model_file = self.cfg_train['run_dir'] / 'model_epoch{}.pt'.format(str(self.cfg_train['epochs']).zfill(3))
+        else:
+            str1 = self.cfg_train['run_dir'] + '/' + 'model_epoch{}.pt'
+            self.trained_model_file = str1.format(str(self.cfg_train['epochs']).zfill(3))
+
+        ## trained_model_file = self.cfg_train['run_dir'] / 'model_epoch{}.pt'.format(str(self.cfg_train['epochs']).zfill(3))
+        trained_state_dict = torch.load(self.trained_model_file, map_location=torch.device('cpu'))
+
+        # Changing the name of the head weights, since different in NH
+        trained_state_dict['head.weight'] = trained_state_dict.pop('head.net.0.weight')
+        trained_state_dict['head.bias'] = trained_state_dict.pop('head.net.0.bias')
+        trained_state_dict = {x:trained_state_dict[x] for x in default_state_dict.keys()}
+
+        # Load in the trained weights.
+        self.lstm.load_state_dict(trained_state_dict)
+
     #-------------------------------------------------------------------
     def get_training_configurations(self):
         if self.cfg_bmi['train_cfg_file'] is not None:
@@ -411,17 +783,30 @@ class bmi_LSTM(Bmi):
         self.all_lstm_inputs = []
         self.all_lstm_inputs.extend(self.cfg_train['dynamic_inputs'])
         self.all_lstm_inputs.extend(self.cfg_train['static_attributes'])
-        
+
+        self.read_train_data_scaler()
+
+    #------------------------------------------------------------ 
+    def read_train_data_scaler(self):
         # Scaler data from the training set. This is used to normalize the data (input and output).
+        # Use the compact version made by lstm.convert_scaler if there is one, since
+        # the pickle needs an old version of xarray and is slow to read.
         if (USE_PATH):   # (SDP)
-            with open(self.cfg_train['run_dir'] / 'train_data' / 'train_data_scaler.p', 'rb') as fb:
-                self.train_data_scaler = pickle.load(fb)
+            npz_file = self.cfg_train['run_dir'] / 'train_data' / convert_scaler.SCALER_NPZ_FILE
+            if npz_file.exists():
+                self.train_data_scaler_file = npz_file
+                self.train_data_scaler = convert_scaler.load_scaler_npz(npz_file)
+            else:
+                self.train_data_scaler_file = self.cfg_train['run_dir'] / 'train_data' / 'train_data_scaler.p'
+                with open(self.train_data_scaler_file, 'rb') as fb:
+                    self.train_data_scaler = pickle.load(fb)
         else:
             p_file = self.cfg_train['run_dir'] + '/train_data/' + 'train_data_scaler.p'  # SDP
             p_file = p_file.replace('./', os.getcwd() + '/')
             # print('p_file =', p_file)
             # print('type(p_file) =', type(p_file))
             # print()
+            self.train_data_scaler_file = p_file
             with open(p_file,'rb') as fb:
                 self.train_data_scaler = pickle.load(fb)
                 
@@ -433,98 +818,90 @@ class bmi_LSTM(Bmi):
 
         """Mean and standard deviation for the inputs and LSTM outputs""" 
 
-        self.out_mean = self.train_data_scaler['xarray_feature_center'][self.cfg_train['target_variables'][0]].values
-        self.out_std = self.train_data_scaler['xarray_feature_scale'][self.cfg_train['target_variables'][0]].values
+        # The xarray values in the scaler pickle are wrapped in DataArrays,
+        # while those read from a converted ".npz" file are plain numbers.
+        def feature_value(section, name):
+            value = self.train_data_scaler[section][name]
+            return getattr(value, 'values', value)
+
+        self.out_mean = feature_value('xarray_feature_center', self.cfg_train['target_variables'][0])
+        self.out_std = feature_value('xarray_feature_scale', self.cfg_train['target_variables'][0])
 
         self.input_mean = []
-        self.input_mean.extend([self.train_data_scaler['xarray_feature_center'][x].values for x in self.cfg_train['dynamic_inputs']])
+        self.input_mean.extend([feature_value('xarray_feature_center', x) for x in self.cfg_train['dynamic_inputs']])
         self.input_mean.extend([self.train_data_scaler['attribute_means'][x] for x in self.cfg_train['static_attributes']])
         self.input_mean = np.array(self.input_mean)
 
         self.input_std = []
-        self.input_std.extend([self.train_data_scaler['xarray_feature_scale'][x].values for x in self.cfg_train['dynamic_inputs']])
+        self.input_std.extend([feature_value('xarray_feature_scale', x) for x in self.cfg_train['dynamic_inputs']])
         self.input_std.extend([self.train_data_scaler['attribute_stds'][x] for x in self.cfg_train['static_attributes']]) 
         self.input_std = np.array(self.input_std)
 
     #------------------------------------------------------------ 
     def create_scaled_input_tensor(self, VERBOSE=False):
 
+        # self.input_tensor shares memory with self.input_array_scaled
+        self.create_scaled_input_array(VERBOSE=VERBOSE)
+
+    #------------------------------------------------------------ 
+    def create_scaled_input_array(self, VERBOSE=False):
+
         #------------------------------------------------------------
-        # Note:  A BMI-enabled model should not use long var names
-        #        internally (i.e. saved into self); it should just
-        #        use convenient short names.  For the BMI functions
-        #        that require a long var name, it should be mapped
-        #        to the model's short name before taking action.
-        #------------------------------------------------------------        
-        # TODO: Choose to store values in dictionary or not.
-        # self.input_array = np.array([getattr(self, self._var_name_map_short_first[x]) for x in self.all_lstm_inputs])
-        # self.input_array = np.array([self._values[self._var_name_map_short_first[x]] for x in self.all_lstm_inputs])
-
-        #--------------------------------------------------------------        
-        # Note:  The code in this block is more verbose, but makes it
-        #        much easier to test and debug and helped find a bug
-        #        in the lines above (long vs. short names.) 
-        #--------------------------------------------------------------
-        # print('Creating scaled input tensor...')
-        n_inputs = len(self.all_lstm_inputs)
-        self.input_list = []  #############
-        DEBUG = False
-        for k in range(n_inputs):
-            short_name = self.all_lstm_inputs[k]
-            long_name  = self._var_name_map_short_first[ short_name ]
-            # vals = self.get_value( self, long_name )
-            vals = getattr( self, short_name )  ####################
-
-            self.input_list.append( vals )
-            if (VERBOSE or DEBUG):         
-                print('  short_name =', short_name )
-                print('  long_name  =', long_name )
-                array = getattr( self, short_name )
-                ## array = self.get_value( long_name )  
-                print('  type       =', type(vals) )
-                print('  vals       =', vals )
-
-        #--------------------------------------------------------
-        # W/o setting dtype here, it was "object_", and crashed
-        #--------------------------------------------------------
-        ## self.input_array = np.array( self.input_list )
-        self.input_array = np.array( self.input_list, dtype='float64' )  # SDP
+        # Note:  The input values are already in self.input_array,
+        #        in the order of all_lstm_inputs, since the BMI
+        #        variables are views into it.  So this is just the
+        #        centering and scaling, into a preallocated array.
+        #        Only the first n_step_inputs are used, since only
+        #        the dynamic inputs are needed when the static ones
+        #        are folded into the bias.
+        #------------------------------------------------------------
+        n_inputs = self.n_step_inputs
         if (VERBOSE):
+            for k in range(n_inputs):
+                short_name = self.all_lstm_inputs[k]
+                print('  short_name =', short_name )
+                print('  long_name  =', self._var_name_map_short_first[ short_name ] )
+                print('  vals       =', self.input_array[k] )
             print('Normalizing the tensor...')
             print('  input_mean =', self.input_mean )
             print('  input_std  =', self.input_std  )
             print()
         # Center and scale the input values for use in torch
-        self.input_array_scaled = (self.input_array - self.input_mean) / self.input_std
-        if (DEBUG):
-            print('### input_list =', self.input_list)
-            print('### input_array =', self.input_array)
-            print('### dtype(input_array) =', self.input_array.dtype )
-            print('### type(input_array_scaled) =', type(self.input_array_scaled))
-            print('### dtype(input_array_scaled) =', self.input_array_scaled.dtype )
-            print()
-        self.input_tensor = torch.tensor(self.input_array_scaled)
+        # (With more than one catchment, the transpose gives one row per catchment)
+        np.subtract(self.input_array[:n_inputs].T, self.step_input_mean, out=self.input_array_scaled)
+        np.divide(self.input_array_scaled, self.step_input_std, out=self.input_array_scaled)
 
     #------------------------------------------------------------ 
-    def scale_output(self):
+    def scale_output(self, lstm_value=None):
+
+        # The NumPy backend passes its output value directly
+        if lstm_value is None:
+            if self.n_catchments > 1:
+                lstm_value = self.lstm_output[0,:,0].numpy()
+            else:
+                lstm_value = self.lstm_output[0,0,0].numpy().tolist()
 
         if self.cfg_train['target_variables'][0] == 'qobs_mm_per_hour':
-            self.surface_runoff_mm = (self.lstm_output[0,0,0].numpy().tolist() * self.out_std + self.out_mean)
+            self.surface_runoff_mm = (lstm_value * self.out_std + self.out_mean)
 
         elif self.cfg_train['target_variables'][0] == 'QObs(mm/d)':
-            self.surface_runoff_mm = (self.lstm_output[0,0,0].numpy().tolist() * self.out_std + self.out_mean) * (1/24)
+            self.surface_runoff_mm = (lstm_value * self.out_std + self.out_mean) * (1/24)
             
         # Bound the runoff to zero or obs, as negative values are illogical
         #if self.surface_runoff_mm < 0.0: self.surface_runoff_mm = 0.0
         #np.maximum( self.surface_runoff_mm, 0.0, self.surface_runoff_mm)
+        if self.n_catchments > 1:
+            self.surface_runoff_mm = np.maximum(self.surface_runoff_mm, 0.0)
+            self._values['land_surface_water__runoff_depth'][:] = self.surface_runoff_mm/1000.0
+            self._values['land_surface_water__runoff_volume_flux'][:] = self.surface_runoff_mm * self.output_factor_cms
+            return
         self.surface_runoff_mm = max(self.surface_runoff_mm,0.0)
 
-        #self._values['land_surface_water__runoff_depth'] = self.surface_runoff_mm/1000.0
-        setattr(self, 'land_surface_water__runoff_depth', self.surface_runoff_mm/1000.0)
-        self.streamflow_cms = self.surface_runoff_mm * self.output_factor_cms
+        self._values['land_surface_water__runoff_depth'][0] = self.surface_runoff_mm/1000.0
 
-        #self._values['land_surface_water__runoff_volume_flux'] = self.streamflow_cms
-        setattr(self, 'land_surface_water__runoff_volume_flux', self.streamflow_cms)
+        # Note: streamflow_cms is the short name of 'land_surface_water__runoff_volume_flux',
+        #       so this also sets the value of that output variable
+        self.streamflow_cms = self.surface_runoff_mm * self.output_factor_cms
 
     #-------------------------------------------------------------------
     def read_initial_states(self):
@@ -533,10 +910,188 @@ class bmi_LSTM(Bmi):
         c_t = np.genfromtxt(self.c_t_init_file, skip_header=1, delimiter=",")[:,1]
         self.c_t = torch.tensor(c_t).view(1,1,-1)
 
+    #-------------------------------------------------------------------
+    def get_state(self):
+        """ Snapshot of the model state, for a restart.
+
+        Only the time, the LSTM hidden and cell states, the input buffer and
+        the outputs are saved (see lstm.model_state), not the trained model.
+
+        Returns
+        -------
+        bytes
+            Blob that set_state() restores, in a model initialized with the
+            same BMI configuration.
+        """
+        outputs = np.concatenate([self._values['land_surface_water__runoff_depth'],
+                                  self._values['land_surface_water__runoff_volume_flux'],
+                                  np.atleast_1d(self.surface_runoff_mm)])
+        return model_state.pack_state(self.t, self.h_t.detach().cpu().numpy(), self.c_t.detach().cpu().numpy(),
+                                      self.input_array, outputs)
+
+    #-------------------------------------------------------------------
+    def set_state(self, blob):
+        """ Restore the model state from a snapshot made by get_state(). """
+        state = model_state.unpack_state(blob)
+        n_hidden = self.hidden_layer_size * self.n_catchments
+        if state['h_t'].size != n_hidden or state['inputs'].size != self.input_array.size:
+            raise ValueError("LSTM state snapshot has {} hidden states and {} inputs, but this model has {} and {}".format(
+                state['h_t'].size, state['inputs'].size, n_hidden, self.input_array.size))
+
+        self.t = state['t']
+        self.h_t = torch.tensor(state['h_t']).view(1, self.batch_size, -1)
+        self.c_t = torch.tensor(state['c_t']).view(1, self.batch_size, -1)
+        self.input_array[:] = state['inputs'].reshape(self.input_array.shape)
+        depth, volume_flux, surface_runoff_mm = state['outputs'].reshape(3, -1)
+        self._values['land_surface_water__runoff_depth'][:] = depth
+        self._values['land_surface_water__runoff_volume_flux'][:] = volume_flux
+        self.surface_runoff_mm = surface_runoff_mm[0] if self.n_catchments == 1 else surface_runoff_mm.copy()
+
+        # The static attributes may differ from those the bias was folded with
+        if self.fold_static:
+            self.fold_static_attributes()
+
+    #-------------------------------------------------------------------
+    def set_serialization_value(self, var_name, values):
+        """ ngen-style serialization through set_value().
+
+        'serialization_create' makes a snapshot, which get_value_ptr() then
+        returns as 'serialization_state' (uint8), with its length in
+        'serialization_size'.  'serialization_free' releases it.  Setting
+        'serialization_state' restores a snapshot, and 'reset_time' sets the
+        time back to the start time.
+        """
+        if var_name == 'serialization_create':
+            self._values['serialization_state'] = np.frombuffer(self.get_state(), dtype='uint8').copy()
+            self._values['serialization_size'] = np.array([self._values['serialization_state'].size], dtype='uint64')
+        elif var_name == 'serialization_state':
+            self.set_state(np.asarray(values, dtype='uint8'))
+        elif var_name == 'serialization_free':
+            self._values.pop('serialization_state', None)
+            self._values.pop('serialization_size', None)
+        elif var_name == 'reset_time':
+            self.t = self._start_time
+
+    #-------------------------------------------------------------------
+    def read_initial_states_from_store(self):
+        """ Get the initial states of this catchment from a state store.
+
+        The store is the 'initial_state_file' of the BMI configuration (see
+        lstm.state_store), and the catchment is its 'initial_state_id', or
+        'basin_id' if there is none.  With more than one catchment, they are
+        the 'initial_state_ids', or else the 'basin_ids'.
+        """
+        store = state_store.open_state_store(self.cfg_bmi['initial_state_file'])
+        if store.hidden_layer_size != self.hidden_layer_size:
+            raise ValueError("Initial states in {} have {} hidden units, but the LSTM has {}".format(
+                self.cfg_bmi['initial_state_file'], store.hidden_layer_size, self.hidden_layer_size))
+        if self.n_catchments > 1:
+            states = [store.get(x) for x in self.cfg_bmi.get('initial_state_ids', self.cfg_bmi['basin_ids'])]
+            h_t = np.stack([h for h, _ in states])
+            c_t = np.stack([c for _, c in states])
+        else:
+            h_t, c_t = store.get(self.cfg_bmi.get('initial_state_id', self.cfg_bmi.get('basin_id')))
+        self.h_t = torch.tensor(h_t).view(1, self.batch_size, -1)
+        self.c_t = torch.tensor(c_t).view(1, self.batch_size, -1)
+
+    #-------------------------------------------------------------------
+    def get_model_hash(self):
+        """ Hash of the weights and scalers of the trained model (computed once per trained model).
+
+        The scalers are those of the trained model itself, not those of this
+        instance, which may include its input unit conversions.
+        """
+        trained_model = self.trained_model
+        if trained_model.model_hash is None:
+            trained_model.model_hash = spinup.model_hash(trained_model.lstm, trained_model.input_mean,
+                                                         trained_model.input_std, trained_model.out_mean,
+                                                         trained_model.out_std)
+        return trained_model.model_hash
+
+    #-------------------------------------------------------------------
+    def get_initial_state_source(self):
+        """ Where the states start from before the warm-up, for the spin-up cache key. """
+        if self.cfg_bmi['initial_state'] == 'file':
+            state_file = Path(self.cfg_bmi['initial_state_file']).resolve()
+            return ('file', str(state_file), os.stat(state_file).st_mtime_ns,
+                    self.cfg_bmi.get('initial_state_id', self.cfg_bmi.get('basin_id')))
+        return (self.cfg_bmi['initial_state'],)
+
+    #-------------------------------------------------------------------
+    def spin_up(self):
+        """ Warm up the LSTM states with the forcings of 'spinup_forcing_file'.
+
+        The warm-up window ('spinup_start_date' to 'spinup_end_date', whole
+        days, or the whole file) is run as one sequence, and only the
+        resulting h_t and c_t are kept: the time, inputs and outputs are as
+        before.  With 'spinup_cache_dir', the states are read from there if
+        this basin, trained model and window were spun up before, and saved
+        there otherwise (see lstm.spinup).
+        """
+        if self.n_catchments > 1:
+            raise ValueError("'spinup_forcing_file' is for a single catchment, not for 'basin_ids'")
+        start_date = self.cfg_bmi.get('spinup_start_date')
+        end_date = self.cfg_bmi.get('spinup_end_date')
+
+        cache = None
+        blob = None
+        if self.cfg_bmi.get('spinup_cache_dir') is not None:
+            cache = spinup.SpinupCache(self.cfg_bmi['spinup_cache_dir'])
+            n_dynamic = len(self.cfg_train['dynamic_inputs'])
+            n_inputs = len(self.all_lstm_inputs)
+            scaled_static_inputs = ((self.input_array[n_dynamic:n_inputs] - self.input_mean[n_dynamic:n_inputs])
+                                    / self.input_std[n_dynamic:n_inputs])
+            run_digest = spinup.run_hash(self.cfg_bmi['spinup_forcing_file'], self.input_mean, self.input_std,
+                                         scaled_static_inputs, self.get_initial_state_source())
+            key = spinup.cache_key(self.cfg_bmi.get('basin_id'), self.get_model_hash(), run_digest,
+                                   self.cfg_bmi['initial_state'], start_date, end_date)
+            blob = cache.get(key)
+
+        if blob is None:
+            forcings = spinup.read_spinup_forcings(self.cfg_bmi['spinup_forcing_file'],
+                                                   self.cfg_train['dynamic_inputs'],
+                                                   self._var_name_map_short_first, start_date, end_date)
+            start_state = self.get_state()
+            self.update_block(forcings)
+            blob = self.get_state()
+            self.set_state(start_state)
+            if cache is not None:
+                cache.put(key, blob)
+            if self.verbose > 0:
+                print('Spun up the LSTM states over', forcings.shape[0], 'time steps')
+
+        state = model_state.unpack_state(blob)
+        self.h_t = torch.tensor(state['h_t']).view(1, self.batch_size, -1)
+        self.c_t = torch.tensor(state['c_t']).view(1, self.batch_size, -1)
+
     #---------------------------------------------------------------------------- 
     def set_static_attributes(self):
         """ Get the static attributes from the configuration file
+
+        Attributes (and 'area_sqkm', 'lat' and 'lon') that are not in the
+        configuration file are taken from the row of 'basin_id' in the
+        'attribute_store_file', if there is one (see lstm.attribute_store).  With
+        'basin_ids', each attribute is a list with a value for each catchment (or
+        a single value for all).
         """
+        if self.cfg_bmi.get('attribute_store_file') is not None:
+            missing = [x for x in self.cfg_train['static_attributes'] if x not in self.cfg_bmi]
+            store = attribute_store.open_attribute_store(self.cfg_bmi['attribute_store_file'])
+            # Settings taken from other attributes of the store (the location only if the store has it)
+            renamed = {'area_sqkm': attribute_store.AREA_ATTRIBUTE}
+            renamed.update({name: store_name for name, store_name in attribute_store.LOCATION_ATTRIBUTES.items()
+                            if store_name in store.column})
+            renamed = {name: store_name for name, store_name in renamed.items() if name not in self.cfg_bmi}
+            names = missing + [x for x in renamed.values() if x not in missing]
+            if self.cfg_bmi.get('basin_ids') is not None:
+                rows = [store.get(x, names) for x in self.cfg_bmi['basin_ids']]
+                values = {name: [row[name] for row in rows] for name in names}
+            else:
+                values = store.get(self.cfg_bmi['basin_id'], names)
+            for name, store_name in renamed.items():
+                self.cfg_bmi[name] = values[store_name]
+            self.cfg_bmi.update({name: values[name] for name in missing})
+
         for attribute in self._static_attributes_list:
             if attribute in self.cfg_train['static_attributes']:
                 #------------------------------------------------------------
@@ -553,7 +1108,60 @@ class bmi_LSTM(Bmi):
                 
                 # and this is just in case. _values dictionary is in the example
                 #self._values[long_var_name] = self.cfg_bmi[attribute]
+
+        if self.fold_static:
+            self.fold_static_attributes()
     
+    #---------------------------------------------------------------------------- 
+    def fold_static_attributes(self):
+        """ Set up the LSTM that is run in update().
+
+        With the 'fold_static_attributes' option, the scaled static attributes are
+        multiplied through the input weights once and added to the gate bias, so
+        each update only takes the dynamic inputs. Call again if a static
+        attribute changes.
+        """
+        if not self.fold_static:
+            self.inference_lstm = self.lstm
+            self.n_step_inputs = len(self.all_lstm_inputs)
+        else:
+            n_dynamic = len(self.cfg_train['dynamic_inputs'])
+            static_array = self.input_array[n_dynamic:]
+            static_scaled = (static_array - self.input_mean[n_dynamic:]) / self.input_std[n_dynamic:]
+            self.inference_lstm = self.lstm.fold_static_inputs(n_dynamic, torch.tensor(static_scaled))
+            self.n_step_inputs = n_dynamic
+
+        # Preallocated for create_scaled_input_array(); the input tensor shares its memory
+        self.step_input_mean = self.input_mean[:self.n_step_inputs]
+        self.step_input_std = self.input_std[:self.n_step_inputs]
+        self.input_array_scaled = np.zeros(self.input_array[:self.n_step_inputs].T.shape, dtype='float64')
+        self.input_tensor = torch.from_numpy(self.input_array_scaled)
+
+        if self.backend == 'numpy':
+            self.build_numpy_lstm()
+
+    #---------------------------------------------------------------------------- 
+    def build_numpy_lstm(self):
+        """ Copy the weights of the LSTM run in update() into the NumPy LSTM.
+
+        With the 'validate_backend' option (on by default) the NumPy LSTM is
+        checked against the PyTorch LSTM, and a ValueError is raised if they differ.
+        """
+        self.numpy_input = np.zeros((self.n_catchments, self.n_step_inputs), dtype='float32')
+
+        # Without folding, the NumPy LSTM is the same for every catchment, so share it
+        if (not self.fold_static) and (self.trained_model.numpy_lstm is not None):
+            self.numpy_lstm = self.trained_model.numpy_lstm
+            return
+
+        self.numpy_lstm = numpy_lstm.Numpy_LSTM(self.inference_lstm)
+        if self.validate_backend:
+            max_diff = self.numpy_lstm.validate(self.inference_lstm)
+            if self.verbose > 0:
+                print('NumPy LSTM matches PyTorch LSTM to within', max_diff)
+        if not self.fold_static:
+            self.trained_model.numpy_lstm = self.numpy_lstm
+
     #---------------------------------------------------------------------------- 
     def initialize_forcings(self):
         print('Initializing all forcings to 0...')
@@ -627,7 +1235,8 @@ class bmi_LSTM(Bmi):
         np.ndarray
             Copy of values.
         """
-        dest[:] = self.get_value_ptr(var_name)
+        # One copy, straight from the backing array into dest
+        np.copyto(dest, self._values[var_name], casting='same_kind')
         return dest
 
     #-------------------------------------------------------------------
@@ -653,9 +1262,7 @@ class bmi_LSTM(Bmi):
         #         print('self.surface_runoff_mm', self.surface_runoff_mm)
         #         print('self._values[var_name]', self._values[var_name])
 
-        # We actually need this function to return the backing array, so bypass override of __getattribute__ (that
-        # extracts scalar) and use the base implementation
-        return super(bmi_LSTM, self).__getattribute__(var_name)
+        return self._values[var_name]
 
 
     #-------------------------------------------------------------------
@@ -740,6 +1347,9 @@ class bmi_LSTM(Bmi):
     # JG Note: what is this used for?
     def get_var_rank(self, long_var_name):
 
+        # Each variable has one value per catchment, on a 'points' grid
+        if self._var_grid_type == 'points':
+            return np.int16(1)
         return np.int16(0)
 
     #-------------------------------------------------------------------
@@ -800,34 +1410,16 @@ class bmi_LSTM(Bmi):
               Array of new values.
         """
     
-        internal_array = self.get_value_ptr(var_name)
-        #self.get_value_ptr(var_name)[:] = values
-        internal_array[:] = values
+        if var_name in self._serialization_var_names:
+            self.set_serialization_value(var_name, values)
+            return
 
-        short_name = self._var_name_map_long_first[ var_name ]
-        
-        # Better approach, assuming type is "ndarray" (SDP)
-        # setattr( self, short_name, values )
+        # Write into the backing array (a view into the input buffer for LSTM inputs)
+        self._values[var_name][:] = values
 
-        if (internal_array.ndim > 0):
-            setattr( self, short_name, internal_array[0])
-        else:
-            setattr( self, short_name, internal_array )
-            
-        try: 
-            #NJF From NGEN, `internal_array` is a singleton array
-            setattr( self, var_name, internal_array[0] )
-        
-            # jmframe: this next line is basically a duplicate. 
-            # I guess we should stick with the attribute names instead of a dictionary approach. 
-            self._values[var_name] = internal_array[0]
-        # JLG 03242022: this isn't really an "error" block as standalone considers value as scalar?
-        except TypeError:
-            setattr( self, var_name, internal_array )
-        
-            # jmframe: this next line is basically a duplicate. 
-            # I guess we should stick with the attribute names instead of a dictionary approach. 
-            self._values[var_name] = internal_array
+        # Changing a static attribute changes the folded gate bias
+        if self.fold_static and (self._var_name_map_long_first[var_name] in self.cfg_train['static_attributes']):
+            self.fold_static_attributes()
 
     #------------------------------------------------------------ 
     def set_value_at_indices(self, var_name: str, inds: np.ndarray, src: np.ndarray):
@@ -844,8 +1436,38 @@ class bmi_LSTM(Bmi):
             Array of new values.
         """
         internal_array = self.get_value_ptr(var_name)
-        for i in range(inds.shape[0]):
-            internal_array[inds[i]] = src[i]
+        index = self._check_indices(var_name, internal_array, inds)
+        src = np.asarray(src)
+        if src.size != internal_array[index].size:
+            raise ValueError("{} values given for {} indices of {}".format(src.size, np.size(inds), var_name))
+        if not np.can_cast(src.dtype, internal_array.dtype, casting='same_kind'):
+            raise TypeError("cannot set {} values of {} from {} values".format(internal_array.dtype, var_name, src.dtype))
+        internal_array[index] = src.reshape(-1)
+
+        # Changing a static attribute changes the folded gate bias
+        if self.fold_static and (self._var_name_map_long_first[var_name] in self.cfg_train['static_attributes']):
+            self.fold_static_attributes()
+
+    #------------------------------------------------------------ 
+    def _check_indices(self, var_name, internal_array, inds):
+        """ Check the flat indices of get/set_value_at_indices().
+
+        Returns a slice when the indices are one contiguous, increasing range
+        (so the values are copied without a fancy-indexing temporary), else
+        the indices as an integer array.
+        """
+        inds = np.asarray(inds).reshape(-1)
+        if inds.size == 0:
+            return slice(0, 0)
+        if not np.issubdtype(inds.dtype, np.integer):
+            raise TypeError("indices of {} must be integers, not {}".format(var_name, inds.dtype))
+        first, last = int(inds[0]), int(inds[-1])
+        contiguous = (last - first == inds.size - 1) and (inds.size == 1 or (np.diff(inds) == 1).all())
+        low, high = (first, last) if contiguous else (int(inds.min()), int(inds.max()))
+        if low < 0 or high >= internal_array.size:
+            raise IndexError("indices of {} must be in [0, {}), not [{}, {}]".format(
+                var_name, internal_array.size, low, high))
+        return slice(first, last + 1) if contiguous else inds
 
 
     #------------------------------------------------------------ 
@@ -920,14 +1542,23 @@ class bmi_LSTM(Bmi):
         #data = np.ndarray(self.get_value_ptr(var_name)).flatten()  #### SDP
         #dest[:] = data[indices]
         original: np.ndarray = self.get_value_ptr(var_name)
-        for i in range(indices.shape[0]):
-            value_index = indices[i]
-            dest[i] = original[value_index]
+        index = self._check_indices(var_name, original, indices)
+        if dest.size != np.size(indices):
+            raise ValueError("dest has {} values for {} indices of {}".format(dest.size, np.size(indices), var_name))
+        if isinstance(index, slice):
+            np.copyto(dest, original[index], casting='same_kind')
+        elif dest.dtype == original.dtype and dest.flags.c_contiguous:
+            # Gathered straight into dest ('clip' only skips np.take's bounds check and buffer)
+            np.take(original, index, out=dest.reshape(-1), mode='clip')
+        else:
+            np.copyto(dest, original[index], casting='same_kind')
         return dest
  
     #   Note: remaining grid funcs do not apply for type 'scalar'
     #   Yet all functions in the BMI must be implemented 
     #   See https://bmi.readthedocs.io/en/latest/bmi.best_practices.html          
+    #   With 'basin_ids' the grid is of type 'points', with one node
+    #   per catchment at its 'lon' and 'lat' (and no edges or faces).
     #------------------------------------------------------------ 
     def get_grid_edge_count(self, grid):
         raise NotImplementedError("get_grid_edge_count")
@@ -950,7 +1581,9 @@ class bmi_LSTM(Bmi):
     
     #------------------------------------------------------------ 
     def get_grid_node_count(self, grid):
-        raise NotImplementedError("get_grid_node_count")
+        if self._var_grid_type != 'points':
+            raise NotImplementedError("get_grid_node_count")
+        return self.n_catchments
 
     #------------------------------------------------------------ 
     def get_grid_nodes_per_face(self, grid, nodes_per_face):
@@ -969,14 +1602,17 @@ class bmi_LSTM(Bmi):
 
     #------------------------------------------------------------ 
     def get_grid_shape(self, grid_id, shape):
-        raise NotImplementedError("get_grid_shape") 
+        if self._var_grid_type != 'points':
+            raise NotImplementedError("get_grid_shape") 
+        shape[:] = [self.n_catchments]
+        return shape
 
     #------------------------------------------------------------ 
     def get_grid_size(self, grid_id):
        
         # 0 is the only id we have
         if grid_id == 0:
-            return 1
+            return self.n_catchments
 
     #------------------------------------------------------------ 
     def get_grid_spacing(self, grid_id, spacing):
@@ -987,18 +1623,33 @@ class bmi_LSTM(Bmi):
 
         # 0 is the only id we have        
         if grid_id == 0:
-            return 'scalar'
+            return self._var_grid_type
 
     #------------------------------------------------------------ 
-    def get_grid_x(self):
-        raise NotImplementedError("get_grid_x") 
+    def _node_coordinates(self, name):
+        # One 'lon' or 'lat' per catchment: a single value would put all the nodes in one place
+        values = self.cfg_bmi.get(name)
+        if values is None or np.ndim(values) != 1 or len(values) != self.n_catchments:
+            raise ValueError("With 'basin_ids', '{}' must be a list with a value for each of the {} catchments "
+                             "(or come from the 'attribute_store_file')".format(name, self.n_catchments))
+        return np.asarray(values, dtype='float64')
 
     #------------------------------------------------------------ 
-    def get_grid_y(self):
-        raise NotImplementedError("get_grid_y") 
+    def get_grid_x(self, grid, x):
+        if self._var_grid_type != 'points':
+            raise NotImplementedError("get_grid_x") 
+        x[:] = self._node_coordinates('lon')
+        return x
 
     #------------------------------------------------------------ 
-    def get_grid_z(self):
+    def get_grid_y(self, grid, y):
+        if self._var_grid_type != 'points':
+            raise NotImplementedError("get_grid_y") 
+        y[:] = self._node_coordinates('lat')
+        return y
+
+    #------------------------------------------------------------ 
+    def get_grid_z(self, grid, z):
         raise NotImplementedError("get_grid_z") 
 
 
@@ -1044,3 +1695,20 @@ class bmi_LSTM(Bmi):
 
         # Add more config parsing if necessary
         return cfg
+
+#------------------------------------------------------------
+# The short name of each BMI variable (e.g. 'temperature' for
+# 'land_surface_air__temperature') is a property that reads and
+# writes the variable's backing array: its single value for one
+# catchment, or the whole array for more than one.
+#------------------------------------------------------------
+def _bmi_variable_property(long_name):
+    def fget(self):
+        values = self._values[long_name]
+        return values[0] if values.size == 1 else values
+    def fset(self, value):
+        self._values[long_name][:] = value
+    return property(fget, fset, doc="Value of BMI variable '{}'".format(long_name))
+
+for _long_name, (_short_name, _units) in bmi_LSTM._var_name_units_map.items():
+    setattr(bmi_LSTM, _short_name, _bmi_variable_property(_long_name))
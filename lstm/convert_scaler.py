@@ -0,0 +1,120 @@
+"""Convert the training data scaler of a NeuralHydrology run to a compact ".npz" file.
+
+NeuralHydrology stores the means and standard deviations of the training data in
+"train_data/train_data_scaler.p", a pickle that contains xarray (v.0.16.0 or earlier)
+and pandas objects.  Reading it requires that old version of xarray and is slow.
+
+This tool writes the same numbers to "train_data/train_data_scaler.npz", with a names
+array and a values array for each of the scaler sections.  When that file exists,
+bmi_LSTM.initialize() reads it instead of the pickle.  Only this conversion needs xarray.
+
+Usage:
+    python -m lstm.convert_scaler ./trained_neuralhydrology_models/hourly_slope_mean_precip_temp
+"""
+
+import argparse
+import pickle
+from pathlib import Path
+
+import numpy as np
+
+# The parts of the NeuralHydrology scaler that the LSTM uses
+SCALER_SECTIONS = ['xarray_feature_center', 'xarray_feature_scale', 'attribute_means', 'attribute_stds']
+
+SCALER_PICKLE_FILE = 'train_data_scaler.p'
+SCALER_NPZ_FILE = 'train_data_scaler.npz'
+
+
+#------------------------------------------------------------
+def scaler_to_arrays(train_data_scaler):
+    """
+    Flatten a NeuralHydrology scaler into named arrays.
+
+    Parameters
+    ----------
+    train_data_scaler : dict
+        The unpickled scaler.  The "xarray_*" sections are xarray Datasets and the
+        "attribute_*" sections are pandas Series.
+
+    Returns
+    -------
+    dict
+        For each section, "<section>" holds the values and "<section>_names" the
+        variable names.  The values keep the data type they had in the scaler.
+    """
+    arrays = {}
+    for section in SCALER_SECTIONS:
+        values = train_data_scaler[section]
+        if hasattr(values, 'data_vars'):
+            # xarray Dataset of 0-d variables
+            names = list(values.data_vars)
+            arrays[section] = np.array([values[x].values for x in names])
+        else:
+            # pandas Series
+            names = list(values.index)
+            arrays[section] = np.asarray(values.values)
+        arrays[section + '_names'] = np.array(names, dtype=str)
+    return arrays
+
+
+#------------------------------------------------------------
+def load_scaler_npz(npz_file):
+    """
+    Read a scaler written by convert_scaler().
+
+    Returns
+    -------
+    dict
+        For each section, a dictionary of values by variable name.  This can be used in
+        place of the unpickled scaler.
+    """
+    train_data_scaler = {}
+    with np.load(npz_file, allow_pickle=False) as arrays:
+        for section in SCALER_SECTIONS:
+            names = arrays[section + '_names']
+            values = arrays[section]
+            train_data_scaler[section] = {str(name): values[k] for k, name in enumerate(names)}
+    return train_data_scaler
+
+
+#------------------------------------------------------------
+def convert_scaler(run_dir, out_file=None):
+    """
+    Convert the scaler pickle of a NeuralHydrology run directory.
+
+    Parameters
+    ----------
+    run_dir : str or Path
+        The "run_dir" of the trained model (contains "train_data/train_data_scaler.p").
+    out_file : str or Path, optional
+        Where to write the ".npz" file.  By default it is written next to the pickle.
+
+    Returns
+    -------
+    Path
+        The file that was written.
+    """
+    p_file = Path(run_dir) / 'train_data' / SCALER_PICKLE_FILE
+    if out_file is None:
+        out_file = p_file.with_name(SCALER_NPZ_FILE)
+
+    with open(p_file, 'rb') as fb:
+        train_data_scaler = pickle.load(fb)
+
+    np.savez(out_file, **scaler_to_arrays(train_data_scaler))
+    return Path(out_file)
+
+
+#------------------------------------------------------------
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Convert NeuralHydrology scaler pickles to .npz files.")
+    parser.add_argument('run_dirs', nargs='+', help="run directories of the trained models")
+    args = parser.parse_args(args)
+
+    for run_dir in args.run_dirs:
+        out_file = convert_scaler(run_dir)
+        print('Wrote', out_file)
+
+
+if __name__ == '__main__':
+    main()
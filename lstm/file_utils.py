@@ -0,0 +1,57 @@
+"""Small helpers for the files the package reads and writes."""
+
+import contextlib
+import os
+from pathlib import Path
+
+import numpy as np
+
+
+#------------------------------------------------------------
+@contextlib.contextmanager
+def atomic_write(path, mode='wb'):
+    """
+    Open a file for writing so that it only appears, complete, when the block ends.
+
+    The data are written to a temporary file next to ``path`` (named after this
+    process), which then replaces ``path``, so that other processes never read a
+    partial file.  If the block raises, the temporary file is removed and ``path``
+    is left as it was.
+
+        with file_utils.atomic_write(path) as fb:
+            fb.write(blob)
+    """
+    path = Path(path)
+    tmp_path = path.with_name('{}.{}.tmp'.format(path.name, os.getpid()))
+    try:
+        with open(tmp_path, mode) as fp:
+            yield fp
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp_path)
+        raise
+
+
+#------------------------------------------------------------
+def fill_value_mask(values, variable):
+    """
+    Where values read from a netCDF variable are its fill values.
+
+    The forcing readers turn off the automatic masking of netCDF4 (masked arrays
+    are slow to make for every chunk), so a chunk holds the raw numbers of the
+    file, fill values included.  This finds the values netCDF4 would have masked:
+    the '_FillValue' and 'missing_value' attributes of the variable, or the
+    default netCDF fill value without a '_FillValue'.  The readers raise a
+    ValueError at the first one, as the LSTM cannot run on a missing forcing
+    (a NaN would stay in its states for all the later time steps).
+    """
+    attrs = variable.ncattrs()
+    fill_values = [variable.getncattr(x) for x in ('_FillValue', 'missing_value') if x in attrs]
+    if '_FillValue' not in attrs and variable.dtype.kind in 'fiu' and variable.dtype.itemsize > 1:
+        from netCDF4 import default_fillvals
+        fill_values.append(default_fillvals[variable.dtype.str[1:]])
+    missing = np.zeros(np.shape(values), dtype=bool)
+    for fill_value in np.ravel(fill_values):
+        missing |= values == fill_value
+    return missing
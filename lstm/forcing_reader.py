@@ -0,0 +1,133 @@
+"""Read the forcings of one basin from a netCDF file, a chunk of time steps at a time.
+
+The netCDF file has one (basin, time) variable per forcing, as
+data/usgs-streamflow-nldas_hourly.nc, named by either the short name of the
+LSTM input (e.g. "temperature") or its CSDMS standard name.  Each chunk is an
+array of shape (T, n_dynamic), with the columns in the order of the
+'dynamic_inputs' of the trained model, ready for bmi_LSTM.update_block().  Only
+one chunk is in memory at a time, so the length of the file does not matter.
+A fill value in the file is an error (see lstm.file_utils.fill_value_mask).
+
+    reader = forcing_reader.NetCDFForcingReader.from_bmi(model, data_file, basin='01022500')
+    for block in reader.chunks():
+        streamflow = model.update_block(block)
+"""
+
+import numpy as np
+from netCDF4 import Dataset
+
+import lstm.file_utils as file_utils
+import lstm.prefetch as prefetch_module
+
+
+#--------------------------------------------------------------------------------------------------
+class NetCDFForcingReader():
+    def __init__(self, data_file, dynamic_inputs, long_names, basin=0, chunk_steps=24*30):
+        """
+        Open a netCDF file of forcings for one basin.
+
+        Parameters
+        ----------
+        data_file : str or Path
+            netCDF file with one (basin, time) variable per forcing.
+        dynamic_inputs : list
+            Short names of the dynamic inputs of the trained model, in order.
+        long_names : dict
+            CSDMS standard name for each short name; a variable may be named by either.
+        basin : int or str
+            Row of the basin in the file, or its id in the "basin" variable.
+        chunk_steps : int
+            Number of time steps in each chunk.
+        """
+        self.data_file = data_file
+        self.dynamic_inputs = list(dynamic_inputs)
+        self.chunk_steps = chunk_steps
+
+        self.dataset = Dataset(data_file, 'r')
+        # Raw values, without the cost of masked arrays (fill values are checked for in read())
+        self.dataset.set_auto_mask(False)
+
+        self.variables = []
+        for name in self.dynamic_inputs:
+            if name in self.dataset.variables:
+                self.variables.append(self.dataset[name])
+            elif long_names.get(name) in self.dataset.variables:
+                self.variables.append(self.dataset[long_names[name]])
+            else:
+                self.dataset.close()
+                raise ValueError("Forcing file {} has no variable for '{}'".format(data_file, name))
+
+        # Row or id of the basin, for error messages
+        self.basin = basin
+        if isinstance(basin, str):
+            basin_ids = [str(x) for x in self.dataset['basin'][:]]
+            if basin not in basin_ids:
+                self.dataset.close()
+                raise ValueError("Forcing file {} has no basin '{}'".format(data_file, basin))
+            basin = basin_ids.index(basin)
+        self.basin_index = basin
+        self.n_steps = self.variables[0].shape[-1]
+
+    #------------------------------------------------------------
+    @classmethod
+    def from_bmi(cls, model, data_file, basin=0, chunk_steps=24*30):
+        """Open a netCDF file of forcings for the dynamic inputs of an initialized bmi_LSTM."""
+        return cls(data_file, model.cfg_train['dynamic_inputs'], model._var_name_map_short_first,
+                   basin, chunk_steps)
+
+    #------------------------------------------------------------
+    def read(self, start, end, out=None):
+        """
+        Read the forcings of time steps [start, end).
+
+        Parameters
+        ----------
+        out : np.ndarray, optional
+            Array of shape (at least end - start, n_dynamic) to read into.
+
+        Returns
+        -------
+        np.ndarray
+            Array of shape (end - start, n_dynamic).
+        """
+        end = min(end, self.n_steps)
+        if out is None:
+            out = np.empty((end - start, len(self.variables)), dtype='float64')
+        else:
+            out = out[:end - start]
+        for k, variable in enumerate(self.variables):
+            values = variable[self.basin_index, start:end]
+            missing = file_utils.fill_value_mask(values, variable)
+            if missing.any():
+                raise ValueError("Forcing file {} has a fill value for '{}' of basin {} at time step {}".format(
+                    self.data_file, self.dynamic_inputs[k], self.basin, start + int(np.argmax(missing))))
+            out[:, k] = values
+        return out
+
+    #------------------------------------------------------------
+    def chunks(self, start=0, stop=None, prefetch=0):
+        """
+        Iterate over the forcings of time steps [start, stop), in chunks of ``chunk_steps``.
+
+        With ``prefetch``, that many chunks are read ahead on a background thread
+        (see lstm.prefetch), and each chunk is only valid until the next one is asked for.
+        """
+        stop = self.n_steps if stop is None else min(stop, self.n_steps)
+        bounds = [(chunk_start, min(chunk_start + self.chunk_steps, stop))
+                  for chunk_start in range(start, stop, self.chunk_steps)]
+        if prefetch:
+            return iter(prefetch_module.Prefetcher(self.read, bounds, (self.chunk_steps, len(self.variables)),
+                                                   n_buffers=prefetch))
+        return (self.read(chunk_start, chunk_end) for chunk_start, chunk_end in bounds)
+
+    #------------------------------------------------------------
+    def close(self):
+        self.dataset.close()
+
+    #------------------------------------------------------------
+    def __enter__(self):
+        return self
+
+    #------------------------------------------------------------
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,242 @@
+"""Parallel-in-time hindcast of one basin.
+
+A long hindcast (e.g. decades of hourly forcings) is a long chain of LSTM time
+steps.  Since the LSTM forgets its initial state after a warm-up period, the
+period can instead be split into chunks that run at the same time in a process
+pool.  Each chunk after the first starts from zero states some time steps before
+its own start (the warm-up overlap), and only its outputs from its start on are
+kept.  The outputs of the chunks are then put back together.
+
+In each overlap, the outputs of the warming-up chunk are compared with those of
+the chunk before it (which has run through that period from its own start).  The
+report shows how far apart they still are at the end of the overlap, so that the
+warm-up length can be chosen: if the difference at the end of the overlap is
+small, the chunked hindcast is as good as a serial one.
+
+Usage:
+    python -m lstm.hindcast ./bmi_config_files/01022500_hourly_all_attributes_forcings.yml forcings.csv \\
+        --chunk-steps 8760 --warmup-steps 4380 --workers 32 --output hindcast.csv --report overlap.json
+
+The forcing file is a CSV file as for the spin-up (see lstm.spinup): a "time" column
+and one column for each dynamic input of the trained model.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import torch
+import yaml
+
+import lstm.bmi_lstm as bmi_lstm
+import lstm.spinup as spinup
+
+# Options of the BMI configuration that only give the initial states
+INITIAL_STATE_OPTIONS = ['initial_state_file', 'initial_state_id',
+                         'spinup_forcing_file', 'spinup_start_date', 'spinup_end_date', 'spinup_cache_dir']
+
+
+#------------------------------------------------------------
+def chunk_bounds(n_steps, chunk_steps, warmup_steps):
+    """
+    Split ``n_steps`` time steps into chunks.
+
+    Returns
+    -------
+    list
+        (warmup_start, start, end) for each chunk: the chunk is run over
+        [warmup_start, end) and its outputs over [start, end) are kept.
+        The first chunk has no warm-up.
+    """
+    bounds = []
+    for start in range(0, n_steps, chunk_steps):
+        end = min(start + chunk_steps, n_steps)
+        warmup_start = 0 if start == 0 else max(0, start - warmup_steps)
+        bounds.append((warmup_start, start, end))
+    return bounds
+
+
+#------------------------------------------------------------
+def _set_torch_threads(n_threads):
+    torch.set_num_threads(n_threads)
+
+
+#------------------------------------------------------------
+def write_zero_state_config(bmi_cfg_file, out_file):
+    """
+    Write a copy of a BMI configuration that starts from zero states, for the chunks after the first.
+
+    The initial state and spin-up options are left out, so that initialize()
+    does not read or compute states that the chunk would not use.
+    """
+    with open(bmi_cfg_file, 'r') as fp:
+        cfg = yaml.safe_load(fp)
+    for option in INITIAL_STATE_OPTIONS:
+        cfg.pop(option, None)
+    cfg['initial_state'] = 'zero'
+    with open(out_file, 'w') as fp:
+        yaml.safe_dump(cfg, fp)
+
+
+#------------------------------------------------------------
+def run_chunk(bmi_cfg_file, forcings):
+    """
+    Run one chunk of the hindcast in a new model.
+
+    Parameters
+    ----------
+    bmi_cfg_file : str or Path
+        BMI configuration file of the basin (see write_zero_state_config() for the
+        chunks after the first).
+    forcings : np.ndarray
+        Forcings of the chunk, including its warm-up, of shape (T, n_dynamic).
+
+    Returns
+    -------
+    np.ndarray
+        Streamflow (m3 s-1) at each of the T time steps.
+    """
+    model = bmi_lstm.bmi_LSTM()
+    with contextlib.redirect_stdout(io.StringIO()):
+        model.initialize(bmi_cfg_file)
+    outputs = model.update_block(forcings)
+    model.finalize()
+    return outputs
+
+
+#------------------------------------------------------------
+def overlap_report(streamflow, chunk_outputs, bounds, tolerance):
+    """
+    Compare the warm-up outputs of each chunk with the kept outputs of the chunks before it.
+
+    Returns
+    -------
+    list
+        For each chunk after the first: its start, the number of overlap steps, the largest,
+        mean and final absolute difference (m3 s-1) in the overlap, the final difference
+        relative to the mean flow in the overlap, and the number of overlap steps it took
+        to stay within ``tolerance`` (None if it never did).
+    """
+    report = []
+    for k in range(1, len(bounds)):
+        warmup_start, start, _ = bounds[k]
+        n_overlap = start - warmup_start
+        if n_overlap == 0:
+            continue
+        reference = streamflow[warmup_start:start]
+        diff = np.abs(chunk_outputs[k][:n_overlap] - reference)
+        outside = np.nonzero(diff > tolerance)[0]
+        steps_to_tolerance = 0 if outside.size == 0 else int(outside[-1]) + 1
+        mean_flow = float(np.mean(np.abs(reference)))
+        report.append({'chunk': k,
+                       'start': int(start),
+                       'overlap_steps': int(n_overlap),
+                       'max_abs_diff': float(diff.max()),
+                       'mean_abs_diff': float(diff.mean()),
+                       'final_abs_diff': float(diff[-1]),
+                       'final_rel_diff': float(diff[-1] / mean_flow) if mean_flow > 0 else None,
+                       'steps_to_tolerance': steps_to_tolerance if steps_to_tolerance < n_overlap else None})
+    return report
+
+
+#------------------------------------------------------------
+def run_hindcast(bmi_cfg_file, forcings, chunk_steps, warmup_steps, workers=None, threads_per_worker=1,
+                 tolerance=1e-3):
+    """
+    Run a hindcast of one basin in chunks, in parallel.
+
+    Parameters
+    ----------
+    bmi_cfg_file : str or Path
+        BMI configuration file of the basin.
+    forcings : np.ndarray
+        Forcings of the whole period, of shape (T, n_dynamic).
+    chunk_steps : int
+        Number of time steps kept from each chunk.
+    warmup_steps : int
+        Number of time steps each chunk (after the first) is started before its start.
+    workers : int, optional
+        Number of processes (by default, the number of processors).
+    threads_per_worker : int
+        Number of PyTorch threads in each process.
+    tolerance : float
+        Difference (m3 s-1) within which a warm-up counts as converged, for the report.
+
+    Returns
+    -------
+    (np.ndarray, list)
+        Streamflow (m3 s-1) at each of the T time steps, and the overlap report
+        (see overlap_report()).
+    """
+    forcings = np.asarray(forcings, dtype='float64')
+    bounds = chunk_bounds(forcings.shape[0], chunk_steps, warmup_steps)
+
+    with tempfile.TemporaryDirectory() as tmp_dir, \
+         ProcessPoolExecutor(max_workers=workers, initializer=_set_torch_threads,
+                             initargs=(threads_per_worker,)) as pool:
+        zero_state_cfg_file = Path(tmp_dir) / 'zero_state.yml'
+        write_zero_state_config(bmi_cfg_file, zero_state_cfg_file)
+        futures = [pool.submit(run_chunk, bmi_cfg_file if k == 0 else zero_state_cfg_file,
+                               forcings[warmup_start:end])
+                   for k, (warmup_start, start, end) in enumerate(bounds)]
+        chunk_outputs = [f.result() for f in futures]
+
+    streamflow = np.empty(forcings.shape[0], dtype='float64')
+    for k, (warmup_start, start, end) in enumerate(bounds):
+        streamflow[start:end] = chunk_outputs[k][start - warmup_start:]
+
+    return streamflow, overlap_report(streamflow, chunk_outputs, bounds, tolerance)
+
+
+#------------------------------------------------------------
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Run a hindcast of one basin in parallel chunks.")
+    parser.add_argument('bmi_cfg_file', help="BMI configuration file of the basin")
+    parser.add_argument('forcing_file', help="CSV file with a time column and the dynamic inputs")
+    parser.add_argument('--start-date', help="first day of the hindcast (DD/MM/YYYY)")
+    parser.add_argument('--end-date', help="last day of the hindcast (DD/MM/YYYY)")
+    parser.add_argument('--chunk-steps', type=int, default=24*365, help="time steps kept from each chunk")
+    parser.add_argument('--warmup-steps', type=int, default=24*180, help="warm-up overlap of each chunk")
+    parser.add_argument('--workers', type=int, help="number of processes (default: number of processors)")
+    parser.add_argument('--threads-per-worker', type=int, default=1, help="PyTorch threads in each process")
+    parser.add_argument('--tolerance', type=float, default=1e-3, help="convergence tolerance (m3 s-1) for the report")
+    parser.add_argument('--output', default='hindcast.csv', help="CSV file to write the streamflow to")
+    parser.add_argument('--report', help="JSON file to write the overlap report to")
+    args = parser.parse_args(args)
+
+    # The trained model tells which forcings to read
+    model = bmi_lstm.bmi_LSTM()
+    with contextlib.redirect_stdout(io.StringIO()):
+        model.initialize(args.bmi_cfg_file)
+    def day(date):
+        return None if date is None else pd.to_datetime(date, format='%d/%m/%Y')
+    forcings, times = spinup.read_spinup_forcings(args.forcing_file, model.cfg_train['dynamic_inputs'],
+                                                  model._var_name_map_short_first,
+                                                  day(args.start_date), day(args.end_date), return_times=True)
+
+    streamflow, report = run_hindcast(args.bmi_cfg_file, forcings, args.chunk_steps, args.warmup_steps,
+                                      args.workers, args.threads_per_worker, args.tolerance)
+
+    table = pd.DataFrame({'streamflow_cms': streamflow})
+    if times is not None:
+        table.insert(0, 'time', times)
+    table.to_csv(args.output, index=False)
+    print('Wrote', args.output)
+
+    for entry in report:
+        print('chunk {chunk:4d}  overlap {overlap_steps:6d} steps  final difference {final_abs_diff:.3g} m3 s-1'.format(**entry))
+    if args.report:
+        with open(args.report, 'w') as fp:
+            json.dump({'chunk_steps': args.chunk_steps, 'warmup_steps': args.warmup_steps,
+                       'tolerance': args.tolerance, 'chunks': report}, fp, indent=2)
+        print('Wrote', args.report)
+
+
+if __name__ == '__main__':
+    main()
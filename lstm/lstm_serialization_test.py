@@ -14,8 +14,10 @@ from netCDF4 import Dataset
 # This is the BMI LSTM that we will be running
 import bmi_lstm
 
+# Saves and restores the model state
+import model_state
+
 # Additional imports
-import pickle
 import numpy as np
 
 
@@ -86,34 +88,34 @@ for k in range(n1_steps):
 print('Ran LSTM model for', n1_steps, 'time steps.')
 
 
-# ### Serialize the first model with pickle as binary
+# ### Save a snapshot of the state of the first model
+# 
+# Only the time, the LSTM states, the inputs and the outputs are saved (a few kilobytes), not the whole model.
 
 # In[6]:
 
 
-pkl_file = './model1_state.pkl'
-pkl_unit = open('./model1_state.pkl', 'wb')
-pickle.dump( model1, pkl_unit )
-pkl_unit.close()
-print('Model 1 state serialized to binary file:', pkl_file)
+state_file = './model1_state.npz'
+model_state.save_states( state_file, {model1.cfg_bmi['basin_id']: model1.get_state()} )
+print('Model 1 state saved to file:', state_file)
 
 
-# ### Deserialize first model into model 2
+# ### Restore the state of the first model into model 2
 
 # In[7]:
 
 
-pkl_unit = open('./model1_state.pkl', 'rb')
-model2 = pickle.load( pkl_unit )
-pkl_unit.close()
-print('Model 2 state deserialized from binary file:', pkl_file)
+model2 = bmi_lstm.bmi_LSTM()
+model2.initialize(bmi_cfg_file=Path('./bmi_config_files/01022500_hourly_slope_mean_precip_temp.yml'))
+model2.set_state( model_state.load_states( state_file )[model1.cfg_bmi['basin_id']] )
+print('Model 2 state restored from file:', state_file)
 
 runoff_output_list2 = runoff_output_list1.copy()  #### need copy()
 
 
 # ### Run both models for another n2_steps
 # 
-# Note that model2.initialize() was not called, and model2.update() has not been called before now.  The entire model2 state was read from the pkl_file we created for model1.
+# Note that model2.update() has not been called before now.  The model2 state (time, LSTM states and inputs) was read from the state_file we created for model1.
 
 # In[8]:
 
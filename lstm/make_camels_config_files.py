@@ -0,0 +1,179 @@
+"""Write the BMI configuration files of many CAMELS basins, for one or more trained models.
+
+The basin list is joined against all the CAMELS attribute tables at once (see
+lstm.attribute_store), and the text of every configuration file is built column
+by column for all the basins together.  Every static attribute of each trained
+model must be one that bmi_LSTM has a variable for, and be in the tables (with a
+value for every basin).  Files whose text has not changed are not written again,
+and the others are written in parallel.
+
+Usage (from the top directory of the repository):
+    python -m lstm.make_camels_config_files --basin-list ./data/camels_basin_list_516.txt \\
+        --train-cfg-file ./trained_neuralhydrology_models/hourly_all_attributes_and_forcings/config.yml \\
+        --output-dir ./bmi_config_files/camels --name-template '{basin_id}_{model}.yml'
+
+The 'train_cfg_file' paths are written to the configuration files as given, so
+they are relative to --root-dir, the directory the model is run from.  The
+basin list and the CAMELS attribute files default to those under --root-dir.
+"""
+
+import argparse
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pandas as pd
+import yaml
+
+import lstm.attribute_store as attribute_store
+import lstm.bmi_lstm as bmi_lstm
+import lstm.run_basins as run_basins
+
+BASIN_LIST = './data/camels_basin_list_516.txt'
+TRAIN_CFG_FILE = './trained_neuralhydrology_models/hourly_all_attributes_and_forcings/config.yml'
+
+
+#------------------------------------------------------------
+def quoted(values):
+    """YAML single-quoted strings."""
+    return "'" + values.astype(str).str.replace("'", "''", regex=False) + "'"
+
+
+#------------------------------------------------------------
+def config_texts(attributes, train_cfg_file, static_attributes, initial_state='zero'):
+    """
+    Text of the configuration file of every basin, for one trained model.
+
+    Parameters
+    ----------
+    attributes : pd.DataFrame
+        CAMELS attributes of the basins, indexed by basin id.
+    train_cfg_file : str
+        Training configuration file of the model, as written to the files.
+    static_attributes : list
+        Static attributes of the model.
+
+    Returns
+    -------
+    pd.Series
+        Text of each file, indexed by basin id.
+    """
+    basin_ids = pd.Series(attributes.index, index=attributes.index)
+    fields = [('time_step', "'1 hour'"),
+              ('initial_state', "'{}'".format(initial_state)),
+              ('basin_name', quoted(attributes['gauge_name'])),
+              ('basin_id', quoted(basin_ids)),
+              ('area_sqkm', attributes[attribute_store.AREA_ATTRIBUTE].astype(str)),
+              ('lat', attributes['gauge_lat'].astype(str)),
+              ('lon', attributes['gauge_lon'].astype(str)),
+              ('train_cfg_file', str(train_cfg_file)),
+              ('verbose', '0')]
+    fields += [(name, attributes[name].astype(str)) for name in static_attributes]
+
+    texts = pd.Series('', index=attributes.index)
+    for key, values in fields:
+        texts = texts + key + ': ' + values + '\n'
+    return texts
+
+
+#------------------------------------------------------------
+def write_if_changed(path, text):
+    """Write a file unless it already has this text.  Returns True if it was written."""
+    try:
+        with open(path, 'r') as fp:
+            if fp.read() == text:
+                return False
+    except FileNotFoundError:
+        pass
+    with open(path, 'w') as fp:
+        fp.write(text)
+    return True
+
+
+#------------------------------------------------------------
+def make_config_files(basin_ids, attributes, train_cfg_files, output_dir, name_template='{basin_id}_{model}.yml',
+                      root_dir='.', workers=None):
+    """
+    Write the configuration files of many basins, for each trained model.
+
+    Returns
+    -------
+    (int, int)
+        Number of files written, and number of files that were already up to date.
+    """
+    missing = [x for x in basin_ids if x not in attributes.index]
+    if missing:
+        raise ValueError("No CAMELS attributes for basins {}".format(missing))
+    attributes = attributes.loc[basin_ids]
+
+    # bmi_LSTM could not be given (and would not initialize with) an attribute it has no variable for
+    bmi_names = set(short_name for short_name, _ in bmi_lstm.bmi_LSTM._var_name_units_map.values())
+
+    paths, texts = [], []
+    for train_cfg_file in train_cfg_files:
+        with open(Path(root_dir) / train_cfg_file, 'r') as fp:
+            cfg_train = yaml.safe_load(fp)
+        static_attributes = cfg_train.get('static_attributes') or []
+        unknown = [x for x in static_attributes if x not in bmi_names]
+        if unknown:
+            raise ValueError("{} takes static attributes {} that bmi_LSTM has no variable for".format(
+                train_cfg_file, unknown))
+        absent = [x for x in static_attributes if x not in attributes.columns]
+        if absent:
+            raise ValueError("{} takes static attributes {} that are not in the CAMELS tables".format(
+                train_cfg_file, absent))
+        incomplete = attributes[static_attributes].isna().any(axis=1)
+        if incomplete.any():
+            raise ValueError("{} takes static attributes that basins {} have no value for".format(
+                train_cfg_file, list(incomplete.index[incomplete])))
+
+        model = cfg_train.get('experiment_name', Path(train_cfg_file).parent.name)
+        model_texts = config_texts(attributes, train_cfg_file, static_attributes)
+        paths += [Path(output_dir) / name_template.format(basin_id=x, model=model) for x in model_texts.index]
+        texts += list(model_texts)
+
+    if len(set(paths)) != len(paths):
+        raise ValueError("The name template '{}' gives the same file for more than one configuration".format(
+            name_template))
+
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        written = list(pool.map(write_if_changed, paths, texts))
+    return sum(written), len(written) - sum(written)
+
+
+#------------------------------------------------------------
+def main(args=None, root_dir='.', output_dir='./bmi_config_files/camels'):
+    """
+    Run from the command line.
+
+    ``root_dir`` and ``output_dir`` are the defaults of --root-dir and --output-dir,
+    for the copies of this script that are run from other directories.
+    """
+    parser = argparse.ArgumentParser(description="Write the BMI configuration files of many CAMELS basins.")
+    parser.add_argument('--basin-list', help="file with one basin id per line (default: {} under --root-dir)".format(
+        BASIN_LIST))
+    parser.add_argument('--camels-dir', help="directory of the CAMELS attribute files (default: {} under "
+                                             "--root-dir)".format(attribute_store.CAMELS_DIR))
+    parser.add_argument('--train-cfg-file', action='append', dest='train_cfg_files',
+                        help="training configuration file of a trained model, relative to --root-dir "
+                             "(may be given more than once)")
+    parser.add_argument('--root-dir', default=root_dir, help="directory the model is run from")
+    parser.add_argument('--output-dir', default=output_dir, help="directory to write the files to")
+    parser.add_argument('--name-template', default='{basin_id}_{model}.yml',
+                        help="file name, from {basin_id} and {model} (the experiment name of the trained model)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="number of threads writing files")
+    args = parser.parse_args(args)
+
+    basin_list = args.basin_list or Path(args.root_dir) / BASIN_LIST
+    camels_dir = args.camels_dir or Path(args.root_dir) / attribute_store.CAMELS_DIR
+    basin_ids = run_basins.read_basin_list(basin_list)
+    attributes = attribute_store.read_camels_attributes(camels_dir)
+    n_written, n_unchanged = make_config_files(basin_ids, attributes, args.train_cfg_files or [TRAIN_CFG_FILE],
+                                               args.output_dir, args.name_template, args.root_dir, args.workers)
+    print('Wrote {} configuration files ({} already up to date) in {}'.format(n_written, n_unchanged,
+                                                                              args.output_dir))
+
+
+if __name__ == '__main__':
+    main()
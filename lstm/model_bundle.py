@@ -0,0 +1,200 @@
+"""Pack a trained LSTM into a single memory-mappable file.
+
+A trained model is normally spread over the training configuration ("config.yml"),
+the weights ("model_epochNNN.pt") and the scaler ("train_data/train_data_scaler.p").
+A bundle holds everything bmi_LSTM needs from these in one file:
+
+    magic (8 bytes) | version (uint32) | header length (uint32) | JSON header | arrays
+
+The JSON header holds the training configuration and, for each array, its offset,
+shape and data type.  The arrays (the LSTM weights as float32, and the input and
+output scalers) are stored raw, each starting on a 64-byte boundary, so that they
+can be used directly from a memory map of the file.  All the processes on a node
+that load the same bundle then share one copy of the weights in the page cache.
+
+Usage:
+    python -m lstm.model_bundle ./trained_neuralhydrology_models/hourly_slope_mean_precip_temp/config.yml model.lstmb
+
+and in the BMI configuration file, instead of "train_cfg_file":
+    model_bundle: ./model.lstmb
+"""
+
+import argparse
+import json
+import struct
+from pathlib import Path
+
+import numpy as np
+import torch
+from torch import nn
+
+import lstm.nextgen_cuda_lstm as nextgen_cuda_lstm
+
+BUNDLE_MAGIC = b'LSTMBNDL'
+BUNDLE_VERSION = 1
+ALIGNMENT = 64
+
+# Names of the LSTM weights, as in the state dict of Nextgen_CudaLSTM
+WEIGHT_NAMES = ['lstm.weight_ih_l0', 'lstm.weight_hh_l0', 'lstm.bias_ih_l0', 'lstm.bias_hh_l0',
+                'head.weight', 'head.bias']
+
+
+#------------------------------------------------------------
+def _aligned(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+#------------------------------------------------------------
+def write_bundle(out_file, raw_cfg_train, all_lstm_inputs, state_dict, input_mean, input_std, out_mean, out_std):
+    """
+    Write a bundle file.
+
+    Parameters
+    ----------
+    out_file : str or Path
+        The bundle file to write.
+    raw_cfg_train : dict
+        The training configuration as read from its YAML file (not parsed).
+    all_lstm_inputs : list
+        Short names of all the LSTM inputs, in the order the LSTM expects them.
+    state_dict : dict
+        Weights of the Nextgen_CudaLSTM.
+    input_mean, input_std : np.ndarray
+        Training set scalers for the inputs.
+    out_mean, out_std : float
+        Training set scalers for the LSTM output.
+    """
+    arrays = {name: state_dict[name].detach().cpu().numpy().astype('float32') for name in WEIGHT_NAMES}
+    arrays['input_mean'] = np.asarray(input_mean)
+    arrays['input_std'] = np.asarray(input_std)
+    arrays['out_mean'] = np.asarray(out_mean)
+    arrays['out_std'] = np.asarray(out_std)
+
+    # Lay out the arrays after the header; the header length is only known once
+    # the offsets are in it, so offsets are relative to the start of the data.
+    table = {}
+    offset = 0
+    for name, array in arrays.items():
+        offset = _aligned(offset)
+        table[name] = {'offset': offset, 'shape': list(array.shape), 'dtype': array.dtype.str}
+        offset += array.nbytes
+
+    header = {'cfg_train': raw_cfg_train,
+              'all_lstm_inputs': list(all_lstm_inputs),
+              'arrays': table}
+    header_bytes = json.dumps(header, default=str).encode('utf-8')
+    prefix_length = len(BUNDLE_MAGIC) + 8 + len(header_bytes)
+    data_start = _aligned(prefix_length)
+    header_bytes += b' ' * (data_start - prefix_length)
+
+    with open(out_file, 'wb') as fb:
+        fb.write(BUNDLE_MAGIC)
+        fb.write(struct.pack('<II', BUNDLE_VERSION, len(header_bytes)))
+        fb.write(header_bytes)
+        for name, array in arrays.items():
+            fb.seek(data_start + table[name]['offset'])
+            fb.write(np.ascontiguousarray(array).tobytes())
+
+
+#------------------------------------------------------------
+def read_bundle(bundle_file):
+    """
+    Memory-map a bundle file.
+
+    Returns
+    -------
+    header : dict
+        The JSON header (raw training configuration, input names and array table).
+    arrays : dict
+        The arrays, as views of a copy-on-write memory map of the file.  The pages are
+        shared with every other process that maps the same file, as long as they are
+        not written to.
+    """
+    with open(bundle_file, 'rb') as fb:
+        magic = fb.read(len(BUNDLE_MAGIC))
+        if magic != BUNDLE_MAGIC:
+            raise ValueError("{} is not an LSTM model bundle".format(bundle_file))
+        version, header_length = struct.unpack('<II', fb.read(8))
+        if version != BUNDLE_VERSION:
+            raise ValueError("Unsupported LSTM model bundle version {} in {}".format(version, bundle_file))
+        header = json.loads(fb.read(header_length).decode('utf-8'))
+    data_start = len(BUNDLE_MAGIC) + 8 + header_length
+
+    mapped = np.memmap(bundle_file, dtype='uint8', mode='c').view(np.ndarray)
+    arrays = {}
+    for name, info in header['arrays'].items():
+        dtype = np.dtype(info['dtype'])
+        start = data_start + info['offset']
+        count = int(np.prod(info['shape'], dtype='int64'))
+        arrays[name] = mapped[start:start + count * dtype.itemsize].view(dtype).reshape(info['shape'])
+    return header, arrays
+
+
+#------------------------------------------------------------
+def lstm_from_bundle(header, arrays):
+    """
+    Create a Nextgen_CudaLSTM whose weights are the memory-mapped arrays of a bundle.
+
+    The weights are not copied: the parameters of the LSTM are tensors that share
+    memory with the memory map.
+    """
+    cfg_train = header['cfg_train']
+    weight_ih = arrays['lstm.weight_ih_l0']
+    lstm_model = nextgen_cuda_lstm.Nextgen_CudaLSTM(input_size=weight_ih.shape[1],
+                                                    hidden_layer_size=cfg_train['hidden_size'],
+                                                    output_size=arrays['head.weight'].shape[0],
+                                                    batch_size=1,
+                                                    seq_length=1)
+    for name in WEIGHT_NAMES:
+        module_name, parameter_name = name.split('.')
+        parameter = nn.Parameter(torch.from_numpy(arrays[name]), requires_grad=False)
+        setattr(getattr(lstm_model, module_name), parameter_name, parameter)
+    return lstm_model
+
+
+#------------------------------------------------------------
+def build_bundle(train_cfg_file, out_file):
+    """
+    Pack the trained LSTM of a NeuralHydrology training configuration into a bundle.
+
+    Parameters
+    ----------
+    train_cfg_file : str or Path
+        Training configuration file of the trained model (as "train_cfg_file" in the
+        BMI configuration).
+    out_file : str or Path
+        The bundle file to write.
+    """
+    # Imported here since bmi_lstm reads bundles with this module
+    import yaml
+    import lstm.bmi_lstm as bmi_lstm
+
+    with open(train_cfg_file, 'r') as fp:
+        raw_cfg_train = yaml.safe_load(fp)
+
+    # Use the BMI model itself to read the configuration, scalers and weights,
+    # so that they are exactly as in a normal initialize()
+    model = bmi_lstm.bmi_LSTM()
+    model.cfg_bmi = {'train_cfg_file': Path(train_cfg_file)}
+    model.get_training_configurations()
+    model.get_scaler_values()
+    model.load_trained_weights()
+
+    write_bundle(out_file, raw_cfg_train, model.all_lstm_inputs, model.lstm.state_dict(),
+                 model.input_mean, model.input_std, model.out_mean, model.out_std)
+    return Path(out_file)
+
+
+#------------------------------------------------------------
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Pack a trained LSTM into a single model bundle file.")
+    parser.add_argument('train_cfg_file', help="training configuration file of the trained model")
+    parser.add_argument('out_file', help="bundle file to write")
+    args = parser.parse_args(args)
+
+    out_file = build_bundle(args.train_cfg_file, args.out_file)
+    print('Wrote', out_file)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+# Basic utilities
+import os
+from collections import OrderedDict
+from pathlib import Path
+
+#--------------------------------------------------------------------------------------------------
+# Process-wide cache of trained LSTMs.
+#
+# ngen creates one bmi_LSTM per catchment, and most catchments use the same trained model.  Reading
+# the training configuration, the scaler pickle and the weights is the same work every time, so the
+# results are kept here and shared (read-only) by every bmi_LSTM that uses the same training
+# configuration file.  An entry is reloaded if any of its files changed on disk, and the least
+# recently used entry is dropped once more than max_size distinct models are in use.
+#--------------------------------------------------------------------------------------------------
+class TrainedModel():
+    def __init__(self, cfg_train, lstm, all_lstm_inputs, input_mean, input_std, out_mean, out_std, source_files):
+        """
+        Everything read from a trained model that is the same for every catchment.
+
+        Parameters
+        ----------
+        cfg_train : dict
+            Parsed training configuration.
+        lstm : Nextgen_CudaLSTM
+            LSTM with the trained weights loaded.
+        all_lstm_inputs : list
+            Short names of all the LSTM inputs, in the order the LSTM expects them.
+        input_mean, input_std : np.ndarray
+            Training set scalers for the inputs.  Made read-only, since they are shared.
+        out_mean, out_std : float
+            Training set scalers for the LSTM output.
+        source_files : list
+            Files the model was read from.  Their modification times are recorded, and the
+            entry is considered stale if any of them changes.
+        """
+        self.cfg_train = cfg_train
+        self.lstm = lstm
+        self.all_lstm_inputs = all_lstm_inputs
+        self.input_mean = input_mean
+        self.input_std = input_std
+        self.input_mean.flags.writeable = False
+        self.input_std.flags.writeable = False
+        self.out_mean = out_mean
+        self.out_std = out_std
+        self.source_mtimes = {str(Path(f).resolve()): os.stat(f).st_mtime_ns for f in source_files}
+
+        # NumPy copy of the (unfolded) LSTM, created by the first bmi_LSTM that needs it
+        self.numpy_lstm = None
+
+        # Hash of the weights and scalers (see lstm.spinup), computed when first needed
+        self.model_hash = None
+
+    #------------------------------------------------------------
+    def is_current(self):
+        """True if none of the source files changed since the model was read."""
+        try:
+            return all(os.stat(f).st_mtime_ns == mtime for f, mtime in self.source_mtimes.items())
+        except OSError:
+            return False
+
+
+#--------------------------------------------------------------------------------------------------
+class TrainedModelCache():
+    def __init__(self, max_size=8):
+        """
+        Least recently used cache of TrainedModel objects.
+
+        Parameters
+        ----------
+        max_size : int
+            Number of distinct trained models to keep.
+        """
+        self.max_size = max_size
+        self._entries = OrderedDict()
+
+    #------------------------------------------------------------
+    @staticmethod
+    def key(train_cfg_file):
+        return str(Path(train_cfg_file).resolve())
+
+    #------------------------------------------------------------
+    def get(self, train_cfg_file):
+        """
+        Get the cached model for a training configuration file.
+
+        Returns
+        -------
+        TrainedModel or None
+            None if the model is not cached, or if its files changed since it was cached.
+        """
+        key = self.key(train_cfg_file)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if not entry.is_current():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    #------------------------------------------------------------
+    def put(self, train_cfg_file, entry):
+        key = self.key(train_cfg_file)
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        return entry
+
+    #------------------------------------------------------------
+    def clear(self):
+        self._entries.clear()
+
+    #------------------------------------------------------------
+    def __len__(self):
+        return len(self._entries)
+
+
+# The one cache shared by every bmi_LSTM in this process
+trained_model_cache = TrainedModelCache()
@@ -0,0 +1,127 @@
+"""Compact snapshots of the state of a bmi_LSTM.
+
+A snapshot holds only what changes during a run: the model time, the LSTM hidden
+and cell states, the input buffer (forcings and static attributes) and the
+outputs.  The trained weights and configuration are not included, so a snapshot
+is restored into a model that was initialized with the same BMI configuration.
+
+A snapshot is a small binary blob:
+
+    magic (8 bytes) | version (uint32) | hidden size (uint32) | number of inputs (uint32)
+    | number of outputs (uint32) | t (float64) | h_t (float32) | c_t (float32)
+    | inputs (float64) | outputs (float64)
+
+all little-endian.  Many snapshots (e.g. one per catchment of a domain) can be
+saved in and loaded from one file with save_states() and load_states().
+"""
+
+import struct
+
+import numpy as np
+
+STATE_MAGIC = b'LSTMSTAT'
+STATE_VERSION = 1
+_HEADER = struct.Struct('<8sIIIId')
+
+
+#------------------------------------------------------------
+def pack_state(t, h_t, c_t, inputs, outputs):
+    """
+    Pack the state of a model into a snapshot blob.
+
+    Parameters
+    ----------
+    t : float
+        Model time.
+    h_t, c_t : array_like
+        LSTM hidden and cell states (any shape with ``hidden`` elements).
+    inputs : array_like
+        The input buffer of the model, in ``all_lstm_inputs`` order.
+    outputs : array_like
+        The output values of the model.
+
+    Returns
+    -------
+    bytes
+    """
+    h_t = np.asarray(h_t, dtype='<f4').reshape(-1)
+    c_t = np.asarray(c_t, dtype='<f4').reshape(-1)
+    inputs = np.asarray(inputs, dtype='<f8').reshape(-1)
+    outputs = np.asarray(outputs, dtype='<f8').reshape(-1)
+    header = _HEADER.pack(STATE_MAGIC, STATE_VERSION, h_t.size, inputs.size, outputs.size, t)
+    return b''.join([header, h_t.tobytes(), c_t.tobytes(), inputs.tobytes(), outputs.tobytes()])
+
+
+#------------------------------------------------------------
+def unpack_state(blob):
+    """
+    Unpack a snapshot blob made by pack_state().
+
+    Returns
+    -------
+    dict
+        't', 'h_t', 'c_t', 'inputs' and 'outputs'.  The arrays are views of the blob,
+        so copy them before changing them.
+    """
+    if isinstance(blob, np.ndarray):
+        # e.g. the uint8 array given to set_value('serialization_state', ...)
+        blob = blob.tobytes()
+    if len(blob) < _HEADER.size:
+        raise ValueError("LSTM state snapshot is too short ({} bytes)".format(len(blob)))
+    magic, version, n_hidden, n_inputs, n_outputs, t = _HEADER.unpack_from(blob, 0)
+    if magic != STATE_MAGIC:
+        raise ValueError("Not an LSTM state snapshot")
+    if version != STATE_VERSION:
+        raise ValueError("Unsupported LSTM state snapshot version {}".format(version))
+    expected = _HEADER.size + 8 * n_hidden + 8 * n_inputs + 8 * n_outputs
+    if len(blob) != expected:
+        raise ValueError("LSTM state snapshot has {} bytes, expected {}".format(len(blob), expected))
+
+    offset = _HEADER.size
+    h_t = np.frombuffer(blob, dtype='<f4', count=n_hidden, offset=offset)
+    offset += 4 * n_hidden
+    c_t = np.frombuffer(blob, dtype='<f4', count=n_hidden, offset=offset)
+    offset += 4 * n_hidden
+    inputs = np.frombuffer(blob, dtype='<f8', count=n_inputs, offset=offset)
+    offset += 8 * n_inputs
+    outputs = np.frombuffer(blob, dtype='<f8', count=n_outputs, offset=offset)
+    return {'t': t, 'h_t': h_t, 'c_t': c_t, 'inputs': inputs, 'outputs': outputs}
+
+
+#------------------------------------------------------------
+def save_states(out_file, states):
+    """
+    Save many snapshots in one file.
+
+    Parameters
+    ----------
+    out_file : str or Path
+        The ".npz" file to write.
+    states : dict
+        Snapshot blobs by catchment id.  Snapshots of the same trained model all have
+        the same size, and are stored as the rows of one array.
+    """
+    ids = list(states)
+    blobs = [states[x] for x in ids]
+    sizes = {len(x) for x in blobs}
+    if len(sizes) > 1:
+        raise ValueError("All the snapshots saved in one file must have the same size (same trained model)")
+    n_bytes = sizes.pop() if sizes else 0
+    data = np.frombuffer(b''.join(blobs), dtype='uint8').reshape(len(blobs), n_bytes)
+    np.savez(out_file, ids=np.array([str(x) for x in ids], dtype=str), states=data)
+
+
+#------------------------------------------------------------
+def load_states(in_file):
+    """
+    Load the snapshots saved by save_states().
+
+    Returns
+    -------
+    dict
+        Snapshot blobs by catchment id.
+    """
+    with np.load(in_file, allow_pickle=False) as arrays:
+        ids = arrays['ids']
+        data = arrays['states']
+    return {str(x): data[k].tobytes() for k, x in enumerate(ids)}
@@ -12,7 +12,7 @@ class Nextgen_CudaLSTM(nn.Module):
         self.hidden_layer_size = hidden_layer_size
         self.seq_length = seq_length
         self.output_size = output_size
-        self.batch_size = batch_size # We shouldn't neeed to do a higher batch size.
+        self.batch_size = batch_size # Default batch size; forward() follows the batch size of h_t.
         self.lstm = nn.LSTM(self.input_size, self.hidden_layer_size)
         self.head = nn.Linear(self.hidden_layer_size, self.output_size)
 
@@ -20,7 +20,46 @@ class Nextgen_CudaLSTM(nn.Module):
         h_t = h_t.float()
         c_t = c_t.float()
         input_layer = input_layer.float()
-        input_view = input_layer.view(self.seq_length, self.batch_size, self.input_size)
+        # The batch dimension comes from the states, so one call can advance many catchments,
+        # and the sequence length from the input, so one call can run many time steps
+        input_view = input_layer.view(-1, h_t.shape[1], self.input_size)
         output, (h_t, c_t) = self.lstm(input_view, (h_t,c_t))
         prediction = self.head(output)
-        return prediction, h_t, c_t
\ No newline at end of file
+        return prediction, h_t, c_t
+
+    def fold_static_inputs(self, n_dynamic, static_input):
+        """
+        Fold constant inputs into the gate bias.
+
+        The inputs are assumed to be ordered with the ``n_dynamic`` time-varying inputs first and the
+        constant (static) inputs last.  Since ``W_ih @ x = W_ih[:, :n] @ x[:n] + W_ih[:, n:] @ x[n:]``
+        and the second term never changes, it can be computed once and added to ``bias_ih``.
+
+        Parameters
+        ----------
+        n_dynamic : int
+            Number of time-varying inputs that the folded LSTM will take.
+        static_input : torch.Tensor
+            The (already scaled) values of the remaining ``input_size - n_dynamic`` inputs.
+
+        Returns
+        -------
+        Nextgen_CudaLSTM
+            A new LSTM with ``input_size == n_dynamic`` that gives the same outputs as this one.
+            It shares the hidden-to-hidden weights and the head with this LSTM.
+        """
+        folded = Nextgen_CudaLSTM(input_size=n_dynamic,
+                                  hidden_layer_size=self.hidden_layer_size,
+                                  output_size=self.output_size,
+                                  batch_size=self.batch_size,
+                                  seq_length=self.seq_length)
+        with torch.no_grad():
+            weight_ih = self.lstm.weight_ih_l0
+            static_bias = weight_ih[:, n_dynamic:] @ static_input.float().reshape(-1)
+            folded.lstm.weight_ih_l0.copy_(weight_ih[:, :n_dynamic])
+            folded.lstm.bias_ih_l0.copy_(self.lstm.bias_ih_l0 + static_bias)
+        # The rest is unchanged, so share it rather than copy it
+        folded.lstm.weight_hh_l0 = self.lstm.weight_hh_l0
+        folded.lstm.bias_hh_l0 = self.lstm.bias_hh_l0
+        folded.head = self.head
+        return folded
@@ -0,0 +1,155 @@
+"""Sum the streamflow of the catchments of a domain onto their nexuses, for all the time steps at once.
+
+The catchment GeoJSON file of an ngen domain (as ngen_files/data/lstm/spatial/catchment_data_cat67.geojson)
+gives the nexus each catchment flows to (its "toid" property), and the nexus
+GeoJSON file (as nexus_data_nex65.geojson) the nexuses.  NexusAggregator turns
+these into a sparse catchment -> nexus incidence matrix once, stored as in the
+CSR format: the catchment columns sorted by nexus, and where the catchments of
+each nexus start.  As every catchment flows to a single nexus, the product with
+a (T, n_catchments) block of streamflow is one np.add.reduceat() over the sorted
+columns, giving the (T, n_nexuses) block of nexus flows.
+
+A catchment may reach its nexus a number of time steps late (its lag).  Flows
+that arrive after the end of a block are held and added to the next block, so
+a long run can be aggregated block by block:
+
+    aggregator = nexus_aggregation.NexusAggregator.from_geojson(catchment_file, nexus_file, catchment_ids)
+    nexus_flows = aggregator.aggregate(streamflow)   # (T, n_catchments) -> (T, n_nexuses)
+"""
+
+import json
+
+import numpy as np
+
+
+#------------------------------------------------------------
+def read_features(geojson_file):
+    """The id and properties of each feature of a GeoJSON file."""
+    with open(geojson_file, 'r') as fp:
+        features = json.load(fp)['features']
+    return [(str(x.get('id', x['properties'].get('id'))), x['properties']) for x in features]
+
+
+#--------------------------------------------------------------------------------------------------
+class NexusAggregator():
+    def __init__(self, catchment_ids, catchment_nexus, nexus_ids=None, lags=None):
+        """
+        Build the catchment -> nexus incidence matrix.
+
+        Parameters
+        ----------
+        catchment_ids : list
+            Catchments, in the order of the columns of the flows to aggregate.
+        catchment_nexus : dict
+            The nexus each catchment flows to, by catchment id.
+        nexus_ids : list, optional
+            Nexuses, in the order of the columns of the nexus flows (by default, the
+            nexuses of the catchments, sorted).  Nexuses without catchments get zero flow.
+        lags : array_like, optional
+            Number of time steps (>= 0) each catchment takes to reach its nexus.
+        """
+        missing = [x for x in catchment_ids if x not in catchment_nexus]
+        if missing:
+            raise ValueError("No nexus for catchments {}".format(missing))
+        to_nexus = [catchment_nexus[x] for x in catchment_ids]
+        self.catchment_ids = list(catchment_ids)
+        self.nexus_ids = sorted(set(to_nexus)) if nexus_ids is None else list(nexus_ids)
+
+        nexus_index = {x: k for k, x in enumerate(self.nexus_ids)}
+        unknown = sorted(set(x for x in to_nexus if x not in nexus_index))
+        if unknown:
+            raise ValueError("Catchments flow to nexuses {} that are not in the nexus list".format(unknown))
+        rows = np.array([nexus_index[x] for x in to_nexus], dtype='int64')
+
+        self.lags = np.zeros(len(self.catchment_ids), dtype='int64') if lags is None else np.asarray(lags, dtype='int64')
+        if self.lags.shape != (len(self.catchment_ids),) or (self.lags < 0).any():
+            raise ValueError("lags must be one number of time steps (>= 0) per catchment")
+
+        # One incidence matrix per lag, in CSR form: the columns of each nexus together,
+        # and the nexuses that have any (reduceat() cannot give an empty sum)
+        self._matrices = []
+        for lag in np.unique(self.lags):
+            columns = np.flatnonzero(self.lags == lag)
+            order = columns[np.argsort(rows[columns], kind='stable')]
+            nexuses, starts = np.unique(rows[order], return_index=True)
+            self._matrices.append((int(lag), order, starts, nexuses))
+
+        self.max_lag = int(self.lags.max()) if len(self.lags) else 0
+        self.reset()
+
+    #------------------------------------------------------------
+    @classmethod
+    def from_geojson(cls, catchment_file, nexus_file=None, catchment_ids=None, lags=None):
+        """
+        Build the incidence matrix from the catchment (and nexus) GeoJSON files of a domain.
+
+        Parameters
+        ----------
+        catchment_file : str or Path
+            Catchment GeoJSON file, with a "toid" property (the nexus) for each catchment.
+        nexus_file : str or Path, optional
+            Nexus GeoJSON file; its nexuses, in order, are the columns of the nexus flows.
+        catchment_ids : list, optional
+            Catchments, in the order of the columns of the flows (by default, all those of the file).
+        lags : array_like, optional
+            Number of time steps each catchment takes to reach its nexus.
+        """
+        catchments = read_features(catchment_file)
+        catchment_nexus = {x: properties['toid'] for x, properties in catchments if 'toid' in properties}
+        if catchment_ids is None:
+            catchment_ids = [x for x, _ in catchments]
+        nexus_ids = None if nexus_file is None else [x for x, _ in read_features(nexus_file)]
+        return cls(catchment_ids, catchment_nexus, nexus_ids, lags)
+
+    #------------------------------------------------------------
+    def reset(self):
+        """Forget the flows held from earlier blocks (e.g. to aggregate another run)."""
+        self.pending = np.zeros((self.max_lag, len(self.nexus_ids)), dtype='float64')
+
+    #------------------------------------------------------------
+    def aggregate(self, flows):
+        """
+        Sum the flows of the catchments onto their nexuses.
+
+        Parameters
+        ----------
+        flows : np.ndarray
+            Array of shape (T, n_catchments), or (n_catchments,) for one time step.
+
+        Returns
+        -------
+        np.ndarray
+            Array of shape (T, n_nexuses) (or (n_nexuses,)), with the flows of earlier
+            blocks that arrive during this one.
+        """
+        flows = np.asarray(flows, dtype='float64')
+        single_step = flows.ndim == 1
+        flows = flows.reshape(-1, len(self.catchment_ids))
+        n_steps = flows.shape[0]
+
+        # Rows past n_steps hold the flows that arrive after this block
+        nexus_flows = np.zeros((n_steps + self.max_lag, len(self.nexus_ids)), dtype='float64')
+        nexus_flows[:self.max_lag] += self.pending
+        for lag, order, starts, nexuses in self._matrices:
+            nexus_flows[lag:lag + n_steps, nexuses] += np.add.reduceat(flows[:, order], starts, axis=1)
+
+        self.pending = nexus_flows[n_steps:].copy()
+        nexus_flows = nexus_flows[:n_steps]
+        return nexus_flows[0] if single_step else nexus_flows
+
+
+#------------------------------------------------------------
+def write_nexus_flows(out_file, nexus_ids, nexus_flows, times=None):
+    """Write the flows (m3 s-1) of the nexuses, of shape (T, n_nexuses), to a netCDF file."""
+    from netCDF4 import Dataset
+    with Dataset(out_file, 'w') as out:
+        out.createDimension('nexus', len(nexus_ids))
+        out.createDimension('time', nexus_flows.shape[0])
+        nexus = out.createVariable('nexus', str, ('nexus',))
+        nexus[:] = np.array(nexus_ids, dtype=object)
+        if times is not None:
+            time_var = out.createVariable('time', str, ('time',))
+            time_var[:] = np.array(times, dtype=object)
+        flow = out.createVariable('flow_cms', 'f8', ('nexus', 'time'))
+        flow.units = 'm3 s-1'
+        flow[:] = nexus_flows.T
@@ -0,0 +1,299 @@
+"""Run an ngen domain of LSTM catchments outside of ngen, from its realization configuration.
+
+An ngen realization configuration (as ngen_files/data/lstm/rc_files/realization_config_lstm_HUC01.json)
+gives the BMI configuration file of every catchment through the 'init_config'
+template of its bmi_python formulation ("{{id}}" is the catchment id), the
+forcings, and the time period.  load_domain() expands the template for each
+catchment of a catchment list, initializes the bmi_LSTM of each catchment from
+its file (static attributes, area and initial states, as ngen would), and groups
+the catchments by trained model (their 'train_cfg_file').  Each group is one
+Nextgen_BatchedLSTM (see lstm.batched_lstm), which advances all of its
+catchments with one forward call per block of time steps, with the forcings of
+the realization configuration over its time period.
+
+The forcings are either one netCDF file for all the catchments, or CSV files
+(one per catchment with a 'file_pattern', or one 'path' for all of them), as in
+lstm.ngen_forcings.  Settings of a catchment in the "catchments" section of the
+realization configuration take precedence over the "global" ones.
+
+All paths are relative to the directory ngen is run from, so run from there:
+
+Usage:
+    python -m lstm.ngen_domain ./data/lstm/rc_files/realization_config_lstm_HUC01.json \\
+        --catchments ./data/lstm/spatial/catchment_data_HUC01.geojson --output huc01.nc \\
+        --nexus-file ./data/lstm/spatial/nexus_data_HUC01.geojson --nexus-output huc01_nexus.nc
+
+With --nexus-output, the streamflow of the catchments is also summed onto the
+nexuses they flow to (see lstm.nexus_aggregation).
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import re
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import yaml
+
+import lstm.batched_lstm as batched_lstm
+import lstm.bmi_lstm as bmi_lstm
+import lstm.nexus_aggregation as nexus_aggregation
+import lstm.ngen_forcings as ngen_forcings
+
+
+#------------------------------------------------------------
+def read_realization_config(rc_file):
+    with open(rc_file, 'r') as fp:
+        return json.load(fp)
+
+
+#------------------------------------------------------------
+def expand(template, catchment_id):
+    """A path of the realization configuration for one catchment ("{{id}}" or "{{ID}}" is its id)."""
+    return template.replace('{{id}}', catchment_id).replace('{{ID}}', catchment_id)
+
+
+#------------------------------------------------------------
+def is_geojson(path):
+    """Whether a catchment (or nexus) file is a GeoJSON file, by its suffix."""
+    return Path(path).suffix in ('.geojson', '.json')
+
+
+#------------------------------------------------------------
+def read_catchment_ids(catchment_file):
+    """Catchment ids from an ngen catchment GeoJSON file, or from a file with one id per line."""
+    if is_geojson(catchment_file):
+        with open(catchment_file, 'r') as fp:
+            features = json.load(fp)['features']
+        return [str(x.get('id', x['properties'].get('id'))) for x in features]
+    with open(catchment_file, 'r') as fp:
+        return [line.strip() for line in fp if line.strip() and not line.startswith('#')]
+
+
+#------------------------------------------------------------
+def _catchment_settings(rc, catchment_id):
+    """The settings of one catchment in the "catchments" section of the realization configuration."""
+    return rc.get('catchments', {}).get(catchment_id, {})
+
+
+#------------------------------------------------------------
+def lstm_params(rc, catchment_id):
+    """The params of the bmi_python formulation of a catchment."""
+    formulations = rc['global']['formulations'] + _catchment_settings(rc, catchment_id).get('formulations', [])
+    params = {}
+    for formulation in formulations:
+        if formulation['name'] == 'bmi_python':
+            params.update(formulation['params'])
+    if 'init_config' not in params:
+        raise ValueError("No bmi_python formulation with an 'init_config' for catchment '{}'".format(catchment_id))
+    return params
+
+
+#------------------------------------------------------------
+def forcing_file(rc, catchment_id):
+    """
+    The forcing file of a catchment.
+
+    With a 'file_pattern', 'path' is a directory and the pattern (a regular
+    expression, with "{{id}}" for the catchment id) picks the file in it.
+    """
+    forcing = _catchment_settings(rc, catchment_id).get('forcing') or rc['global']['forcing']
+    if 'file_pattern' not in forcing:
+        return forcing['path']
+    pattern = re.compile(expand(forcing['file_pattern'], catchment_id))
+    names = sorted(x for x in os.listdir(forcing['path']) if pattern.fullmatch(x))
+    if not names:
+        raise ValueError("No forcing file for catchment '{}' in {}".format(catchment_id, forcing['path']))
+    return str(Path(forcing['path']) / names[0])
+
+
+#------------------------------------------------------------
+def time_steps(rc):
+    """The times of the output time steps of the realization configuration (the end time included)."""
+    settings = rc['time']
+    return pd.date_range(settings['start_time'], settings['end_time'],
+                         freq='{}s'.format(settings.get('output_interval', 3600)))
+
+
+#--------------------------------------------------------------------------------------------------
+class ModelGroup():
+    def __init__(self, train_cfg_file, catchment_ids, batch, forcings, times):
+        """
+        The catchments of a domain that share one trained model.
+
+        Parameters
+        ----------
+        train_cfg_file : str
+            Training configuration file of the model.
+        catchment_ids : list
+            Catchments of the group, in the order of the batch.
+        batch : Nextgen_BatchedLSTM
+            Batch with all the catchments of the group.
+        forcings : np.ndarray
+            Array of shape (n_steps, n_catchments, n_dynamic), for batch.update_sequence().
+        times : pd.DatetimeIndex
+            Times of the time steps.
+        """
+        self.train_cfg_file = train_cfg_file
+        self.catchment_ids = catchment_ids
+        self.batch = batch
+        self.forcings = forcings
+        self.times = times
+
+    #------------------------------------------------------------
+    def run(self, block_steps=24*30):
+        """
+        Run all the time steps, ``block_steps`` of them with each forward call.
+
+        Returns
+        -------
+        np.ndarray
+            Streamflow (m3 s-1) of shape (n_steps, n_catchments).
+        """
+        n_steps = self.forcings.shape[0]
+        streamflow = np.empty((n_steps, len(self.catchment_ids)), dtype='float64')
+        for start in range(0, n_steps, block_steps):
+            streamflow[start:start + block_steps] = self.batch.update_sequence(
+                self.forcings[start:start + block_steps])
+        return streamflow
+
+
+#------------------------------------------------------------
+def read_forcings(rc, catchment_ids, model, times):
+    """
+    Forcings of the catchments of a group over the time steps, for the inputs of its model.
+
+    Returns
+    -------
+    np.ndarray
+        Array of shape (n_steps, n_catchments, n_dynamic) in the model units.
+    """
+    dynamic_inputs = model.cfg_train['dynamic_inputs']
+    model_units = {name: model._var_units_map[model._var_name_map_short_first[name]] for name in dynamic_inputs}
+
+    # Catchments that read the same file are read together
+    files = {}
+    for k, catchment_id in enumerate(catchment_ids):
+        files.setdefault(forcing_file(rc, catchment_id), []).append(k)
+
+    forcings = np.empty((len(times), len(catchment_ids), len(dynamic_inputs)), dtype='float64')
+    for path, columns in files.items():
+        if Path(path).suffix == '.nc':
+            values, file_times = ngen_forcings.read_ngen_netcdf_forcings(
+                path, [catchment_ids[k] for k in columns], dynamic_inputs, model_units, return_times=True)
+        else:
+            values, file_times = ngen_forcings.read_ngen_forcings(path, dynamic_inputs, model_units,
+                                                                  return_times=True)
+            values = values[:, np.newaxis, :]
+        rows = file_times.get_indexer(times)
+        if (rows < 0).any():
+            raise ValueError("Forcing file {} has no forcings for {}".format(path, times[rows < 0][0]))
+        forcings[:, columns, :] = values[rows]
+    return forcings
+
+
+#------------------------------------------------------------
+def load_domain(rc_file, catchment_ids=None):
+    """
+    Make one batch of catchments per trained model, from a realization configuration.
+
+    Parameters
+    ----------
+    rc_file : str or Path
+        ngen realization configuration file.
+    catchment_ids : list, optional
+        Catchments to run (by default, those of the "catchments" section).
+
+    Returns
+    -------
+    list
+        A ModelGroup for each trained model.
+    """
+    rc = read_realization_config(rc_file)
+    if catchment_ids is None:
+        catchment_ids = list(rc.get('catchments', {}))
+    if not catchment_ids:
+        raise ValueError("No catchments to run for {}".format(rc_file))
+    times = time_steps(rc)
+
+    # Group by trained model, keeping the order of the catchments within each group
+    groups = {}
+    for catchment_id in catchment_ids:
+        bmi_cfg_file = expand(lstm_params(rc, catchment_id)['init_config'], catchment_id)
+        with open(bmi_cfg_file, 'r') as fp:
+            train_cfg_file = yaml.safe_load(fp)['train_cfg_file']
+        groups.setdefault(str(Path(train_cfg_file).resolve()), []).append((catchment_id, bmi_cfg_file))
+
+    model_groups = []
+    for train_cfg_file, members in groups.items():
+        # The trained model is read once (and cached) for all the catchments of the group
+        models = []
+        for catchment_id, bmi_cfg_file in members:
+            model = bmi_lstm.bmi_LSTM()
+            with contextlib.redirect_stdout(io.StringIO()):
+                model.initialize(bmi_cfg_file)
+            models.append(model)
+
+        batch = batched_lstm.Nextgen_BatchedLSTM.from_bmi(models[0])
+        batch.add_bmi_catchments(models)
+        group_ids = [catchment_id for catchment_id, _ in members]
+        forcings = read_forcings(rc, group_ids, models[0], times)
+        model_groups.append(ModelGroup(train_cfg_file, group_ids, batch, forcings, times))
+    return model_groups
+
+
+#------------------------------------------------------------
+def main(args=None):
+    import lstm.run_basins as run_basins
+
+    parser = argparse.ArgumentParser(description="Run the LSTM catchments of an ngen realization configuration.")
+    parser.add_argument('rc_file', help="ngen realization configuration file")
+    parser.add_argument('--catchments', help="catchment GeoJSON file, or file with one catchment id per line "
+                                             "(default: the catchments of the realization configuration)")
+    parser.add_argument('--block-steps', type=int, default=24*30, help="time steps in each forward call")
+    parser.add_argument('--output', default='lstm_domain.nc', help="netCDF file to write the streamflow to")
+    parser.add_argument('--nexus-output', help="netCDF file to write the nexus flows to (needs --catchments "
+                                               "to be the catchment GeoJSON file)")
+    parser.add_argument('--nexus-file', help="nexus GeoJSON file, for the nexuses of --nexus-output")
+    args = parser.parse_args(args)
+    # The nexus of each catchment is its "toid" in the catchment GeoJSON file
+    if args.nexus_output and not (args.catchments and is_geojson(args.catchments)):
+        parser.error("--nexus-output needs --catchments to be the catchment GeoJSON file")
+    if args.nexus_file and not args.nexus_output:
+        parser.error("--nexus-file is only used with --nexus-output")
+
+    start = time.perf_counter()
+    catchment_ids = read_catchment_ids(args.catchments) if args.catchments else None
+    groups = load_domain(args.rc_file, catchment_ids)
+    print('Loaded {} catchments in {} groups in {:.2f} s'.format(sum(len(x.catchment_ids) for x in groups),
+                                                               len(groups), time.perf_counter() - start))
+
+    all_ids, streamflow = [], []
+    for group in groups:
+        start = time.perf_counter()
+        streamflow.append(group.run(args.block_steps))
+        print('  {}: {} catchments for {} time steps in {:.2f} s'.format(
+            group.train_cfg_file, len(group.catchment_ids), len(group.times), time.perf_counter() - start))
+        all_ids += group.catchment_ids
+
+    streamflow = np.concatenate(streamflow, axis=1)
+    times = [str(x) for x in groups[0].times]
+    run_basins.write_results(args.output, all_ids, streamflow.T, times)
+    print('Wrote', args.output)
+
+    if args.nexus_output:
+        start = time.perf_counter()
+        aggregator = nexus_aggregation.NexusAggregator.from_geojson(args.catchments, args.nexus_file, all_ids)
+        nexus_flows = aggregator.aggregate(streamflow)
+        print('Summed onto {} nexuses in {:.2f} s'.format(len(aggregator.nexus_ids), time.perf_counter() - start))
+        nexus_aggregation.write_nexus_flows(args.nexus_output, aggregator.nexus_ids, nexus_flows, times)
+        print('Wrote', args.nexus_output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,227 @@
+"""Read the ngen per-catchment forcing CSV files, with a binary cache next to each one.
+
+The ngen forcing files (as ngen_files/data/forcing/HUC01-test/cat-67_...csv) have a
+"time" column and one column per AORC forcing, named as in AORC_COLUMNS and in
+AORC units.  read_ngen_forcings() maps those columns to the dynamic inputs of
+the trained model and converts them to its units (see lstm.unit_conversion),
+giving an array of shape (T, n_dynamic) for bmi_LSTM.update_block().
+
+The first read of a CSV file saves its columns as a ".npy" file next to it (or in
+a cache directory).  Later reads memory-map that file instead of parsing the
+text, as long as it is newer than the CSV file.  The cache holds the values as
+they are in the CSV file, so it does not depend on the trained model.
+
+The cache files of many CSV files can be made ahead of a run:
+
+    python -m lstm.ngen_forcings ./ngen_files/data/forcing/HUC01-test/*.csv
+"""
+
+import argparse
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import lstm.file_utils as file_utils
+import lstm.unit_conversion as unit_conversion
+
+# AORC column -> (short name of the LSTM input, units of the column)
+AORC_COLUMNS = {
+    'APCP_surface':        ('total_precipitation', 'kg m-2'),
+    'DLWRF_surface':       ('longwave_radiation', 'W m-2'),
+    'DSWRF_surface':       ('shortwave_radiation', 'W m-2'),
+    'PRES_surface':        ('pressure', 'Pa'),
+    'SPFH_2maboveground':  ('specific_humidity', 'kg kg-1'),
+    'TMP_2maboveground':   ('temperature', 'K'),
+    'UGRD_10maboveground': ('wind_u', 'm s-1'),
+    'VGRD_10maboveground': ('wind_v', 'm s-1'),
+}
+AORC_NAMES = list(AORC_COLUMNS)
+
+CACHE_SUFFIX = '.lstm_cache.npy'
+
+
+#------------------------------------------------------------
+def cache_file(csv_file, cache_dir=None):
+    """The cache file of a CSV file."""
+    csv_file = Path(csv_file)
+    directory = csv_file.parent if cache_dir is None else Path(cache_dir)
+    return directory / (csv_file.name + CACHE_SUFFIX)
+
+
+#------------------------------------------------------------
+def parse_csv(csv_file):
+    """
+    Parse a forcing CSV file.
+
+    Returns
+    -------
+    np.ndarray
+        Array of shape (T, 1 + len(AORC_NAMES)): the time (seconds since 1970) and
+        the AORC columns, in AORC units.
+    """
+    table = pd.read_csv(csv_file)
+    missing = [name for name in AORC_NAMES if name not in table.columns]
+    if missing:
+        raise ValueError("Forcing file {} has no columns {}".format(csv_file, missing))
+    values = np.empty((len(table), 1 + len(AORC_NAMES)), dtype='float64')
+    values[:, 0] = pd.to_datetime(table['time']).values.astype('datetime64[s]').astype('int64')
+    values[:, 1:] = table[AORC_NAMES].to_numpy(dtype='float64')
+    return values
+
+
+#------------------------------------------------------------
+def load_csv(csv_file, cache_dir=None, use_cache=True):
+    """
+    The values of a forcing CSV file (see parse_csv()), from its cache if that is up to date.
+
+    If the cache is missing or older than the CSV file, the CSV file is parsed and
+    the cache is written.  A cache that cannot be written is skipped.
+    """
+    if not use_cache:
+        return parse_csv(csv_file)
+
+    cached = cache_file(csv_file, cache_dir)
+    try:
+        if os.stat(cached).st_mtime_ns >= os.stat(csv_file).st_mtime_ns:
+            values = np.load(cached, mmap_mode='r')
+            if values.ndim == 2 and values.shape[1] == 1 + len(AORC_NAMES):
+                return values
+    except (FileNotFoundError, ValueError):
+        pass
+
+    values = parse_csv(csv_file)
+    try:
+        cached.parent.mkdir(parents=True, exist_ok=True)
+        with file_utils.atomic_write(cached) as fb:
+            np.save(fb, values)
+    except OSError:
+        pass
+    return values
+
+
+#------------------------------------------------------------
+def input_conversions(dynamic_inputs, model_units):
+    """
+    The AORC forcing of each dynamic input, and the conversion to the model units.
+
+    Returns
+    -------
+    (np.ndarray, np.ndarray, np.ndarray)
+        Index in AORC_NAMES, scale and offset, for each dynamic input.
+    """
+    column_of_input = {short_name: k for k, (short_name, _) in enumerate(AORC_COLUMNS.values())}
+    columns, scale, offset = [], [], []
+    for name in dynamic_inputs:
+        if name not in column_of_input:
+            raise ValueError("No AORC forcing for the LSTM input '{}'".format(name))
+        k = column_of_input[name]
+        columns.append(k)
+        s, o = unit_conversion.get_conversion(AORC_COLUMNS[AORC_NAMES[k]][1], model_units[name])
+        scale.append(s)
+        offset.append(o)
+    return np.array(columns), np.array(scale), np.array(offset)
+
+
+#------------------------------------------------------------
+def read_ngen_forcings(csv_file, dynamic_inputs, model_units, cache_dir=None, use_cache=True, return_times=False):
+    """
+    Read the forcings of one catchment from an ngen forcing CSV file.
+
+    Parameters
+    ----------
+    csv_file : str or Path
+        ngen forcing CSV file with the AORC columns.
+    dynamic_inputs : list
+        Short names of the dynamic inputs of the trained model, in order.
+    model_units : dict
+        Units the model takes each dynamic input in, by short name.
+    cache_dir : str or Path, optional
+        Directory of the cache files (by default, next to the CSV files).
+    use_cache : bool
+        Read and write the cache file.
+    return_times : bool
+        Also return the times of the rows.
+
+    Returns
+    -------
+    np.ndarray
+        Array of shape (T, n_dynamic) in the model units, for bmi_LSTM.update_block().
+    """
+    values = load_csv(csv_file, cache_dir, use_cache)
+
+    columns, scale, offset = input_conversions(dynamic_inputs, model_units)
+    forcings = values[:, 1 + columns] * scale + offset
+    if return_times:
+        return forcings, pd.to_datetime(np.asarray(values[:, 0], dtype='int64'), unit='s')
+    return forcings
+
+
+#------------------------------------------------------------
+def read_ngen_netcdf_forcings(nc_file, catchment_ids, dynamic_inputs, model_units, return_times=False):
+    """
+    Read the forcings of many catchments from an ngen forcing netCDF file.
+
+    The file (as ngen_files/data/forcing/HUC01-test/cats-27_52_67-...nc) has an "ids"
+    variable, a "Time" variable (ns since 1970) and one (catchment-id, time)
+    variable per AORC forcing, named as in AORC_COLUMNS.  A fill value in the
+    file is an error (see lstm.file_utils.fill_value_mask).
+
+    Returns
+    -------
+    np.ndarray
+        Array of shape (T, n_catchments, n_dynamic) in the model units, with the
+        catchments in the order of ``catchment_ids``.
+    """
+    from netCDF4 import Dataset
+    with Dataset(nc_file, 'r') as data:
+        # Raw values, without the cost of masked arrays (fill values are checked for below)
+        data.set_auto_mask(False)
+        ids = [str(x) for x in data['ids'][:]]
+        missing = [x for x in catchment_ids if x not in ids]
+        if missing:
+            raise ValueError("Forcing file {} has no catchments {}".format(nc_file, missing))
+        rows = [ids.index(x) for x in catchment_ids]
+
+        columns, scale, offset = input_conversions(dynamic_inputs, model_units)
+        forcings = np.empty((data['Time'].shape[1], len(rows), len(columns)), dtype='float64')
+        for k, column in enumerate(columns):
+            variable = data[AORC_NAMES[column]]
+            values = variable[rows, :]
+            missing = file_utils.fill_value_mask(values, variable)
+            if missing.any():
+                step, row = np.argwhere(missing.T)[0]
+                time = pd.to_datetime(int(data['Time'][rows[row], step]), unit='ns')
+                raise ValueError("Forcing file {} has a fill value for '{}' of catchment '{}' at {}".format(
+                    nc_file, AORC_NAMES[column], catchment_ids[row], time))
+            forcings[:, :, k] = values.T
+        forcings = forcings * scale + offset
+        if return_times:
+            return forcings, pd.to_datetime(np.asarray(data['Time'][rows[0], :], dtype='int64'), unit='ns')
+    return forcings
+
+
+#------------------------------------------------------------
+def read_ngen_forcings_for_model(model, csv_file, cache_dir=None, use_cache=True, return_times=False):
+    """Read an ngen forcing CSV file for the dynamic inputs, and in the input units, of an initialized bmi_LSTM."""
+    model_units = {short_name: model._var_units_map[model._var_name_map_short_first[short_name]]
+                   for short_name in model.cfg_train['dynamic_inputs']}
+    return read_ngen_forcings(csv_file, model.cfg_train['dynamic_inputs'], model_units,
+                              cache_dir, use_cache, return_times)
+
+
+#------------------------------------------------------------
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Make the cache files of ngen forcing CSV files.")
+    parser.add_argument('csv_files', nargs='+', help="ngen forcing CSV files")
+    parser.add_argument('--cache-dir', help="directory of the cache files (default: next to the CSV files)")
+    args = parser.parse_args(args)
+
+    for csv_file in args.csv_files:
+        load_csv(csv_file, args.cache_dir)
+    print('Cached', len(args.csv_files), 'forcing files')
+
+
+if __name__ == '__main__':
+    main()
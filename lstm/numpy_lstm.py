@@ -0,0 +1,150 @@
+# Basic utilities
+import numpy as np
+# Only used to read the trained weights and to validate against the PyTorch LSTM
+import torch
+
+#--------------------------------------------------------------------------------------------------
+# Pure NumPy version of the forward pass of Nextgen_CudaLSTM (one nn.LSTM layer and a linear head).
+# For one catchment and one time step the LSTM is only a few small matrix products, so this avoids
+# the cost of creating tensors and dispatching through PyTorch on every update.
+# Only meant for forward predictions, this is not for training. Do training in NeuralHydrology
+#--------------------------------------------------------------------------------------------------
+class Numpy_LSTM():
+    def __init__(self, lstm_model):
+        """
+        Take the weights of a trained LSTM as float32 NumPy arrays (sharing memory with
+        the weight tensors, when they are float32 already).
+
+        Parameters
+        ----------
+        lstm_model : Nextgen_CudaLSTM
+            LSTM with the trained weights already loaded.
+        """
+        self.input_size = lstm_model.input_size
+        self.hidden_layer_size = lstm_model.hidden_layer_size
+        self.output_size = lstm_model.output_size
+
+        state_dict = lstm_model.state_dict()
+        def as_array(name):
+            # Shares memory with the tensor when it is already float32 on the cpu
+            return np.asarray(state_dict[name].detach().cpu().numpy(), dtype='float32')
+
+        # Transposed views, so that a batch of row vectors can be multiplied from the left
+        # without copying the weights.  Gate order (as in PyTorch) is: input, forget, cell, output.
+        self.weight_ih_t = as_array('lstm.weight_ih_l0').T
+        self.weight_hh_t = as_array('lstm.weight_hh_l0').T
+        self.bias = as_array('lstm.bias_ih_l0') + as_array('lstm.bias_hh_l0')
+        self.head_weight_t = as_array('head.weight').T
+        self.head_bias = as_array('head.bias')
+
+        self._allocate_buffers(1)
+
+    #------------------------------------------------------------
+    def _allocate_buffers(self, batch_size):
+        self.batch_size = batch_size
+        self._gates = np.empty((batch_size, 4 * self.hidden_layer_size), dtype='float32')
+        self._gates_hh = np.empty((batch_size, 4 * self.hidden_layer_size), dtype='float32')
+        self._prediction = np.empty((batch_size, self.output_size), dtype='float32')
+
+    #------------------------------------------------------------
+    def forward(self, input_array, h_t, c_t):
+        """
+        Advance the LSTM by one time step.
+
+        Parameters
+        ----------
+        input_array : np.ndarray
+            Scaled inputs, float32 array of shape (batch, input_size).
+        h_t, c_t : np.ndarray
+            Hidden and cell states, float32 arrays of shape (batch, hidden).  Updated in place.
+
+        Returns
+        -------
+        np.ndarray
+            Prediction of shape (batch, output_size).  This is an internal buffer that is
+            overwritten by the next call.
+        """
+        if input_array.shape[0] != self.batch_size:
+            self._allocate_buffers(input_array.shape[0])
+
+        hidden = self.hidden_layer_size
+        gates = self._gates
+        np.matmul(input_array, self.weight_ih_t, out=gates)
+        np.matmul(h_t, self.weight_hh_t, out=self._gates_hh)
+        gates += self._gates_hh
+        gates += self.bias
+
+        # sigmoid(x) = 1 / (1 + exp(-x)), done in place on the input and forget gates together
+        sig = gates[:, :2 * hidden]
+        np.negative(sig, out=sig)
+        np.exp(sig, out=sig)
+        sig += 1.0
+        np.reciprocal(sig, out=sig)
+        # ... and on the output gate
+        out_gate = gates[:, 3 * hidden:]
+        np.negative(out_gate, out=out_gate)
+        np.exp(out_gate, out=out_gate)
+        out_gate += 1.0
+        np.reciprocal(out_gate, out=out_gate)
+        # Cell gate
+        cell_gate = gates[:, 2 * hidden:3 * hidden]
+        np.tanh(cell_gate, out=cell_gate)
+
+        # c_t = f * c_t + i * g
+        input_gate = gates[:, :hidden]
+        c_t *= gates[:, hidden:2 * hidden]
+        input_gate *= cell_gate
+        c_t += input_gate
+        # h_t = o * tanh(c_t)
+        np.tanh(c_t, out=h_t)
+        h_t *= out_gate
+
+        np.matmul(h_t, self.head_weight_t, out=self._prediction)
+        self._prediction += self.head_bias
+        return self._prediction
+
+    #------------------------------------------------------------
+    def validate(self, lstm_model, n_steps=24, atol=1e-5, seed=0):
+        """
+        Check that this LSTM gives the same outputs as the PyTorch LSTM it was built from.
+
+        Both are run for ``n_steps`` time steps on the same random (scaled) inputs, starting
+        from zero states.
+
+        Parameters
+        ----------
+        lstm_model : Nextgen_CudaLSTM
+            The PyTorch LSTM to compare against.
+        n_steps : int
+            Number of time steps to compare.
+        atol : float
+            Largest allowed absolute difference in the outputs and states.
+        seed : int
+            Seed for the random inputs.
+
+        Returns
+        -------
+        float
+            The largest absolute difference found.
+        """
+        rng = np.random.default_rng(seed)
+        inputs = rng.standard_normal((n_steps, 1, self.input_size)).astype('float32')
+
+        h_np = np.zeros((1, self.hidden_layer_size), dtype='float32')
+        c_np = np.zeros((1, self.hidden_layer_size), dtype='float32')
+        h_torch = torch.zeros(1, 1, self.hidden_layer_size)
+        c_torch = torch.zeros(1, 1, self.hidden_layer_size)
+
+        max_diff = 0.0
+        with torch.no_grad():
+            for k in range(n_steps):
+                prediction = self.forward(inputs[k], h_np, c_np)
+                output, h_torch, c_torch = lstm_model.forward(torch.from_numpy(inputs[k]), h_torch, c_torch)
+                max_diff = max(max_diff,
+                               float(np.abs(prediction - output[0].numpy()).max()),
+                               float(np.abs(h_np - h_torch[0].numpy()).max()),
+                               float(np.abs(c_np - c_torch[0].numpy()).max()))
+
+        if max_diff > atol:
+            raise ValueError("NumPy LSTM differs from the PyTorch LSTM by {} (> {})".format(max_diff, atol))
+        return max_diff
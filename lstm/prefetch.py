@@ -0,0 +1,120 @@
+"""Read the next chunk of forcings on a background thread while the model runs the current one.
+
+A Prefetcher calls a read function for each chunk of time steps in turn, on its
+own thread, into one of a few preallocated buffers.  The chunks are handed to
+the consumer in order.  When all the buffers are full the thread waits, so at
+most ``n_buffers`` chunks are ever in memory.  PyTorch and the netCDF library
+release the GIL for most of their work, so the reads and the model runs overlap.
+
+    with prefetch.Prefetcher(reader.read, bounds, (chunk_steps, n_dynamic)) as chunks:
+        for forcings in chunks:
+            model.update_block(forcings)
+
+The chunk handed out is a view of a buffer that is reused once the consumer asks
+for the next chunk; copy it to keep it.
+"""
+
+import queue
+import threading
+import time
+
+import numpy as np
+
+# Put on the queue of read chunks after the last one
+_DONE = object()
+
+
+#--------------------------------------------------------------------------------------------------
+class Prefetcher():
+    def __init__(self, read, bounds, buffer_shape, n_buffers=2, dtype='float64'):
+        """
+        Start reading chunks on a background thread.
+
+        Parameters
+        ----------
+        read : callable
+            ``read(start, end, out)`` reads time steps [start, end) into the buffer
+            ``out`` and returns the part of it that holds them.
+        bounds : iterable
+            (start, end) of each chunk, in order.
+        buffer_shape : tuple
+            Shape of each buffer (the largest chunk).
+        n_buffers : int
+            Number of buffers, so the number of chunks read ahead of the consumer.
+        dtype : str
+            Data type of the buffers.
+        """
+        if n_buffers < 1:
+            raise ValueError("n_buffers must be at least 1")
+        self._read = read
+        self._bounds = list(bounds)
+        self._free = queue.Queue()
+        for _ in range(n_buffers):
+            self._free.put(np.empty(buffer_shape, dtype=dtype))
+        # Never holds more than n_buffers chunks, as each one takes a free buffer
+        self._ready = queue.Queue()
+        self._stop = threading.Event()
+
+        # Seconds the consumer spent waiting for a chunk to be read
+        self.wait_time = 0.0
+
+        self._thread = threading.Thread(target=self._run, name='lstm-prefetch', daemon=True)
+        self._thread.start()
+
+    #------------------------------------------------------------
+    def _run(self):
+        try:
+            for start, end in self._bounds:
+                buffer = self._get_free_buffer()
+                if buffer is None:
+                    return
+                self._ready.put((buffer, self._read(start, end, buffer), None))
+        except BaseException as error:
+            # Raised again in the consumer
+            self._ready.put((None, None, error))
+            return
+        self._ready.put(_DONE)
+
+    #------------------------------------------------------------
+    def _get_free_buffer(self):
+        # Wait for the consumer to hand a buffer back, unless closed
+        while not self._stop.is_set():
+            try:
+                return self._free.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        return None
+
+    #------------------------------------------------------------
+    def __iter__(self):
+        in_use = None
+        try:
+            while True:
+                if in_use is not None:
+                    self._free.put(in_use)
+                    in_use = None
+                start = time.perf_counter()
+                item = self._ready.get()
+                self.wait_time += time.perf_counter() - start
+                if item is _DONE:
+                    return
+                in_use, chunk, error = item
+                if error is not None:
+                    raise error
+                yield chunk
+        finally:
+            self.close()
+
+    #------------------------------------------------------------
+    def close(self):
+        """Stop reading and wait for the background thread to finish."""
+        self._stop.set()
+        self._thread.join()
+
+    #------------------------------------------------------------
+    def __enter__(self):
+        return self
+
+    #------------------------------------------------------------
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,203 @@
+"""Run the LSTM for many basins, outside of ngen.
+
+Reads the forcings of each basin in a basin list from a netCDF file (with a
+"basin" variable and one (basin, time) variable per dynamic input of the trained
+model, as data/usgs-streamflow-nldas_hourly.nc), and the static attributes of
+each basin from the CAMELS attribute files.  The basins are split over a pool of
+worker processes; each worker runs its basins in batches, with all the basins of
+a batch advanced together (see lstm.batched_lstm) over blocks of time steps.
+The streamflow of all the basins is written to one netCDF file.  A fill value
+in the forcing file is an error (see lstm.file_utils.fill_value_mask).
+
+The BMI configuration file gives the trained model and the options; its static
+attributes and area are replaced by those of each basin.
+
+Usage:
+    python -m lstm.run_basins ./data/camels_basin_list_516.txt ./data/usgs-streamflow-nldas_hourly.nc \\
+        ./bmi_config_files/01022500_hourly_all_attributes_forcings.yml --workers 16 --output results.nc
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import torch
+from netCDF4 import Dataset
+
+import lstm.attribute_store as attribute_store
+import lstm.batched_lstm as batched_lstm
+import lstm.bmi_lstm as bmi_lstm
+import lstm.file_utils as file_utils
+import lstm.prefetch as prefetch
+
+
+#------------------------------------------------------------
+def read_basin_list(basin_list_file):
+    """Basin ids (as 8-character, zero-padded strings) from a file with one id per line."""
+    with open(basin_list_file, 'r') as fp:
+        return [attribute_store.basin_key(line) for line in fp if line.strip()]
+
+
+#------------------------------------------------------------
+def _init_worker(n_threads):
+    torch.set_num_threads(n_threads)
+
+
+#------------------------------------------------------------
+def run_basin_batch(bmi_cfg_file, forcing_file, basin_ids, attributes, block_steps, max_steps=None):
+    """
+    Run a batch of basins together, in one worker process.
+
+    Parameters
+    ----------
+    bmi_cfg_file : str or Path
+        BMI configuration file for the trained model and options.
+    forcing_file : str or Path
+        netCDF file of forcings.
+    basin_ids : list
+        Basins to run.
+    attributes : dict
+        For each basin, a dict of its static attributes (by short name) and 'area_sqkm'.
+    block_steps : int
+        Number of time steps run with each forward call.
+    max_steps : int, optional
+        Only run the first ``max_steps`` time steps.
+
+    Returns
+    -------
+    np.ndarray
+        Streamflow (m3 s-1) of shape (n_basins, n_steps).
+    """
+    # The template model reads (and caches, in this worker) the trained model
+    model = bmi_lstm.bmi_LSTM()
+    with contextlib.redirect_stdout(io.StringIO()):
+        model.initialize(bmi_cfg_file)
+    batch = batched_lstm.Nextgen_BatchedLSTM.from_bmi(model)
+    for basin_id in basin_ids:
+        batch.add_catchment(attributes[basin_id], attributes[basin_id]['area_sqkm'])
+
+    with Dataset(forcing_file, 'r') as data:
+        # Raw values, without the cost of masked arrays (fill values are checked for in read())
+        data.set_auto_mask(False)
+        all_basins = [str(x) for x in data['basin'][:]]
+        rows = [all_basins.index(x) for x in basin_ids]
+        variables = [data[name] for name in batch.dynamic_inputs]
+        n_steps = variables[0].shape[1]
+        if max_steps is not None:
+            n_steps = min(n_steps, max_steps)
+
+        def read(start, end, out):
+            # Forcings of time steps [start, end), of shape (end - start, n_basins, n_dynamic)
+            out = out[:end - start]
+            for k, variable in enumerate(variables):
+                values = variable[rows, start:end]
+                missing = file_utils.fill_value_mask(values, variable)
+                if missing.any():
+                    step, row = np.argwhere(missing.T)[0]
+                    raise ValueError("Forcing file {} has a fill value for '{}' of basin {} at time step {}".format(
+                        forcing_file, batch.dynamic_inputs[k], basin_ids[row], start + step))
+                out[:, :, k] = values.T
+            return out
+
+        # The next block is read while the current one runs
+        bounds = [(start, min(start + block_steps, n_steps)) for start in range(0, n_steps, block_steps)]
+        streamflow = np.empty((n_steps, len(basin_ids)), dtype='float64')
+        with prefetch.Prefetcher(read, bounds, (block_steps, len(basin_ids), len(variables))) as blocks:
+            for (start, end), forcings in zip(bounds, blocks):
+                streamflow[start:end] = batch.update_sequence(forcings)
+    return streamflow.T
+
+
+#------------------------------------------------------------
+def read_times(forcing_file, n_steps):
+    """Times of the forcings as strings, or None if the file has no "date" or "time" variable."""
+    from netCDF4 import num2date
+    with Dataset(forcing_file, 'r') as data:
+        for name in ('date', 'time'):
+            if name in data.variables and hasattr(data[name], 'units'):
+                times = num2date(data[name][:n_steps], data[name].units)
+                return [str(x) for x in times]
+    return None
+
+
+#------------------------------------------------------------
+def write_results(out_file, basin_ids, streamflow, times=None):
+    """Write the streamflow of all the basins to a netCDF file."""
+    with Dataset(out_file, 'w') as out:
+        out.createDimension('basin', len(basin_ids))
+        out.createDimension('time', streamflow.shape[1])
+        basin = out.createVariable('basin', str, ('basin',))
+        basin[:] = np.array(basin_ids, dtype=object)
+        if times is not None:
+            time_var = out.createVariable('time', str, ('time',))
+            time_var[:] = np.array(times, dtype=object)
+        flow = out.createVariable('streamflow_cms', 'f8', ('basin', 'time'))
+        flow.units = 'm3 s-1'
+        flow[:] = streamflow
+
+
+#------------------------------------------------------------
+def run_basins(bmi_cfg_file, forcing_file, basin_ids, camels_dir=attribute_store.CAMELS_DIR, workers=None,
+               threads_per_worker=1, basins_per_batch=32, block_steps=24*30, max_steps=None):
+    """
+    Run many basins in a pool of worker processes.
+
+    Returns
+    -------
+    np.ndarray
+        Streamflow (m3 s-1) of shape (n_basins, n_steps), in the order of ``basin_ids``.
+    """
+    # The template model tells which static attributes the trained model takes
+    model = bmi_lstm.bmi_LSTM()
+    with contextlib.redirect_stdout(io.StringIO()):
+        model.initialize(bmi_cfg_file)
+    static_attributes = model.cfg_train['static_attributes']
+
+    camels = attribute_store.read_camels_attributes(camels_dir)
+    missing = [x for x in basin_ids if x not in camels.index]
+    if missing:
+        raise ValueError("No CAMELS attributes for basins {}".format(missing))
+    attributes = {x: dict(camels.loc[x, static_attributes].astype('float64'),
+                          area_sqkm=float(camels.loc[x, attribute_store.AREA_ATTRIBUTE])) for x in basin_ids}
+
+    batches = [basin_ids[k:k + basins_per_batch] for k in range(0, len(basin_ids), basins_per_batch)]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(threads_per_worker,)) as pool:
+        futures = [pool.submit(run_basin_batch, bmi_cfg_file, forcing_file, batch,
+                               {x: attributes[x] for x in batch}, block_steps, max_steps)
+                   for batch in batches]
+        return np.concatenate([f.result() for f in futures], axis=0)
+
+
+#------------------------------------------------------------
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Run the LSTM for many basins, in parallel processes.")
+    parser.add_argument('basin_list', help="file with one basin id per line")
+    parser.add_argument('forcing_file', help="netCDF file of forcings, with a 'basin' variable")
+    parser.add_argument('bmi_cfg_file', help="BMI configuration file for the trained model and options")
+    parser.add_argument('--camels-dir', default=attribute_store.CAMELS_DIR,
+                        help="directory of the CAMELS attribute files")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument('--threads-per-worker', type=int, default=1, help="PyTorch threads in each worker")
+    parser.add_argument('--basins-per-batch', type=int, default=32, help="basins advanced together in a worker")
+    parser.add_argument('--block-steps', type=int, default=24*30, help="time steps in each forward call")
+    parser.add_argument('--max-steps', type=int, help="only run this many time steps")
+    parser.add_argument('--output', default='lstm_results.nc', help="netCDF file to write the streamflow to")
+    args = parser.parse_args(args)
+
+    basin_ids = read_basin_list(args.basin_list)
+    start = time.perf_counter()
+    streamflow = run_basins(args.bmi_cfg_file, args.forcing_file, basin_ids, args.camels_dir, args.workers,
+                            args.threads_per_worker, args.basins_per_batch, args.block_steps, args.max_steps)
+    print('Ran {} basins for {} time steps in {:.1f} s'.format(len(basin_ids), streamflow.shape[1],
+                                                                time.perf_counter() - start))
+
+    write_results(args.output, basin_ids, streamflow, read_times(args.forcing_file, streamflow.shape[1]))
+    print('Wrote', args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,216 @@
+"""Benchmark the BMI LSTM.
+
+Times, for each of the trained models in ./trained_neuralhydrology_models:
+    initialize       the first initialize() in the process, and the mean of later ones
+    update           one update()
+    update_until     update_until() over 1,000 and 10,000 time steps
+    set_get_value    a set_value() / get_value() round trip of every input
+    instances        initialize() and one update() of each of 1 to 5,000 instances
+
+The results are written to a JSON file, so that they can be compared between
+versions.  Run from the top directory of the repository (the BMI configuration
+files use paths relative to it):
+
+    python -m lstm.run_benchmarks --output benchmarks.json
+    python -m lstm.run_benchmarks --output new.json --compare benchmarks.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import platform
+import resource
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import torch
+import yaml
+
+import lstm.bmi_lstm as bmi_lstm
+import lstm.model_cache as model_cache
+
+# BMI configuration file for each of the trained models
+MODEL_CONFIGS = {
+    'hourly_slope_mean_precip_temp':      './bmi_config_files/01022500_hourly_slope_mean_precip_temp.yml',
+    'hourly_all_forcings_lat_lon_elev':   './bmi_config_files/01022500_hourly_forcings_lat_lon_elev.yml',
+    'hourly_all_attributes_and_forcings': './bmi_config_files/01022500_hourly_all_attributes_forcings.yml',
+}
+
+DEFAULT_INSTANCES = [1, 10, 100, 1000, 5000]
+DEFAULT_UNTIL_STEPS = [1000, 10000]
+
+
+#------------------------------------------------------------
+def write_config(bmi_cfg_file, out_dir, options):
+    """Copy a BMI configuration file, with some options changed, and return the copy."""
+    with open(bmi_cfg_file, 'r') as fp:
+        cfg = yaml.safe_load(fp)
+    cfg.update(options)
+    out_file = Path(out_dir) / Path(bmi_cfg_file).name
+    with open(out_file, 'w') as fp:
+        yaml.safe_dump(cfg, fp)
+    return out_file
+
+
+#------------------------------------------------------------
+def new_model(cfg_file):
+    """Create and initialize a bmi_LSTM, without its printing."""
+    model = bmi_lstm.bmi_LSTM()
+    with contextlib.redirect_stdout(io.StringIO()):
+        model.initialize(cfg_file)
+    return model
+
+
+#------------------------------------------------------------
+def set_forcings(model):
+    """Set every forcing to its training set mean, so the LSTM sees typical inputs."""
+    for k, forcing_name in enumerate(model.cfg_train['dynamic_inputs']):
+        long_name = model._var_name_map_short_first[forcing_name]
+        model.set_value(long_name, np.array([model.input_mean[k]]))
+
+
+#------------------------------------------------------------
+def result(model_name, benchmark, seconds, n_calls, **extra):
+    return dict(model=model_name, benchmark=benchmark, seconds=seconds, n_calls=n_calls,
+                per_call_us=1e6 * seconds / max(n_calls, 1), **extra)
+
+
+#------------------------------------------------------------
+def benchmark_model(model_name, cfg_file, n_update, until_steps, instances):
+    """Run all the benchmarks for one trained model and return a list of results."""
+    clock = time.perf_counter
+    results = []
+
+    # First initialize() reads everything from disk; later ones use the model cache
+    model_cache.trained_model_cache.clear()
+    start = clock()
+    model = new_model(cfg_file)
+    results.append(result(model_name, 'initialize_first', clock() - start, 1))
+
+    n_init = 20
+    start = clock()
+    for _ in range(n_init):
+        new_model(cfg_file)
+    results.append(result(model_name, 'initialize', clock() - start, n_init))
+
+    set_forcings(model)
+    for _ in range(10):
+        model.update()
+    start = clock()
+    for _ in range(n_update):
+        model.update()
+    results.append(result(model_name, 'update', clock() - start, n_update))
+
+    for n_steps in until_steps:
+        start = clock()
+        model.update_until(model.get_current_time() + n_steps * model.get_time_step())
+        results.append(result(model_name, 'update_until', clock() - start, n_steps, n_steps=n_steps))
+
+    input_names = [model._var_name_map_short_first[x] for x in model.all_lstm_inputs]
+    values = np.zeros(1, dtype='float64')
+    n_round_trips = 1000
+    start = clock()
+    for _ in range(n_round_trips):
+        for long_name in input_names:
+            model.get_value(long_name, values)
+            model.set_value(long_name, values)
+    results.append(result(model_name, 'set_get_value', clock() - start, n_round_trips * len(input_names)))
+
+    models = []
+    for n_instances in instances:
+        # Only the instances added since the previous (smaller) number are initialized
+        n_new = n_instances - len(models)
+        start = clock()
+        for _ in range(n_new):
+            models.append(new_model(cfg_file))
+        init_seconds = clock() - start
+        for m in models:
+            set_forcings(m)
+        start = clock()
+        for m in models:
+            m.update()
+        update_seconds = clock() - start
+        max_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        results.append(result(model_name, 'instances_initialize', init_seconds, n_new,
+                              n_instances=n_instances, max_rss_mb=max_rss_mb))
+        results.append(result(model_name, 'instances_update', update_seconds, n_instances,
+                              n_instances=n_instances, max_rss_mb=max_rss_mb))
+    return results
+
+
+#------------------------------------------------------------
+def metadata(options):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'commit': commit or None,
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'torch': torch.__version__,
+            'machine': platform.machine(),
+            'processor': platform.processor(),
+            'torch_threads': torch.get_num_threads(),
+            'options': options}
+
+
+#------------------------------------------------------------
+def compare(results, baseline_file):
+    """Print the ratio of each time to the same benchmark in an earlier results file."""
+    with open(baseline_file, 'r') as fp:
+        baseline = json.load(fp)
+    def key(r):
+        return (r['model'], r['benchmark'], r.get('n_steps'), r.get('n_instances'))
+    old = {key(r): r for r in baseline['results']}
+    print('\n{:36s} {:22s} {:>8s} {:>12s} {:>12s} {:>7s}'.format('model', 'benchmark', 'n', 'old (us)', 'new (us)', 'ratio'))
+    for r in results:
+        if key(r) in old:
+            n = r.get('n_instances', r.get('n_steps', ''))
+            before = old[key(r)]['per_call_us']
+            print('{:36s} {:22s} {:>8} {:12.2f} {:12.2f} {:7.2f}'.format(
+                r['model'], r['benchmark'], n, before, r['per_call_us'], r['per_call_us'] / before))
+
+
+#------------------------------------------------------------
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Benchmark the BMI LSTM for each trained model.")
+    parser.add_argument('--output', default='benchmarks.json', help="JSON file to write the results to")
+    parser.add_argument('--models', nargs='+', default=list(MODEL_CONFIGS), choices=list(MODEL_CONFIGS),
+                        help="trained models to benchmark")
+    parser.add_argument('--instances', type=int, nargs='+', default=DEFAULT_INSTANCES,
+                        help="numbers of model instances to run together")
+    parser.add_argument('--until-steps', type=int, nargs='+', default=DEFAULT_UNTIL_STEPS,
+                        help="numbers of time steps for update_until()")
+    parser.add_argument('--update-steps', type=int, default=1000, help="number of single update() calls to time")
+    parser.add_argument('--backend', default='torch', choices=['torch', 'numpy'], help="LSTM backend")
+    parser.add_argument('--fold-static-attributes', action='store_true', help="fold the static attributes into the bias")
+    parser.add_argument('--compare', help="earlier results file to compare with")
+    args = parser.parse_args(args)
+
+    options = {'backend': args.backend, 'fold_static_attributes': args.fold_static_attributes, 'verbose': 0}
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for model_name in args.models:
+            print('Benchmarking', model_name)
+            cfg_file = write_config(MODEL_CONFIGS[model_name], tmp_dir, options)
+            results.extend(benchmark_model(model_name, cfg_file, args.update_steps,
+                                           args.until_steps, sorted(args.instances)))
+
+    with open(args.output, 'w') as fp:
+        json.dump({'metadata': metadata(options), 'results': results}, fp, indent=2)
+    print('Wrote', args.output)
+
+    for r in results:
+        n = r.get('n_instances', r.get('n_steps', ''))
+        print('{:36s} {:22s} {:>8} {:12.2f} us'.format(r['model'], r['benchmark'], n, r['per_call_us']))
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
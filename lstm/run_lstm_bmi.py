@@ -4,9 +4,10 @@ import torch
 from torch import nn
 #import data_tools
 from pathlib import Path
-from netCDF4 import Dataset
 # This is the BMI LSTM that we will be running
 import bmi_lstm
+# Reads the forcings from the netCDF file a chunk at a time
+import forcing_reader
 
 
 # Define primary bmi config and input data file paths 
@@ -26,38 +27,24 @@ model.initialize(bmi_cfg_file)
 
 # Get input data that matches the LSTM test runs
 print('Gathering input data')
-sample_data = Dataset(sample_data_file, 'r')
+sample_data = forcing_reader.NetCDFForcingReader.from_bmi(model, sample_data_file, basin=3)
 
-# Now loop through the inputs, set the forcing values, and update the model
+# Now loop through the inputs (read a chunk at a time), set the forcing values, and update the model
 print('Set values & update model for number of timesteps = 100')
-for precip, temp in zip(list(sample_data['total_precipitation'][3].data),
-                        list(sample_data['temperature'][3].data)):
-
-    #model.set_value('atmosphere_water__time_integral_of_precipitation_mass_flux',np.atleast_1d(precip))
-    model.set_value('atmosphere_water__liquid_equivalent_precipitation_rate',np.atleast_1d(precip))
-    model.set_value('land_surface_air__temperature',np.atleast_1d(temp))
-
-    #dest_array = np.zeros(1)
-    #model.get_value('land_surface_air__temperature', dest_array)
-    #temps = dest_array[0]
-    #model.get_value('atmosphere_water__time_integral_of_precipitation_mass_flux', dest_array)
-    #model.get_value('atmosphere_water__liquid_equivalent_precipitation_rate', dest_array)
-    #precips = dest_array[0]
-
-    #print(' Temperature and precipitation are set to {:.2f} and {:.2f}'.format(temperature, precip))
-    print(' Temperature and precipitation are set to {:.2f} and {:.2f}'.format(temp, precip))
-    #model.update_until(model.t+model._time_step_size)
-    model.update()
-
-    dest_array = np.zeros(1)
-    model.get_value('land_surface_water__runoff_volume_flux', dest_array)
-    runoff = dest_array[0]
-
-    print(' Streamflow (cms) at time {} ({}) is {:.2f}'.format(model.get_current_time(), model.get_time_units(), runoff))
-
-    if model.t > 100:
-        #print('Stopping the loop')
-        break
+long_names = [model._var_name_map_short_first[name] for name in model.cfg_train['dynamic_inputs']]
+dest_array = np.zeros(1)
+for forcings in sample_data.chunks(stop=101):
+    for row in forcings:
+        for long_name, value in zip(long_names, row):
+            model.set_value(long_name, np.atleast_1d(value))
+        print(' Temperature and precipitation are set to {:.2f} and {:.2f}'.format(model.temperature, model.total_precipitation))
+        model.update()
+
+        model.get_value('land_surface_water__runoff_volume_flux', dest_array)
+        runoff = dest_array[0]
+
+        print(' Streamflow (cms) at time {} ({}) is {:.2f}'.format(model.get_current_time(), model.get_time_units(), runoff))
+sample_data.close()
 
 # Finalizing the BMI
 print('Finalizing the BMI')
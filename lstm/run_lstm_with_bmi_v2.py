@@ -3,18 +3,22 @@ import numpy as np
 import torch
 # import data_tools
 from pathlib import Path
-from netCDF4 import Dataset
 
 # This is the BMI LSTM that we will be running
 import lstm.bmi_lstm as bmi_lstm
+# Reads the forcings from the netCDF file a chunk at a time
+import lstm.forcing_reader as forcing_reader
 
 USE_PATH = True  # (SDP; also set in bmi_lstm.py.)
 # run_dir = './extern/lstm_py/'  # (SDP)
 run_dir = './'
 cfg_file  = run_dir + 'bmi_config_files/01022500_hourly_slope_mean_precip_temp.yml'
 data_file = run_dir + 'data/usgs-streamflow-nldas_hourly.nc'
+N_STEPS   = 101  # number of time steps to run
     
-def execute():
+def execute(block=False):
+    """Run the LSTM through the BMI, with set_value(), update() and get_value() at each
+    time step as in ngen, or with block=True one update_block() call per chunk of forcings."""
     # creating an instance of an LSTM model
     print('Creating an instance of an BMI_LSTM model object...')
     model = bmi_lstm.bmi_LSTM()
@@ -30,33 +34,33 @@ def execute():
     print('Get input data that matches the LSTM test runs...')
 
     if (USE_PATH):
-        sample_data = Dataset(Path( data_file ), 'r')
+        sample_data = forcing_reader.NetCDFForcingReader.from_bmi(model, Path( data_file ), basin=3)
     else:
-        sample_data = Dataset( data_file, 'r' )  # SDP
+        sample_data = forcing_reader.NetCDFForcingReader.from_bmi(model, data_file, basin=3)  # SDP
 
-        
-    # Now loop through the inputs, set the forcing values, and update the model
-    print('Loop through the inputs, set the forcing values, and update the model...')
-    precip_data = sample_data['total_precipitation'][3].data
-    n_forcings = precip_data.size
-    temp_data = sample_data['temperature'][3].data
-
-    for k in range(n_forcings):
-    #for precip, temp in list(),
-        
-        precip = precip_data[k]
-        temp = temp_data[k]                    
-        model.set_value('atmosphere_water__liquid_equivalent_precipitation_rate',precip)
-        model.set_value('land_surface_air__temperature',temp)
-        print('  temperature and precipitation are set to {:.2f} and {:.2f}'.format(temp, precip))
-        #print('  temperature and precipitation are set to {:.2f} and {:.2f}'.format(model.temperature, model.precip))
-        model.update()
-        print('  streamflow (CMS) at time {} is {:.2f}'.format(model.t, model.streamflow_cms))
-        #### print('  streamflow (CFS) at time {} is {:.2f}'.format(model.t, model.streamflow_cfs))
-
-        if model.t > 100:
-            print('Stopping the loop...')
-            break
+    if block:
+        # Read the inputs a chunk at a time (the next chunk while the model runs the current one),
+        # and run each chunk through the model
+        print('Read the inputs a chunk at a time, and run each chunk through the model...')
+        for forcings in sample_data.chunks(stop=N_STEPS, prefetch=2):
+            streamflow = model.update_block(forcings)
+            t0 = model.t - len(streamflow) * model.get_time_step()
+            for k in range(len(streamflow)):
+                print('  streamflow (CMS) at time {} is {:.2f}'.format(t0 + (k+1) * model.get_time_step(), streamflow[k]))
+    else:
+        # Now loop through the inputs, set the forcing values, and update the model
+        print('Loop through the inputs, set the forcing values, and update the model...')
+        long_names = [model._var_name_map_short_first[name] for name in model.cfg_train['dynamic_inputs']]
+        dest_array = np.zeros(1)
+        for forcings in sample_data.chunks(stop=N_STEPS):
+            for row in forcings:
+                for long_name, value in zip(long_names, row):
+                    model.set_value(long_name, np.atleast_1d(value))
+                print('  temperature and precipitation are set to {:.2f} and {:.2f}'.format(model.temperature, model.total_precipitation))
+                model.update()
+                model.get_value('land_surface_water__runoff_volume_flux', dest_array)
+                print('  streamflow (CMS) at time {} is {:.2f}'.format(model.t, dest_array[0]))
+    sample_data.close()
 
     # Finalizing the BMI
     print('Finalizing the BMI...')
@@ -0,0 +1,190 @@
+"""Spin-up (warm-up) of the LSTM states, with a cache on disk.
+
+Starting from zero states, the LSTM needs months of simulated hours before its
+outputs are usable.  With 'spinup_forcing_file' in the BMI configuration,
+initialize() runs the warm-up period through the LSTM as one sequence (see
+bmi_LSTM.update_block) and starts the run from the resulting h_t and c_t.
+
+With 'spinup_cache_dir' as well, those states are saved in that directory (as
+lstm.model_state snapshots), under a key made of the basin id, a hash of the
+trained model (its weights and own scalers), a hash of the run (the forcing file
+and its modification time, the input scalers of the instance, which include its
+input unit conversions, the scaled static inputs and where the initial states
+come from), the initial state option and the warm-up window.  Later runs with
+the same key read the states instead of repeating the warm-up.  A model without
+a 'basin_id' cannot use the cache.
+
+The forcing file is a CSV file with a "time" column and one column for each
+dynamic input of the trained model, named by its short name (e.g. "temperature")
+or its CSDMS standard name, in the units the LSTM takes.
+"""
+
+import hashlib
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import lstm.file_utils as file_utils
+
+
+#------------------------------------------------------------
+def model_hash(lstm_model, input_mean, input_std, out_mean, out_std):
+    """
+    Hash of everything in a trained model that changes its states: the weights and the scalers.
+
+    Returns
+    -------
+    str
+        Hex SHA-256 digest.
+    """
+    digest = hashlib.sha256()
+    for name, tensor in sorted(lstm_model.state_dict().items()):
+        digest.update(name.encode('utf-8'))
+        digest.update(np.ascontiguousarray(tensor.detach().cpu().numpy(), dtype='float32').tobytes())
+    for values in (input_mean, input_std, out_mean, out_std):
+        digest.update(np.ascontiguousarray(values, dtype='float64').tobytes())
+    return digest.hexdigest()
+
+
+#------------------------------------------------------------
+def run_hash(forcing_file, input_mean, input_std, scaled_static_inputs, initial_state_source):
+    """
+    Hash of everything besides the trained model that changes the warm-up of one basin.
+
+    Parameters
+    ----------
+    forcing_file : str or Path
+        The warm-up forcing file; its path and modification time are hashed.
+    input_mean, input_std : np.ndarray
+        Input scalers of the model instance (which include its input unit conversions).
+    scaled_static_inputs : np.ndarray
+        Scaled static inputs of the basin.
+    initial_state_source : tuple
+        What the states are warmed up from (see bmi_LSTM.get_initial_state_source()).
+
+    Returns
+    -------
+    str
+        Hex SHA-256 digest.
+    """
+    forcing_file = Path(forcing_file).resolve()
+    digest = hashlib.sha256()
+    digest.update(str(forcing_file).encode('utf-8'))
+    digest.update(str(os.stat(forcing_file).st_mtime_ns).encode('utf-8'))
+    for values in (input_mean, input_std, scaled_static_inputs):
+        digest.update(np.ascontiguousarray(values, dtype='float64').tobytes())
+    digest.update(repr(initial_state_source).encode('utf-8'))
+    return digest.hexdigest()
+
+
+#------------------------------------------------------------
+def window_times(start_date=None, end_date=None):
+    """The first and last time of a warm-up window of whole days (either end may be open)."""
+    start = None if start_date is None else pd.Timestamp(start_date)
+    end = None if end_date is None else pd.Timestamp(end_date) + pd.Timedelta(days=1) - pd.Timedelta(seconds=1)
+    return start, end
+
+
+#------------------------------------------------------------
+def cache_key(basin_id, model_digest, run_digest, initial_state, start_date=None, end_date=None):
+    """Name of the cache file for one basin, trained model, run (see run_hash()), initial state and warm-up window."""
+    if basin_id is None:
+        raise ValueError("Spun-up states can only be cached for a model with a 'basin_id'")
+    def date_str(date):
+        return 'open' if date is None else pd.Timestamp(date).strftime('%Y%m%d')
+    return '{}_{}_{}_{}_{}-{}'.format(basin_id, model_digest[:16], run_digest[:16], initial_state,
+                                      date_str(start_date), date_str(end_date))
+
+
+#------------------------------------------------------------
+def read_spinup_forcings(forcing_file, dynamic_inputs, long_names, start_date=None, end_date=None, return_times=False):
+    """
+    Read the forcings of a window of days from a CSV file (used for the warm-up and by lstm.hindcast).
+
+    Parameters
+    ----------
+    forcing_file : str or Path
+        CSV file with a "time" column and a column for each dynamic input.
+    dynamic_inputs : list
+        Short names of the dynamic inputs of the trained model, in order.
+    long_names : dict
+        CSDMS standard name for each short name; a column may be named by either.
+    start_date, end_date : optional
+        First and last day of the window (whole days, inclusive).  The whole file
+        is used if they are not given.
+    return_times : bool
+        Also return the times of the rows (None if the file has no "time" column).
+
+    Returns
+    -------
+    np.ndarray
+        Array of shape (T, n_dynamic), for bmi_LSTM.update_block().
+    """
+    table = pd.read_csv(forcing_file)
+    times = None
+    if 'time' in table.columns:
+        times = pd.to_datetime(table['time'])
+        start, end = window_times(start_date, end_date)
+        keep = np.ones(len(table), dtype=bool)
+        if start is not None:
+            keep &= (times >= start).values
+        if end is not None:
+            keep &= (times <= end).values
+        table = table[keep]
+        times = times[keep]
+
+    columns = []
+    for name in dynamic_inputs:
+        if name in table.columns:
+            columns.append(name)
+        elif long_names.get(name) in table.columns:
+            columns.append(long_names[name])
+        else:
+            raise ValueError("Forcing file {} has no column for '{}'".format(forcing_file, name))
+    forcings = table[columns].to_numpy(dtype='float64')
+    if forcings.shape[0] == 0:
+        raise ValueError("Forcing file {} has no time steps in the window".format(forcing_file))
+    # A missing forcing would make the states, so all the later streamflow, NaN
+    missing = np.isnan(forcings)
+    if missing.any():
+        row, k = np.argwhere(missing)[0]
+        where = 'row {}'.format(row) if times is None else times.iloc[row]
+        raise ValueError("Forcing file {} has no '{}' at {}".format(forcing_file, columns[k], where))
+    if return_times:
+        return forcings, (None if times is None else pd.DatetimeIndex(times))
+    return forcings
+
+
+#--------------------------------------------------------------------------------------------------
+class SpinupCache():
+    def __init__(self, cache_dir):
+        """
+        Directory of spun-up states, one snapshot file per cache key.
+
+        Parameters
+        ----------
+        cache_dir : str or Path
+            Created if it does not exist.
+        """
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    #------------------------------------------------------------
+    def path(self, key):
+        return self.cache_dir / (key + '.lstmstate')
+
+    #------------------------------------------------------------
+    def get(self, key):
+        """The snapshot saved under ``key``, or None."""
+        try:
+            with open(self.path(key), 'rb') as fb:
+                return fb.read()
+        except FileNotFoundError:
+            return None
+
+    #------------------------------------------------------------
+    def put(self, key, blob):
+        with file_utils.atomic_write(self.path(key)) as fb:
+            fb.write(blob)
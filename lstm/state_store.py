@@ -0,0 +1,138 @@
+"""Initial LSTM states for many catchments in one memory-mapped file.
+
+The store is a float32 array of shape (n_catchments, 2, hidden), saved as a ".npy"
+file, where [k, 0] is the hidden state h_t and [k, 1] the cell state c_t of the
+k-th catchment.  The catchment ids are in a small ".ids.npy" file next to it.
+
+With 'initial_state: file' in the BMI configuration, initialize() looks up its
+catchment ('initial_state_id', or else 'basin_id') in the store given by
+'initial_state_file'.  The store is memory-mapped and opened once per process,
+so each instance only copies its own row.
+
+A store can be made from ngen-style CSV files of initial states (columns "h_t"
+and "c_t", one row per hidden unit, as ngen_files/data/lstm/initial_states.csv):
+
+    python -m lstm.state_store initial_states.npy cat-67=./ngen_files/data/lstm/initial_states.csv
+"""
+
+import argparse
+import os
+from pathlib import Path
+
+import numpy as np
+
+
+#------------------------------------------------------------
+def ids_file(store_file):
+    """The file with the catchment ids of a store."""
+    return Path(store_file).with_suffix('.ids.npy')
+
+
+#------------------------------------------------------------
+def write_state_store(store_file, ids, h_t, c_t):
+    """
+    Write a store of initial states.
+
+    Parameters
+    ----------
+    store_file : str or Path
+        The ".npy" file to write.
+    ids : list
+        Catchment ids, one per row of ``h_t`` and ``c_t``.
+    h_t, c_t : array_like
+        Hidden and cell states, arrays of shape (n_catchments, hidden).
+    """
+    h_t = np.asarray(h_t, dtype='float32')
+    c_t = np.asarray(c_t, dtype='float32')
+    if h_t.shape != c_t.shape or h_t.ndim != 2 or h_t.shape[0] != len(ids):
+        raise ValueError("h_t and c_t must both have shape (n_catchments, hidden)")
+    np.save(store_file, np.stack([h_t, c_t], axis=1))
+    np.save(ids_file(store_file), np.array([str(x) for x in ids], dtype=str))
+
+
+#------------------------------------------------------------
+def read_states_csv(csv_file):
+    """Read the "h_t" and "c_t" columns of an ngen-style CSV file of initial states."""
+    table = np.genfromtxt(csv_file, delimiter=',', names=True, dtype='float32')
+    return table['h_t'], table['c_t']
+
+
+#--------------------------------------------------------------------------------------------------
+class StateStore():
+    def __init__(self, store_file):
+        """
+        Open a store of initial states (memory-mapped, read-only).
+
+        Parameters
+        ----------
+        store_file : str or Path
+            The ".npy" file written by write_state_store().
+        """
+        self.store_file = Path(store_file)
+        self.states = np.load(self.store_file, mmap_mode='r')
+        if self.states.ndim != 3 or self.states.shape[1] != 2:
+            raise ValueError("{} is not a store of LSTM states (shape {})".format(store_file, self.states.shape))
+        ids = np.load(ids_file(self.store_file), allow_pickle=False)
+        self.index = {str(x): k for k, x in enumerate(ids)}
+        self.hidden_layer_size = self.states.shape[2]
+        self.mtime_ns = os.stat(self.store_file).st_mtime_ns
+
+    #------------------------------------------------------------
+    def get(self, catchment_id):
+        """
+        Initial states of one catchment.
+
+        Returns
+        -------
+        (np.ndarray, np.ndarray)
+            h_t and c_t, read-only views of the memory map.
+        """
+        k = self.index.get(str(catchment_id))
+        if k is None:
+            raise KeyError("No initial states for catchment '{}' in {}".format(catchment_id, self.store_file))
+        return self.states[k, 0], self.states[k, 1]
+
+    #------------------------------------------------------------
+    def __contains__(self, catchment_id):
+        return str(catchment_id) in self.index
+
+    #------------------------------------------------------------
+    def __len__(self):
+        return self.states.shape[0]
+
+
+# Stores opened in this process, by file
+_open_stores = {}
+
+
+#------------------------------------------------------------
+def open_state_store(store_file):
+    """Open a store, or reuse the one already open in this process (unless the file changed)."""
+    key = str(Path(store_file).resolve())
+    store = _open_stores.get(key)
+    if store is None or store.mtime_ns != os.stat(key).st_mtime_ns:
+        store = _open_stores[key] = StateStore(key)
+    return store
+
+
+#------------------------------------------------------------
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Make a store of initial LSTM states from CSV files.")
+    parser.add_argument('store_file', help="store (.npy) file to write")
+    parser.add_argument('csv_files', nargs='+', metavar='ID=CSV_FILE',
+                        help="catchment id and CSV file (columns h_t and c_t) of its initial states")
+    args = parser.parse_args(args)
+
+    ids, h_t, c_t = [], [], []
+    for item in args.csv_files:
+        catchment_id, csv_file = item.split('=', 1)
+        h, c = read_states_csv(csv_file)
+        ids.append(catchment_id)
+        h_t.append(h)
+        c_t.append(c)
+    write_state_store(args.store_file, ids, h_t, c_t)
+    print('Wrote', args.store_file, 'with initial states for', len(ids), 'catchments')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+# Basic utilities
+import json
+import time
+
+import numpy as np
+
+#--------------------------------------------------------------------------------------------------
+# Timings of the phases of a model run (reading the configuration, loading weights, scaling the
+# inputs, running the LSTM, ...), kept in memory as a count, a total, a minimum and maximum, and the
+# most recent durations (for percentiles) of each phase.
+#
+# Used by bmi_LSTM when the BMI configuration has 'timing: True'.  Nothing is timed otherwise.
+#--------------------------------------------------------------------------------------------------
+class PhaseTimer():
+    def __init__(self, max_samples=10000):
+        """
+        Create a timer with no phases recorded.
+
+        Parameters
+        ----------
+        max_samples : int
+            Number of the most recent durations kept for each phase, for the percentiles.
+            The buffer of each phase doubles as needed, up to this size.
+        """
+        self.max_samples = max_samples
+        self.clock = time.perf_counter
+        self.reset()
+
+    #------------------------------------------------------------
+    def reset(self):
+        self._count = {}
+        self._total = {}
+        self._min = {}
+        self._max = {}
+        self._samples = {}
+
+    #------------------------------------------------------------
+    def record(self, phase, seconds):
+        """Add one duration (in seconds) to a phase."""
+        count = self._count.get(phase)
+        if count is None:
+            count = 0
+            self._total[phase] = 0.0
+            self._min[phase] = seconds
+            self._max[phase] = seconds
+            self._samples[phase] = np.empty(min(16, self.max_samples), dtype='float64')
+        samples = self._samples[phase]
+        if count == samples.shape[0] < self.max_samples:
+            # Grown as needed, so phases that are rarely called (and many instances) stay small
+            samples = self._samples[phase] = np.concatenate(
+                [samples, np.empty(min(count, self.max_samples - count), dtype='float64')])
+        samples[count % self.max_samples] = seconds
+        self._count[phase] = count + 1
+        self._total[phase] += seconds
+        if seconds < self._min[phase]:
+            self._min[phase] = seconds
+        if seconds > self._max[phase]:
+            self._max[phase] = seconds
+
+    #------------------------------------------------------------
+    def wrap(self, phase, function):
+        """Return a function that calls ``function`` and records its duration under ``phase``."""
+        clock = self.clock
+        record = self.record
+        def timed(*args, **kwargs):
+            start = clock()
+            result = function(*args, **kwargs)
+            record(phase, clock() - start)
+            return result
+        timed.__name__ = getattr(function, '__name__', phase)
+        timed.__doc__ = getattr(function, '__doc__', None)
+        return timed
+
+    #------------------------------------------------------------
+    def stats(self):
+        """
+        Summary of the recorded phases.
+
+        Returns
+        -------
+        dict
+            For each phase: the number of calls, the total, mean, minimum and maximum
+            duration, and the 50th, 90th and 99th percentiles of the most recent
+            ``max_samples`` durations.  Durations are in seconds.
+        """
+        stats = {}
+        for phase, count in self._count.items():
+            samples = self._samples[phase][:min(count, self.max_samples)]
+            p50, p90, p99 = np.percentile(samples, [50, 90, 99])
+            stats[phase] = {'count': count,
+                            'total_s': self._total[phase],
+                            'mean_s': self._total[phase] / count,
+                            'min_s': self._min[phase],
+                            'max_s': self._max[phase],
+                            'p50_s': float(p50),
+                            'p90_s': float(p90),
+                            'p99_s': float(p99)}
+        return stats
+
+    #------------------------------------------------------------
+    def dump(self, json_file, **metadata):
+        """Write stats() to a JSON file, along with any ``metadata`` given as keywords."""
+        with open(json_file, 'w') as fp:
+            json.dump(dict(metadata, phases=self.stats()), fp, indent=2, default=str)
@@ -0,0 +1,89 @@
+# Basic utilities
+import numpy as np
+
+#--------------------------------------------------------------------------------------------------
+# Linear unit conversions for the LSTM inputs.
+#
+# The LSTM was trained with its inputs in the units given in bmi_LSTM._var_name_units_map, while
+# forcings (e.g. the ngen AORC CSV files) often come in other units, such as temperature in K.
+# Each conversion here is  value_in_model_units = scale * value + offset.  Since the LSTM inputs
+# are centered and scaled anyway, a conversion can be folded into the input mean and standard
+# deviation once, at initialization, so that it costs nothing per time step.
+#--------------------------------------------------------------------------------------------------
+
+# (model units, other units) -> (scale, offset)
+UNIT_CONVERSIONS = {
+    # Temperature
+    ('degC', 'K'):              (1.0, -273.15),
+    ('degC', 'degF'):           (5.0/9.0, -32.0*5.0/9.0),
+    # Precipitation.  An hourly accumulation of 1 kg m-2 of water is 1 mm h-1
+    ('mm h-1', 'kg m-2'):       (1.0, 0.0),
+    ('mm h-1', 'kg m-2 s-1'):   (3600.0, 0.0),
+    ('mm h-1', 'mm s-1'):       (3600.0, 0.0),
+    ('mm h-1', 'm s-1'):        (3600.0*1000.0, 0.0),
+    ('mm h-1', 'm h-1'):        (1000.0, 0.0),
+    # Pressure
+    ('Pa', 'hPa'):              (100.0, 0.0),
+    ('Pa', 'kPa'):              (1000.0, 0.0),
+    # Humidity
+    ('kg kg-1', 'g kg-1'):      (0.001, 0.0),
+    # Length
+    ('m', 'km'):                (1000.0, 0.0),
+    ('m', 'ft'):                (0.3048, 0.0),
+    ('km2', 'm2'):              (1.0e-6, 0.0),
+}
+
+
+#------------------------------------------------------------
+def get_conversion(from_units, to_units):
+    """
+    Scale and offset that convert values from one unit to another.
+
+    Parameters
+    ----------
+    from_units : str
+        Units the values are given in.
+    to_units : str
+        Units the values are needed in (the units the LSTM was trained with).
+
+    Returns
+    -------
+    (float, float)
+        ``scale`` and ``offset``, with  converted = scale * value + offset.
+    """
+    if from_units == to_units:
+        return 1.0, 0.0
+    if (to_units, from_units) in UNIT_CONVERSIONS:
+        return UNIT_CONVERSIONS[(to_units, from_units)]
+    if (from_units, to_units) in UNIT_CONVERSIONS:
+        # The inverse of a listed conversion
+        scale, offset = UNIT_CONVERSIONS[(from_units, to_units)]
+        return 1.0/scale, -offset/scale
+    raise ValueError("No unit conversion from '{}' to '{}'".format(from_units, to_units))
+
+
+#------------------------------------------------------------
+def fold_into_scaler(input_mean, input_std, scale, offset):
+    """
+    Fold linear unit conversions into the input scalers.
+
+    With  x_model = scale * x + offset,  the scaled input is
+        (x_model - mean) / std  =  (x - (mean - offset) / scale) / (std / scale)
+    so converting and then scaling is the same as scaling with the returned
+    mean and standard deviation.
+
+    Parameters
+    ----------
+    input_mean, input_std : np.ndarray
+        Training set scalers for the inputs.  These are not modified.
+    scale, offset : np.ndarray
+        Conversion for each input (1 and 0 for inputs that are not converted).
+
+    Returns
+    -------
+    (np.ndarray, np.ndarray)
+        New input mean and standard deviation.
+    """
+    scale = np.asarray(scale, dtype='float64')
+    offset = np.asarray(offset, dtype='float64')
+    return (input_mean - offset) / scale, input_std / scale
@@ -1,18 +1,16 @@
-import pandas as pd
-import numpy as np
+"""Write the BMI configuration files of many CAMELS basins (see lstm.make_camels_config_files).
 
-# Loop through camels basins
-  # extract the camels attributes
-  # Write a configuration file
+Usage (from this directory):
+    python make_camels_config_files.py \\
+        --train-cfg-file ./trained_neuralhydrology_models/hourly_all_attributes_and_forcings/config.yml \\
+        --output-dir ./HUC01 --name-template '{basin_id}.yml'
 
-with open("../data/camels_basin_list_516.txt", "r") as f:
-    basin_list = pd.read_csv(f, header=None)
+The 'train_cfg_file' paths, the basin list and the CAMELS attribute files are
+relative to --root-dir (by default the top directory of the repository).
+"""
 
-basin_attributes = {}
+import lstm.make_camels_config_files as make_camels_config_files
 
-for attribute_type in ['clim', 'geol', 'hydro', 'name', 'soil', 'topo', 'vege']:
-    with open("../data/camels_attributes_v2.0/camels_{}.txt".format(attribute_type), "r") as f:
-        basin_attributes[attribute_type] = pd.read_csv(f, sep=";")
-    basin_attributes[attribute_type] = basin_attributes[attribute_type].set_index("gauge_id")
-    print(basin_attributes[attribute_type].loc[1022500, :])
 
+if __name__ == "__main__":
+    make_camels_config_files.main(root_dir="../../../..", output_dir="./camels")
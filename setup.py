@@ -13,7 +13,11 @@ setup(
     # Can use the "package_data" keyword to list them.
     # package_data={},
     packages=find_packages(include=['lstm', 'lstm.*']),
-    # xarray==0.16.0 does not pin numpy, therefore transitively we pin numpy~=1.0
+    # numpy stays at 1.x for the optional "scaler_pickle" extra below: xarray==0.16.0
+    # does not pin numpy and fails with numpy 2, so the pin has to be made here.
     # see https://github.com/NOAA-OWP/lstm/issues/46 for more detail.
-    install_requires=["numpy~=1.0", "pandas", "bmipy", "torch", "pyyml", "netCDF4", "xarray==0.16.0"]
+    install_requires=["numpy~=1.0", "pandas", "bmipy", "torch", "pyyml", "netCDF4"],
+    # xarray is only needed to read training data scaler pickles (".p") that have
+    # not been converted with `python -m lstm.convert_scaler`.
+    extras_require={"scaler_pickle": ["xarray==0.16.0"]}
 )